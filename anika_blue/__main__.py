@@ -1,11 +1,400 @@
-from .app import BIND_HOST, BIND_PORT, DEBUG, app, init_db
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from importlib import import_module
+from pathlib import Path
 
+from .app import BIND_HOST, BIND_PORT, DEBUG, app, get_db, init_db, rebuild_derived_data
+from .assets import DIST_DIRNAME, build_assets
+from .backup import create_backup, verify_backup
+from .palettes import SPACES, get_palette, load_palette, save_palette_index
+from .rebuild import REBUILD_CHUNK_SIZE, load_checkpoint
+from .replica import sync_replica
+from .soak import check_slopes, run_soak
+from .transfer import (
+    EXPORT_FORMATS,
+    EXPORT_TABLES,
+    export_table,
+    import_records,
+    read_records,
+)
 
-def main():
-    """Entry point for python -m anika_blue or the console script."""
+# The package re-exports the Flask object as "app", shadowing the module
+app_module = import_module(".app", __package__)
+
+
+def serve(args):
     init_db()
+    # Build the naming index up front rather than in the first request
+    get_palette(app_module.COLOR_PALETTE, app_module.COLOR_PALETTE_SPACE)
     app.run(debug=DEBUG, host=BIND_HOST, port=BIND_PORT)
 
 
+def build_static_assets(args):
+    static_dir = Path(args.static_dir or app.static_folder)
+    for name, hashed in build_assets(static_dir).items():
+        print(f"{name} -> {static_dir / DIST_DIRNAME / hashed}")
+
+
+def build_palette_index(args):
+    palette = load_palette(args.input, args.space)
+    save_palette_index(palette, args.output)
+    print(f"{len(palette)} {palette.space} colors -> {args.output}")
+
+
+def guess_format(path, fmt):
+    if fmt:
+        return fmt
+    suffix = Path(path).suffix.lstrip(".")
+    return suffix if suffix in EXPORT_FORMATS else "csv"
+
+
+def export_data(args):
+    init_db()
+    to_file = args.output and args.output != "-"
+    conn = get_db()
+    try:
+        with (
+            open(args.output, "w", newline="", encoding="utf-8")
+            if to_file
+            else nullcontext(sys.stdout)
+        ) as output:
+            output.writelines(
+                export_table(
+                    conn, args.table, guess_format(args.output or "", args.format)
+                )
+            )
+    finally:
+        conn.close()
+
+
+def import_data(args):
+    init_db()
+    fmt = guess_format(args.input, args.format)
+    conn = get_db()
+    try:
+        if args.input == "-":
+            records = read_records(sys.stdin, fmt)
+            count = import_records(conn, args.table, records, args.replace)
+        else:
+            with open(args.input, newline="", encoding="utf-8") as fileobj:
+                records = read_records(fileobj, fmt)
+                count = import_records(conn, args.table, records, args.replace)
+    finally:
+        conn.close()
+    print(f"Imported {count} {args.table} rows", file=sys.stderr)
+
+    if not args.no_rebuild:
+        rebuild_derived_data()
+        print("Rebuilt derived data", file=sys.stderr)
+
+
+def rebuild_data(args):
+    init_db()
+    conn = get_db()
+    checkpoint = load_checkpoint(conn.cursor())
+    conn.close()
+    if checkpoint and not args.restart:
+        print(
+            f"Resuming after {checkpoint['users']} users "
+            f"({checkpoint['votes']} votes)",
+            file=sys.stderr,
+        )
+
+    started = time.perf_counter()
+
+    def progress(checkpoint, total):
+        elapsed = time.perf_counter() - started
+        share = checkpoint["votes"] / total if total else 1
+        print(
+            f"{checkpoint['votes']}/{total} votes ({share:.0%}), "
+            f"{checkpoint['users']} users, {elapsed:.0f}s",
+            file=sys.stderr,
+        )
+
+    checkpoint = rebuild_derived_data(
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        resume=not args.restart,
+        progress=progress,
+    )
+    print(
+        f"Rebuilt the base colors of {checkpoint['users']} users and the other "
+        f"derived data in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
+
+
+def backup_database(args):
+    if args.verify:
+        result = verify_backup(args.verify)
+        print(f"{args.verify}: {result}")
+        sys.exit(0 if result == "ok" else 1)
+
+    backup_dir = args.dir or app_module.BACKUP_DIR
+    if not backup_dir:
+        sys.exit("No backup directory given, use --dir or set BACKUP_DIR")
+
+    def progress(status, remaining, total):
+        if args.verbose:
+            print(f"Copied {total - remaining}/{total} pages", file=sys.stderr)
+
+    while True:
+        path = create_backup(
+            app_module.DATABASE,
+            backup_dir,
+            pages=args.pages,
+            sleep=args.sleep,
+            keep=args.keep,
+            progress=progress,
+        )
+        if path is None:
+            print("A backup is being taken by another process", file=sys.stderr)
+        else:
+            print(f"Backup written to {path}")
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+def replicate_database(args):
+    replica = args.replica or app_module.REPLICA_DATABASE
+    if not replica:
+        sys.exit("No replica given, pass its path or set REPLICA_DATABASE")
+
+    while True:
+        synced_at = sync_replica(app_module.DATABASE, replica)
+        if synced_at is None:
+            print("Replica is being synced by another process", file=sys.stderr)
+        elif args.verbose:
+            print(f"Replica {replica} synced", file=sys.stderr)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+def soak_test(args):
+    if args.database:
+        app_module.DATABASE = args.database
+    else:
+        app_module.DATABASE = str(Path(tempfile.mkdtemp()) / "soak.db")
+    init_db()
+    app.config["RATE_LIMIT_ENABLED"] = False
+
+    def progress(sample):
+        if args.verbose:
+            print(
+                f"{sample['requests']} requests, "
+                f"rss {sample['rss_bytes']}, p99 {sample['p99_ms']:.2f}ms",
+                file=sys.stderr,
+            )
+
+    result = run_soak(
+        app,
+        app_module.DATABASE,
+        app_module.generate_blue_shade,
+        requests=args.requests,
+        sample_every=args.sample_every,
+        warmup=args.warmup,
+        clients=args.clients,
+        trace=not args.no_tracemalloc,
+        top_allocators=args.top,
+        seed=args.seed,
+        progress=progress,
+    )
+    result["database"] = app_module.DATABASE
+    result["failures"] = check_slopes(
+        result,
+        {
+            "rss_bytes": args.max_rss_slope,
+            "traced_bytes": args.max_traced_slope,
+            "sqlite_fds": args.max_fd_slope,
+            "p99_ms": args.max_p99_slope,
+        },
+    )
+
+    output = json.dumps(result, indent=2)
+    if args.output and args.output != "-":
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+    for failure in result["failures"]:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if result["failures"]:
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="anika-blue")
+    parser.set_defaults(func=serve)
+    subparsers = parser.add_subparsers(title="commands")
+
+    serve_parser = subparsers.add_parser("serve", help="run the web app (default)")
+    serve_parser.set_defaults(func=serve)
+
+    assets_parser = subparsers.add_parser(
+        "build-assets", help="write hashed, precompressed static assets"
+    )
+    assets_parser.add_argument("static_dir", nargs="?", help="static folder")
+    assets_parser.set_defaults(func=build_static_assets)
+
+    palette_parser = subparsers.add_parser(
+        "build-palette", help="precompute the search index of a color palette"
+    )
+    palette_parser.add_argument("input", help="palette file (JSON, CSV or TSV)")
+    palette_parser.add_argument("-o", "--output", required=True, help="index file")
+    palette_parser.add_argument(
+        "--space",
+        choices=SPACES,
+        default=app_module.COLOR_PALETTE_SPACE,
+        help="color space distances are measured in",
+    )
+    palette_parser.set_defaults(func=build_palette_index)
+
+    export_parser = subparsers.add_parser("export", help="stream a table to a file")
+    export_parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    export_parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    export_parser.add_argument("-f", "--format", choices=sorted(EXPORT_FORMATS))
+    export_parser.set_defaults(func=export_data)
+
+    import_parser = subparsers.add_parser("import", help="bulk import a table export")
+    import_parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    import_parser.add_argument("input", help="CSV or NDJSON file, - for stdin")
+    import_parser.add_argument("-f", "--format", choices=sorted(EXPORT_FORMATS))
+    import_parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="keep the exported ids and overwrite existing rows with the same key",
+    )
+    import_parser.add_argument(
+        "--no-rebuild",
+        action="store_true",
+        help="skip rebuilding derived data (e.g. when importing several tables)",
+    )
+    import_parser.set_defaults(func=import_data)
+
+    rebuild_parser = subparsers.add_parser(
+        "rebuild", help="recompute base colors, aggregates and sketches from votes"
+    )
+    rebuild_parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes averaging the votes",
+    )
+    rebuild_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=REBUILD_CHUNK_SIZE,
+        help="votes per chunk and transaction",
+    )
+    rebuild_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the checkpoint of an interrupted rebuild",
+    )
+    rebuild_parser.set_defaults(func=rebuild_data)
+
+    backup_parser = subparsers.add_parser(
+        "backup", help="take an online, verified backup of the database"
+    )
+    backup_parser.add_argument("-d", "--dir", help="backup directory (BACKUP_DIR)")
+    backup_parser.add_argument(
+        "--pages",
+        type=int,
+        default=app_module.BACKUP_PAGES,
+        help="pages copied per step",
+    )
+    backup_parser.add_argument(
+        "--sleep",
+        type=float,
+        default=app_module.BACKUP_SLEEP,
+        help="seconds to pause between steps",
+    )
+    backup_parser.add_argument(
+        "--keep",
+        type=int,
+        default=app_module.BACKUP_KEEP,
+        help="number of backups to keep, 0 keeps all",
+    )
+    backup_parser.add_argument(
+        "--every", type=float, help="keep running, one backup every N seconds"
+    )
+    backup_parser.add_argument(
+        "--verify", metavar="PATH", help="only check the integrity of a backup"
+    )
+    backup_parser.add_argument("-v", "--verbose", action="store_true")
+    backup_parser.set_defaults(func=backup_database)
+
+    replica_parser = subparsers.add_parser(
+        "replica", help="copy the database into the read-only stats replica"
+    )
+    replica_parser.add_argument(
+        "replica", nargs="?", help="replica path (REPLICA_DATABASE)"
+    )
+    replica_parser.add_argument(
+        "--every", type=float, help="keep running, one sync every N seconds"
+    )
+    replica_parser.add_argument("-v", "--verbose", action="store_true")
+    replica_parser.set_defaults(func=replicate_database)
+
+    soak_parser = subparsers.add_parser(
+        "soak", help="drive a long request mix in-process and check for drift"
+    )
+    soak_parser.add_argument("--requests", type=int, default=1_000_000)
+    soak_parser.add_argument("--sample-every", type=int, default=10_000)
+    soak_parser.add_argument(
+        "--warmup", type=int, default=20_000, help="requests before slopes count"
+    )
+    soak_parser.add_argument("--clients", type=int, default=50, help="sessions")
+    soak_parser.add_argument("--database", help="database (default: a new one)")
+    soak_parser.add_argument("--no-tracemalloc", action="store_true")
+    soak_parser.add_argument(
+        "--top", type=int, default=10, help="allocation sites per sample"
+    )
+    soak_parser.add_argument("--seed", type=int, default=0)
+    soak_parser.add_argument(
+        "--max-rss-slope",
+        type=float,
+        default=4096,
+        help="bytes of RSS growth per 1000 requests",
+    )
+    soak_parser.add_argument(
+        "--max-traced-slope",
+        type=float,
+        default=2048,
+        help="bytes of traced memory growth per 1000 requests",
+    )
+    soak_parser.add_argument(
+        "--max-fd-slope",
+        type=float,
+        default=0.001,
+        help="open database descriptors gained per 1000 requests",
+    )
+    soak_parser.add_argument(
+        "--max-p99-slope",
+        type=float,
+        default=0.01,
+        help="milliseconds of p99 latency growth per 1000 requests",
+    )
+    soak_parser.add_argument("-o", "--output", help="JSON output (default: stdout)")
+    soak_parser.add_argument("-v", "--verbose", action="store_true")
+    soak_parser.set_defaults(func=soak_test)
+
+    return parser
+
+
+def main(argv=None):
+    """Entry point for python -m anika_blue or the console script."""
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
 if __name__ == "__main__":
     main()
@@ -1,24 +1,71 @@
 import colorsys
 import hashlib
+import json
 import math
 import os
 import random
 import secrets
 import sqlite3
+import sys
+import threading
 import time
-from functools import wraps
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from io import BytesIO
 from pathlib import Path
-
-from flask import Flask, jsonify, render_template, request, send_file, session
+from typing import NamedTuple
+
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    has_request_context,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    send_file,
+    session,
+    stream_with_context,
+    url_for,
+)
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from PIL import Image
 import webcolors
 
-CSS3_NAME_LIST = webcolors.names(webcolors.CSS3)
-CSS3_HEX_TO_NAMES = {
-    webcolors.normalize_hex(webcolors.name_to_hex(name, spec=webcolors.CSS3)): name
-    for name in CSS3_NAME_LIST
-}
+from .assets import IMMUTABLE_CACHE_CONTROL, AssetBundle
+from .backup import create_backup
+from .clusters import CLUSTERS_TABLE, fit_clusters, get_clusters, update_clusters
+from .coherence import (
+    BASE_COLOR_TRIGGERS,
+    GENERATION_TRIGGERS,
+    GENERATIONS_TABLE,
+    OUTDATED_TRIGGERS,
+    CoherentCache,
+)
+from .palettes import get_palette
+from .ratelimit import TokenBucketLimiter
+from .rebuild import (
+    CHECKPOINT_TABLE,
+    REBUILD_CHUNK_SIZE,
+    clear_checkpoint,
+    rebuild_base_colors,
+)
+from .replica import replica_synced_at, sync_replica
+from .sketches import (
+    SKETCH_TABLE,
+    HyperLogLog,
+    SpaceSaving,
+    flush_sketch,
+    load_sketch,
+    save_sketch,
+    sketch_version,
+)
+from .transfer import EXPORT_FORMATS, EXPORT_TABLES, export_table
+
+COLOR_DETAILS_CACHE_SIZE = 4096
 
 COLOR_NAME_SUFFIXES = sorted(
     {
@@ -120,9 +167,83 @@ BIND_PORT = int(os.environ.get("BIND_PORT", 5000))
 DATABASE = os.environ.get("DATABASE", "anika_blue.db")
 DEBUG = os.environ.get("DEBUG") is not None
 SECRET_KEY = os.environ.get("SECRET_KEY", secrets.token_hex(32))
+EXPORT_TOKEN = os.environ.get("EXPORT_TOKEN")
+BACKGROUND_JOBS = os.environ.get("BACKGROUND_JOBS", "1") not in ("", "0")
+BACKUP_DIR = os.environ.get("BACKUP_DIR")
+BACKUP_INTERVAL = float(os.environ.get("BACKUP_INTERVAL", "0"))
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.environ.get("BACKUP_PAGES", "256"))
+BACKUP_SLEEP = float(os.environ.get("BACKUP_SLEEP", "0.05"))
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") not in ("", "0")
+# Unset: next to DATABASE, whose directory only the app's user should write
+RATE_LIMIT_FILE = os.environ.get("RATE_LIMIT_FILE")
+# Tokens per second and bucket size per session; client addresses get
+# RATE_LIMIT_ADDRESS_FACTOR times as much since they may be shared (NAT).
+RATE_LIMITS = {
+    "read": (
+        float(os.environ.get("RATE_LIMIT_READ_RATE", "10")),
+        float(os.environ.get("RATE_LIMIT_READ_BURST", "40")),
+    ),
+    "write": (
+        float(os.environ.get("RATE_LIMIT_WRITE_RATE", "3")),
+        float(os.environ.get("RATE_LIMIT_WRITE_BURST", "15")),
+    ),
+}
+RATE_LIMIT_ADDRESS_FACTOR = float(os.environ.get("RATE_LIMIT_ADDRESS_FACTOR", "4"))
+# Bucket width in seconds -> how long buckets of that width are kept
+VOTE_BUCKET_RETENTION = {60: 3600, 3600: 7 * 24 * 3600}
+# Label, window length and the bucket width it is summed from
+STATS_WINDOWS = (
+    ("Last hour", 3600, 60),
+    ("Last day", 24 * 3600, 3600),
+    ("Last week", 7 * 24 * 3600, 3600),
+)
+# A registered palette name ("css3") or the path of a palette file or index
+COLOR_PALETTE = os.environ.get("COLOR_PALETTE", "css3")
+COLOR_PALETTE_SPACE = os.environ.get("COLOR_PALETTE_SPACE", "rgb")
+# Number of Anika Blue modes the online k-means over yes votes looks for
+CLUSTER_COUNT = int(os.environ.get("CLUSTER_COUNT", "4"))
+# Counters of the most voted exact shades sketch, see sketches.SpaceSaving
+TOP_SHADES_CAPACITY = 1000
+TOP_SHADES_LIMIT = 10
+# Distinct counters (HyperLogLog sketch name -> snapshot column)
+DISTINCT_COUNTERS = {
+    "voters": "distinct_users",
+    "shown_shades": "distinct_shades_shown",
+    "yes_shades": "distinct_yes_shades",
+}
+HLL_PRECISION = 12
+SKETCH_FLUSH_INTERVAL = float(os.environ.get("SKETCH_FLUSH_INTERVAL", "5"))
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+STATS_SNAPSHOT_INTERVAL = float(os.environ.get("STATS_SNAPSHOT_INTERVAL", "2"))
+STATS_SNAPSHOT_MAX_AGE = float(os.environ.get("STATS_SNAPSHOT_MAX_AGE", "10"))
+# Local read-only copy serving the stats endpoints, see replica_reads
+REPLICA_DATABASE = os.environ.get("REPLICA_DATABASE")
+REPLICA_INTERVAL = float(os.environ.get("REPLICA_INTERVAL", "5"))
+# Base color lookups remembered per worker, including the failed ones
+BASE_COLOR_CACHE_SIZE = int(os.environ.get("BASE_COLOR_CACHE_SIZE", "10000"))
+# Unset: Jinja's private per-user directory, empty: no bytecode cache
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR")
 
 LIVERELOAD_POLL_INTERVAL = float(os.environ.get("LIVERELOAD_POLL_INTERVAL", 1.5))
 _LIVERELOAD_CACHE = {"token": None, "timestamp": 0.0}
+# Keyed by the stats snapshot version, so the rendered global stats
+# fragment is only rebuilt when the snapshot contents actually change.
+_GLOBAL_STATS_FRAGMENT_CACHE = {"key": None, "html": None}
+_BACKGROUND_JOBS = {}
+_BACKGROUND_JOBS_LOCK = threading.Lock()
+_ASSET_BUNDLE = {"bundle": None}
+_RATE_LIMITER = {"limiter": None}
+_COHERENT_CACHE = {"cache": None}
+_BASE_COLOR_CACHE = {"cache": None}
+# Cache of the current replica file, replaced whenever the file is
+_REPLICA = {"key": None, "cache": None, "synced_at": None}
+_REPLICA_LOCK = threading.Lock()
+# Sketch updates of this worker not yet merged into sketch_state
+_SKETCH_DELTAS = {"database": None, "sketches": {}}
+_SKETCH_DELTAS_LOCK = threading.Lock()
+_TOP_SHADES_CACHE = {"key": None, "top": []}
 WATCH_TARGETS = [
     BASE_DIR / "templates",
     BASE_DIR / "static",
@@ -136,11 +257,20 @@ app = Flask(
     static_folder=str(BASE_DIR / "static"),
 )
 app.secret_key = SECRET_KEY
+app.config["RATE_LIMIT_ENABLED"] = RATE_LIMIT_ENABLED
 
 if DEBUG:
     app.config["TEMPLATES_AUTO_RELOAD"] = True
     app.jinja_env.auto_reload = True
 
+# Persist compiled templates so freshly started workers skip recompilation
+if TEMPLATE_CACHE_DIR is None:
+    # Created with mode 0700 and refused if another user owns it
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+elif TEMPLATE_CACHE_DIR:
+    os.makedirs(TEMPLATE_CACHE_DIR, mode=0o700, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
 
 def compute_live_reload_token() -> str:
     digest = hashlib.sha1()
@@ -180,6 +310,23 @@ def get_live_reload_token() -> str:
     return token
 
 
+def get_asset_bundle() -> AssetBundle:
+    bundle = _ASSET_BUNDLE["bundle"]
+    if bundle is None or (DEBUG and bundle.is_stale()):
+        bundle = AssetBundle.load(Path(app.static_folder))
+        _ASSET_BUNDLE["bundle"] = bundle
+    return bundle
+
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    """URL of the content-hashed copy of a static asset"""
+    hashed = get_asset_bundle().urls.get(name)
+    if hashed is None:
+        return url_for("static", filename=name)
+    return url_for("hashed_asset", filename=hashed)
+
+
 def init_db():
     conn = sqlite3.connect(DATABASE)
     c = conn.cursor()
@@ -206,6 +353,11 @@ def init_db():
                   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)"""
     )
 
+    # Per-user history pages walk votes by (user_id, id)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_votes_user_id_id ON votes (user_id, id)"
+    )
+
     # Table for shades already shown to users
     c.execute(
         """CREATE TABLE IF NOT EXISTS shown_shades
@@ -223,6 +375,65 @@ def init_db():
                   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)"""
     )
 
+    # Session restore looks users up by their base color, in any case
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_user_base_colors_base_color
+           ON user_base_colors (lower(base_color))"""
+    )
+
+    # Single-row materialized global stats, refreshed by a background job
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS stats_snapshot
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  version INTEGER NOT NULL,
+                  average TEXT,
+                  vote_count INTEGER NOT NULL,
+                  distinct_users INTEGER NOT NULL,
+                  details TEXT,
+                  computed_at REAL NOT NULL,
+                  distinct_shades_shown INTEGER NOT NULL DEFAULT 0,
+                  distinct_yes_shades INTEGER NOT NULL DEFAULT 0)"""
+    )
+    # Migrate snapshots from before the distinct shade counters
+    c.execute("PRAGMA table_info(stats_snapshot)")
+    snapshot_columns = {row[1] for row in c.fetchall()}
+    for column in DISTINCT_COUNTERS.values():
+        if column not in snapshot_columns:
+            c.execute(
+                f"""ALTER TABLE stats_snapshot
+                    ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"""
+            )
+
+    # Per-minute and per-hour vote aggregates for the windowed stats
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS vote_buckets
+                 (scope TEXT NOT NULL,
+                  resolution INTEGER NOT NULL,
+                  bucket_start INTEGER NOT NULL,
+                  r_sum INTEGER NOT NULL,
+                  g_sum INTEGER NOT NULL,
+                  b_sum INTEGER NOT NULL,
+                  yes_count INTEGER NOT NULL,
+                  vote_count INTEGER NOT NULL,
+                  PRIMARY KEY (scope, resolution, bucket_start)) WITHOUT ROWID"""
+    )
+
+    # Online k-means centers of the yes votes
+    c.execute(CLUSTERS_TABLE)
+
+    # Merged streaming sketches of all workers
+    c.execute(SKETCH_TABLE)
+
+    # Progress of an interrupted rebuild of the derived data
+    c.execute(CHECKPOINT_TABLE)
+
+    # Generation counters that keep per-worker caches coherent
+    c.execute(GENERATIONS_TABLE)
+    for trigger in OUTDATED_TRIGGERS:
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for trigger in GENERATION_TRIGGERS + BASE_COLOR_TRIGGERS:
+        c.execute(trigger)
+
     conn.commit()
     conn.close()
 
@@ -230,9 +441,102 @@ def init_db():
 def get_db():
     conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
+    # Rows replaced by INSERT OR REPLACE must fire the delete triggers too
+    conn.execute("PRAGMA recursive_triggers = ON")
+    return conn
+
+
+def get_cache() -> CoherentCache:
+    cache = _COHERENT_CACHE["cache"]
+    if cache is None or cache.database != DATABASE:
+        cache = CoherentCache(DATABASE)
+        _COHERENT_CACHE["cache"] = cache
+    return cache
+
+
+def get_base_color_cache() -> CoherentCache:
+    """Cache of base color lookups, apart so failed guesses can't evict stats"""
+    cache = _BASE_COLOR_CACHE["cache"]
+    if cache is None or cache.database != DATABASE:
+        cache = CoherentCache(DATABASE, max_entries=BASE_COLOR_CACHE_SIZE)
+        _BASE_COLOR_CACHE["cache"] = cache
+    return cache
+
+
+def reading_replica() -> bool:
+    return has_request_context() and g.get("replica") is not None
+
+
+def get_read_db():
+    """Connection for reads that replica_reads views serve from the replica"""
+    if not reading_replica():
+        return get_db()
+    conn = sqlite3.connect(f"file:{g.replica}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
     return conn
 
 
+@contextmanager
+def read_db(conn=None):
+    """conn when the caller shares one, else a get_read_db() closed on exit"""
+    if conn is not None:
+        yield conn
+        return
+    conn = get_read_db()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_read_cache() -> CoherentCache:
+    return g.replica_cache if reading_replica() else get_cache()
+
+
+def open_replica():
+    """(path, cache, synced_at) of the current replica, None if not synced yet"""
+    try:
+        stat = os.stat(REPLICA_DATABASE)
+    except OSError:
+        return None
+    # Syncs replace the file, inode numbers alone may be reused
+    key = (REPLICA_DATABASE, stat.st_ino, stat.st_mtime_ns)
+    with _REPLICA_LOCK:
+        if _REPLICA["key"] != key:
+            # The old cache is left to the garbage collector, it may be in use
+            cache = CoherentCache(REPLICA_DATABASE)
+            _REPLICA.update(
+                key=key, cache=cache, synced_at=replica_synced_at(cache.conn)
+            )
+        if _REPLICA["synced_at"] is None:
+            return None
+        return REPLICA_DATABASE, _REPLICA["cache"], _REPLICA["synced_at"]
+
+
+def replica_reads(f):
+    """Serve a read-only view from REPLICA_DATABASE and report the lag"""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        replica = open_replica() if REPLICA_DATABASE else None
+        if replica is None:
+            return f(*args, **kwargs)
+
+        g.replica, g.replica_cache, g.replica_synced_at = replica
+        response = make_response(f(*args, **kwargs))
+        lag = max(0.0, time.time() - g.replica_synced_at)
+        response.headers["X-Replica-Lag"] = f"{lag:.1f}"
+        return response
+
+    return decorated_function
+
+
+@app.before_request
+def sync_caches():
+    """Drop cached results invalidated by writes of other workers"""
+    get_cache().sync()
+
+
 def ensure_user_id(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -243,6 +547,51 @@ def ensure_user_id(f):
     return decorated_function
 
 
+def get_rate_limiter() -> TokenBucketLimiter:
+    limiter = _RATE_LIMITER["limiter"]
+    if limiter is None:
+        limiter = TokenBucketLimiter(RATE_LIMIT_FILE or f"{DATABASE}-ratelimit")
+        _RATE_LIMITER["limiter"] = limiter
+    return limiter
+
+
+def check_rate_limit(kind):
+    """Seconds the client has to wait before its next request of this kind"""
+    rate, burst = RATE_LIMITS[kind]
+    limiter = get_rate_limiter()
+
+    retry_after = 0.0
+    user_id = session.get("user_id")
+    if user_id:
+        retry_after = limiter.acquire(f"{kind}:user:{user_id}", rate, burst)
+    if not retry_after and request.remote_addr:
+        factor = RATE_LIMIT_ADDRESS_FACTOR
+        retry_after = limiter.acquire(
+            f"{kind}:addr:{request.remote_addr}", rate * factor, burst * factor
+        )
+    return retry_after
+
+
+def rate_limited(kind):
+    """Throttle a view per session and client address ("read" or "write")"""
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if app.config["RATE_LIMIT_ENABLED"]:
+                retry_after = check_rate_limit(kind)
+                if retry_after:
+                    response = jsonify({"success": False, "error": "Too many requests"})
+                    response.status_code = 429
+                    response.headers["Retry-After"] = str(math.ceil(retry_after))
+                    return response
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
 def generate_blue_shade():
     """Generate a random shade of blue"""
     # Blue is typically R=0-100, G=0-200, B=150-255 for good blues
@@ -283,45 +632,24 @@ def format_color_name(raw_name: str | None) -> str:
     return name.capitalize()
 
 
-def get_nearest_css3(hex_color: str | None):
+def get_nearest_named_color(hex_color: str | None, palette=None):
+    """Name, hex, distance and exactness of the closest palette color"""
     normalized = normalize_hex_color(hex_color)
     if not normalized:
         return None, None, None, False
 
+    if palette is None:
+        palette = get_palette(COLOR_PALETTE, COLOR_PALETTE_SPACE)
     try:
-        target_rgb = webcolors.hex_to_rgb(normalized)
+        match = palette.nearest(normalized)
     except ValueError:
         return None, None, None, False
 
-    best_name = None
-    best_hex = None
-    best_distance = None
-
-    for css_hex, css_name in CSS3_HEX_TO_NAMES.items():
-        css_rgb = webcolors.hex_to_rgb(css_hex)
-        distance = (
-            (css_rgb.red - target_rgb.red) ** 2
-            + (css_rgb.green - target_rgb.green) ** 2
-            + (css_rgb.blue - target_rgb.blue) ** 2
-        )
-
-        if best_distance is None or distance < best_distance:
-            best_distance = distance
-            best_name = css_name
-            best_hex = css_hex
-
-    if best_name is None:
+    if match is None:
         return None, None, None, False
 
-    normalized_best_hex = webcolors.normalize_hex(best_hex)
-    is_exact = normalized_best_hex == normalized
-
-    return (
-        format_color_name(best_name),
-        normalized_best_hex,
-        math.sqrt(best_distance) if best_distance is not None else None,
-        is_exact,
-    )
+    best_hex, best_name, distance = match
+    return format_color_name(best_name), best_hex, distance, best_hex == normalized
 
 
 def describe_color(hex_color: str | None) -> str:
@@ -404,9 +732,51 @@ def describe_color(hex_color: str | None) -> str:
     return " ".join(parts) if parts else hue_name
 
 
-def get_color_details(hex_color: str | None) -> dict:
-    normalized = normalize_hex_color(hex_color)
-    css_name, css_hex, css_distance, css_exact = get_nearest_css3(normalized)
+class ColorDetails(NamedTuple):
+    """Human readable names of a color, shared between all requests"""
+
+    descriptive_name: str
+    css_name: str | None
+    css_hex: str | None
+    css_distance: float | None
+    css_exact: bool
+    css_display_name: str | None
+    combined_name: str
+
+    @property
+    def display_name(self) -> str:
+        return self.combined_name
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ColorDetails":
+        """Inverse of _asdict, e.g. for details stored as JSON"""
+        return cls._make(data[field] for field in cls._fields)._interned()
+
+    def _interned(self) -> "ColorDetails":
+        return self._replace(
+            descriptive_name=sys.intern(self.descriptive_name),
+            css_name=self.css_name and sys.intern(self.css_name),
+            css_display_name=self.css_display_name
+            and sys.intern(self.css_display_name),
+            combined_name=sys.intern(self.combined_name),
+        )
+
+
+class ColorStat(NamedTuple):
+    """An averaged color with its vote count, as rendered in the stats"""
+
+    hex: str
+    count: int
+    details: ColorDetails
+
+
+def get_color_details(hex_color: str | None) -> ColorDetails:
+    return _get_color_details(normalize_hex_color(hex_color))
+
+
+@lru_cache(maxsize=COLOR_DETAILS_CACHE_SIZE)
+def _get_color_details(normalized: str | None) -> ColorDetails:
+    css_name, css_hex, css_distance, css_exact = get_nearest_named_color(normalized)
     descriptive_name = describe_color(normalized)
 
     css_display_name = None
@@ -419,98 +789,589 @@ def get_color_details(hex_color: str | None) -> dict:
     else:
         combined_name = descriptive_name
 
-    return {
-        "descriptive_name": descriptive_name,
-        "css_name": css_name,
-        "css_hex": css_hex,
-        "css_distance": round(css_distance, 2) if css_distance is not None else None,
-        "css_exact": css_exact,
-        "css_display_name": css_display_name,
-        "display_name": combined_name,
-        "combined_name": combined_name,
-    }
+    return ColorDetails(
+        descriptive_name=descriptive_name,
+        css_name=css_name,
+        css_hex=css_hex,
+        css_distance=round(css_distance, 2) if css_distance is not None else None,
+        css_exact=css_exact,
+        css_display_name=css_display_name,
+        combined_name=combined_name,
+    )._interned()
 
 
-def build_color_context(color_info):
+def build_color_context(color_info) -> ColorStat | None:
     if not color_info:
         return None
     hex_color, count = color_info
-    normalized_hex = normalize_hex_color(hex_color)
-    details = get_color_details(normalized_hex or hex_color)
-    return {
-        "hex": normalized_hex or hex_color,
-        "count": count,
-        **details,
-    }
+    hex_color = normalize_hex_color(hex_color) or hex_color
+    return ColorStat(hex_color, count, get_color_details(hex_color))
+
+
+def average_hex_colors(colors):
+    """Average an iterable of "#rrggbb" colors, returns (hex, count) or None"""
+    r_sum, g_sum, b_sum = 0, 0, 0
+    count = 0
+    for color in colors:
+        r_sum += int(color[1:3], 16)
+        g_sum += int(color[3:5], 16)
+        b_sum += int(color[5:7], 16)
+        count += 1
 
+    if not count:
+        return None
 
-def get_user_average(user_id):
+    avg_r = int(r_sum / count)
+    avg_g = int(g_sum / count)
+    avg_b = int(b_sum / count)
+
+    return f"#{avg_r:02x}{avg_g:02x}{avg_b:02x}", count
+
+
+def get_user_average(user_id, conn=None):
     """Calculate the average color for a user's Anika Blue votes"""
-    conn = get_db()
+    with read_db(conn) as db:
+        c = db.cursor()
+        c.execute(
+            """SELECT hex_color FROM votes
+                     WHERE user_id = ? AND is_anika_blue = 1""",
+            (user_id,),
+        )
+        return average_hex_colors(row["hex_color"] for row in c)
+
+
+def get_global_average():
+    """Calculate the global average of all Anika Blue votes"""
+    conn = get_read_db()
     c = conn.cursor()
 
     c.execute(
         """SELECT hex_color FROM votes
-                 WHERE user_id = ? AND is_anika_blue = 1""",
-        (user_id,),
+                 WHERE is_anika_blue = 1"""
     )
 
-    colors = [row["hex_color"] for row in c.fetchall()]
+    result = average_hex_colors(row["hex_color"] for row in c)
     conn.close()
+    return result
+
+
+def get_cached_user_average(user_id, conn=None):
+    """get_user_average, cached until one of the user's votes changes"""
+    return get_read_cache().get(
+        f"user:{user_id}",
+        ("user_average", user_id),
+        lambda: get_user_average(user_id, conn),
+    )
 
-    if not colors:
+
+def get_cached_global_average():
+    """get_global_average, cached until a "yes" vote changes"""
+    return get_read_cache().get("global", ("global_average",), get_global_average)
+
+
+def parse_rgb(hex_color):
+    """(r, g, b) of a "#rrggbb" color, or None if it can't be parsed"""
+    normalized = normalize_hex_color(hex_color)
+    try:
+        rgb = webcolors.hex_to_rgb(normalized)
+    except (TypeError, ValueError):
         return None
+    return rgb.red, rgb.green, rgb.blue
+
+
+def vote_bucket_rows(user_id, hex_color, is_anika_blue, timestamp):
+    """vote_buckets increments for one vote, for all scopes and resolutions"""
+    rgb = parse_rgb(hex_color) if is_anika_blue else None
+    r, g, b = rgb or (0, 0, 0)
+    yes_count = 1 if rgb else 0
+    return [
+        (scope, resolution, int(timestamp) // resolution * resolution)
+        + (r, g, b, yes_count, 1)
+        for scope in ("global", f"user:{user_id}")
+        for resolution in VOTE_BUCKET_RETENTION
+    ]
 
-    # Calculate average RGB values
-    r_sum, g_sum, b_sum = 0, 0, 0
-    for color in colors:
-        r = int(color[1:3], 16)
-        g = int(color[3:5], 16)
-        b = int(color[5:7], 16)
-        r_sum += r
-        g_sum += g
-        b_sum += b
-
-    count = len(colors)
-    avg_r = int(r_sum / count)
-    avg_g = int(g_sum / count)
-    avg_b = int(b_sum / count)
 
-    return f"#{avg_r:02x}{avg_g:02x}{avg_b:02x}", count
+def record_vote_buckets(c, rows):
+    c.executemany(
+        """INSERT INTO vote_buckets
+           (scope, resolution, bucket_start, r_sum, g_sum, b_sum,
+            yes_count, vote_count)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (scope, resolution, bucket_start) DO UPDATE SET
+               r_sum = r_sum + excluded.r_sum,
+               g_sum = g_sum + excluded.g_sum,
+               b_sum = b_sum + excluded.b_sum,
+               yes_count = yes_count + excluded.yes_count,
+               vote_count = vote_count + excluded.vote_count""",
+        rows,
+    )
 
 
-def get_global_average():
-    """Calculate the global average of all Anika Blue votes"""
+def prune_vote_buckets(now=None):
+    """Drop buckets that no longer fall into any stats window"""
+    now = time.time() if now is None else now
     conn = get_db()
     c = conn.cursor()
+    for resolution, retention in VOTE_BUCKET_RETENTION.items():
+        c.execute(
+            "DELETE FROM vote_buckets WHERE resolution = ? AND bucket_start < ?",
+            (resolution, now - retention - resolution),
+        )
+    conn.commit()
+    conn.close()
+
+
+def get_window_stats(scope, now=None, conn=None):
+    """Averages and counts over the STATS_WINDOWS, summed from vote_buckets"""
+    now = time.time() if now is None else now
+    with read_db(conn) as db:
+        rows = [
+            db.execute(
+                """SELECT SUM(r_sum), SUM(g_sum), SUM(b_sum),
+                          SUM(yes_count), SUM(vote_count)
+                   FROM vote_buckets
+                   WHERE scope = ? AND resolution = ? AND bucket_start > ?""",
+                (scope, resolution, now - length),
+            ).fetchone()
+            for _, length, resolution in STATS_WINDOWS
+        ]
+
+    windows = []
+    for (label, _, _), row in zip(STATS_WINDOWS, rows):
+        r_sum, g_sum, b_sum, yes_count, vote_count = row
+
+        average = None
+        if yes_count:
+            hex_color = (
+                f"#{r_sum // yes_count:02x}{g_sum // yes_count:02x}"
+                f"{b_sum // yes_count:02x}"
+            )
+            average = build_color_context((hex_color, yes_count))
+        windows.append(
+            {"label": label, "average": average, "vote_count": vote_count or 0}
+        )
+    return windows
+
+
+def get_sketch_deltas():
+    """This worker's unflushed sketches, call with _SKETCH_DELTAS_LOCK held"""
+    if _SKETCH_DELTAS["database"] != DATABASE:
+        sketches = {"top_shades": SpaceSaving(TOP_SHADES_CAPACITY)}
+        for name in DISTINCT_COUNTERS:
+            sketches[name] = HyperLogLog(HLL_PRECISION)
+        _SKETCH_DELTAS.update(database=DATABASE, sketches=sketches)
+    return _SKETCH_DELTAS["sketches"]
+
+
+def record_vote_sketches(user_id, hex_color, is_anika_blue):
+    rgb = parse_rgb(hex_color) if is_anika_blue else None
+    with _SKETCH_DELTAS_LOCK:
+        deltas = get_sketch_deltas()
+        deltas["voters"].add(user_id)
+        if rgb:
+            deltas["top_shades"].add(normalize_hex_color(hex_color))
+            deltas["yes_shades"].add(normalize_hex_color(hex_color))
+
+
+def record_shown_shade_sketch(hex_color):
+    with _SKETCH_DELTAS_LOCK:
+        get_sketch_deltas()["shown_shades"].add(hex_color)
+
+
+def flush_sketches():
+    """Merge this worker's sketch updates into sketch_state"""
+    with _SKETCH_DELTAS_LOCK:
+        deltas = get_sketch_deltas()
+        _SKETCH_DELTAS["database"] = None  # start over with empty deltas
+
+    conn = get_db()
+    try:
+        for name, delta in list(deltas.items()):
+            if delta:
+                flush_sketch(conn, name, delta)
+            del deltas[name]
+    except Exception:
+        # Keep what could not be stored for the next flush
+        with _SKETCH_DELTAS_LOCK:
+            current = get_sketch_deltas()
+            for name, delta in deltas.items():
+                current[name].merge(delta)
+        raise
+    finally:
+        conn.close()
+
+
+def get_top_shades(limit=TOP_SHADES_LIMIT):
+    """[(hex, count, error)] of the most voted shades as of the last flush"""
+    conn = get_read_db()
+    c = conn.cursor()
+    database = g.replica if reading_replica() else DATABASE
+    key = (database, sketch_version(c, "top_shades"))
+    if _TOP_SHADES_CACHE["key"] != key:
+        sketch, _ = load_sketch(c, "top_shades", SpaceSaving)
+        top = sketch.top(len(sketch)) if sketch else []
+        _TOP_SHADES_CACHE.update(key=key, top=top)
+    conn.close()
+    return _TOP_SHADES_CACHE["top"][:limit]
+
+
+def count_distinct(c):
+    """Snapshot column -> estimated distinct count, from the stored sketches"""
+    counts = {}
+    for name, column in DISTINCT_COUNTERS.items():
+        sketch, _ = load_sketch(c, name, HyperLogLog)
+        counts[column] = round(sketch.estimate()) if sketch else 0
+    return counts
+
+
+def rebuild_distinct_counters(conn):
+    """Replace the distinct counters by sketches over the whole tables"""
+    sketches = {name: HyperLogLog(HLL_PRECISION) for name in DISTINCT_COUNTERS}
+    c = conn.cursor()
+    c.execute("SELECT user_id, hex_color, is_anika_blue FROM votes")
+    for user_id, hex_color, is_anika_blue in c:
+        sketches["voters"].add(user_id)
+        if is_anika_blue and parse_rgb(hex_color):
+            sketches["yes_shades"].add(normalize_hex_color(hex_color))
+    c.execute("SELECT hex_color FROM shown_shades")
+    for (hex_color,) in c:
+        sketches["shown_shades"].add(hex_color)
 
+    for name, sketch in sketches.items():
+        save_sketch(c, name, sketch)
+
+
+def rebuild_top_shades(conn):
+    """Replace the top shades sketch by exact counts"""
+    c = conn.cursor()
     c.execute(
-        """SELECT hex_color FROM votes
-                 WHERE is_anika_blue = 1"""
+        """SELECT lower(hex_color), COUNT(*) AS votes FROM votes
+           WHERE is_anika_blue = 1 GROUP BY 1 ORDER BY votes DESC LIMIT ?""",
+        (TOP_SHADES_CAPACITY,),
+    )
+    sketch = SpaceSaving(TOP_SHADES_CAPACITY)
+    for hex_color, count in c.fetchall():
+        sketch.add(hex_color, count)
+    save_sketch(c, "top_shades", sketch)
+
+
+def rebuild_vote_buckets(conn):
+    longest = max(VOTE_BUCKET_RETENTION.values())
+    c = conn.cursor()
+    c.execute("DELETE FROM vote_buckets")
+    c.execute(
+        """SELECT user_id, hex_color, is_anika_blue,
+                  CAST(strftime('%s', timestamp) AS INTEGER) AS epoch
+           FROM votes WHERE timestamp >= datetime('now', ?)""",
+        (f"-{longest} seconds",),
     )
 
-    colors = [row["hex_color"] for row in c.fetchall()]
+    # Sum in memory, there are far fewer buckets than votes to upsert
+    totals = {}
+    for row in c:
+        for bucket in vote_bucket_rows(
+            row["user_id"], row["hex_color"], row["is_anika_blue"], row["epoch"]
+        ):
+            key, counts = bucket[:3], bucket[3:]
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(counts)
+            else:
+                for index, count in enumerate(counts):
+                    total[index] += count
+
+    record_vote_buckets(c, [key + tuple(total) for key, total in totals.items()])
+
+
+def rebuild_derived_data(
+    workers=1, chunk_size=REBUILD_CHUNK_SIZE, resume=False, progress=None
+):
+    """Recompute everything derived from votes, e.g. after a bulk import.
+
+    Base colors are averaged by workers processes and checkpointed per
+    chunk (see rebuild.py); the other derived tables are rebuilt in one
+    transaction that also ends the rebuild.  Returns the final checkpoint.
+    """
+    conn = get_db()
+    try:
+        checkpoint = rebuild_base_colors(
+            conn, average_hex_colors, workers, chunk_size, resume, progress
+        )
+        rebuild_vote_buckets(conn)
+        fit_clusters(conn, CLUSTER_COUNT, parse_rgb)
+        rebuild_top_shades(conn)
+        rebuild_distinct_counters(conn)
+        clear_checkpoint(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+    refresh_stats_snapshot()
+    return checkpoint
+
+
+def snapshot_from_row(row):
+    return {
+        "version": row["version"],
+        "average": row["average"],
+        "count": row["vote_count"],
+        "distinct_users": row["distinct_users"],
+        "distinct_shades_shown": row["distinct_shades_shown"],
+        "distinct_yes_shades": row["distinct_yes_shades"],
+        "details": (
+            ColorDetails.from_dict(json.loads(row["details"]))
+            if row["details"]
+            else None
+        ),
+        "computed_at": row["computed_at"],
+        "age": max(0.0, time.time() - row["computed_at"]),
+    }
+
+
+def refresh_stats_snapshot(min_interval=0):
+    """Recompute the global stats snapshot from the votes table.
+
+    Skipped, returning the stored snapshot, when it was computed less than
+    min_interval seconds ago, e.g. by another worker.
+    """
+    computed_at = time.time()
+    if min_interval > 0:
+        conn = get_db()
+        row = conn.execute("SELECT * FROM stats_snapshot WHERE id = 1").fetchone()
+        conn.close()
+        if row is not None and computed_at - row["computed_at"] < min_interval:
+            return snapshot_from_row(row)
+
+    # Only rescans votes when they changed since the last refresh
+    cache = get_cache()
+    cache.sync()
+    global_avg = get_cached_global_average()
+    average, vote_count = global_avg if global_avg else (None, 0)
+    details = json.dumps(get_color_details(average)._asdict()) if average else None
+
+    conn = get_db()
+    c = conn.cursor()
+    distinct = count_distinct(c)
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("SELECT * FROM stats_snapshot WHERE id = 1")
+    previous = c.fetchone()
+
+    # Another worker already stored a fresher snapshot
+    if previous is not None and previous["computed_at"] >= computed_at:
+        conn.rollback()
+        conn.close()
+        return snapshot_from_row(previous)
+
+    version = previous["version"] if previous else 0
+    values = (average, vote_count, *distinct.values())
+    columns = ("average", "vote_count", *distinct)
+    if previous is None or tuple(previous[column] for column in columns) != values:
+        version += 1
+
+    c.execute(
+        f"""INSERT OR REPLACE INTO stats_snapshot
+            (id, version, {", ".join(columns)}, details, computed_at)
+            VALUES (1, ?, {", ".join("?" for _ in columns)}, ?, ?)""",
+        (version, *values, details, computed_at),
+    )
+    c.execute("SELECT * FROM stats_snapshot WHERE id = 1")
+    snapshot = snapshot_from_row(c.fetchone())
+    conn.commit()
     conn.close()
+    return snapshot
+
+
+def get_stats_snapshot(max_age=None, conn=None):
+    """Global stats at most max_age seconds old, without scanning votes"""
+    max_age = STATS_SNAPSHOT_MAX_AGE if max_age is None else max_age
+
+    with read_db(conn) as db:
+        row = db.execute("SELECT * FROM stats_snapshot WHERE id = 1").fetchone()
+
+    # The replica can't be refreshed, its snapshot is as recent as the copy
+    if reading_replica():
+        if row is not None:
+            return snapshot_from_row(row)
+        return {
+            "version": 0,
+            "average": None,
+            "count": 0,
+            "distinct_users": 0,
+            "distinct_shades_shown": 0,
+            "distinct_yes_shades": 0,
+            "details": None,
+            "computed_at": g.replica_synced_at,
+            "age": max(0.0, time.time() - g.replica_synced_at),
+        }
+
+    if row is None or time.time() - row["computed_at"] > max_age:
+        return refresh_stats_snapshot()
+    return snapshot_from_row(row)
+
 
-    if not colors:
+def build_snapshot_context(snapshot):
+    if not snapshot["average"]:
         return None
+    return ColorStat(snapshot["average"], snapshot["count"], snapshot["details"])
 
-    # Calculate average RGB values
-    r_sum, g_sum, b_sum = 0, 0, 0
-    for color in colors:
-        r = int(color[1:3], 16)
-        g = int(color[3:5], 16)
-        b = int(color[5:7], 16)
-        r_sum += r
-        g_sum += g
-        b_sum += b
-
-    count = len(colors)
-    avg_r = int(r_sum / count)
-    avg_g = int(g_sum / count)
-    avg_b = int(b_sum / count)
 
-    return f"#{avg_r:02x}{avg_g:02x}{avg_b:02x}", count
+def render_global_stats(snapshot):
+    """Render the global average block of stats.html, reusing the cached copy"""
+    key = (DATABASE, snapshot["version"])
+    if _GLOBAL_STATS_FRAGMENT_CACHE["key"] == key:
+        return _GLOBAL_STATS_FRAGMENT_CACHE["html"]
+
+    global_avg = build_snapshot_context(snapshot)
+    html = Markup(
+        render_template("global_stats.html", global_avg=global_avg, snapshot=snapshot)
+    )
+    _GLOBAL_STATS_FRAGMENT_CACHE.update({"key": key, "html": html})
+    return html
+
+
+def render_stats_fragment(user_avg, conn=None):
+    """(html, snapshot) of stats.html with the global half from the snapshot"""
+    snapshot = get_stats_snapshot(conn=conn)
+    now = time.time()
+    user_windows = get_window_stats(f"user:{session['user_id']}", now, conn)
+    global_windows = get_window_stats("global", now, conn)
+    html = render_template(
+        "stats.html",
+        user_avg=user_avg,
+        global_stats=render_global_stats(snapshot),
+        snapshot_age=snapshot["age"],
+        windows=list(zip(user_windows, global_windows)),
+    )
+    return html, snapshot
+
+
+def render_stats(user_avg):
+    """Render stats.html with the global half served from the snapshot"""
+    html, snapshot = render_stats_fragment(user_avg)
+    response = make_response(html)
+    response.headers["X-Stats-Snapshot-Age"] = f"{snapshot['age']:.1f}"
+    return response
+
+
+def run_background_job(name, interval, func):
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                func()
+            except Exception:
+                app.logger.exception("Background job %s failed", name)
+
+    thread = threading.Thread(target=loop, name=f"anika-blue-{name}", daemon=True)
+    thread.start()
+    return stop
+
+
+def run_backup():
+    """Take an online backup of DATABASE into BACKUP_DIR unless a worker just did"""
+    return create_backup(
+        DATABASE,
+        BACKUP_DIR,
+        pages=BACKUP_PAGES,
+        sleep=BACKUP_SLEEP,
+        keep=BACKUP_KEEP,
+        min_interval=BACKUP_INTERVAL / 2,
+    )
+
+
+def run_stats_snapshot():
+    """Refresh the stats snapshot unless another worker just did"""
+    return refresh_stats_snapshot(min_interval=STATS_SNAPSHOT_INTERVAL / 2)
+
+
+def run_replica_sync():
+    """Copy DATABASE to REPLICA_DATABASE unless another worker just did"""
+    return sync_replica(DATABASE, REPLICA_DATABASE, min_interval=REPLICA_INTERVAL / 2)
+
+
+def start_background_jobs():
+    """Start the periodic jobs of this process (idempotent)"""
+    with _BACKGROUND_JOBS_LOCK:
+        if "stats_snapshot" not in _BACKGROUND_JOBS:
+            _BACKGROUND_JOBS["stats_snapshot"] = run_background_job(
+                "stats_snapshot", STATS_SNAPSHOT_INTERVAL, run_stats_snapshot
+            )
+        if "vote_buckets" not in _BACKGROUND_JOBS:
+            _BACKGROUND_JOBS["vote_buckets"] = run_background_job(
+                "vote_buckets", min(VOTE_BUCKET_RETENTION), prune_vote_buckets
+            )
+        if BACKUP_DIR and BACKUP_INTERVAL > 0 and "backup" not in _BACKGROUND_JOBS:
+            _BACKGROUND_JOBS["backup"] = run_background_job(
+                "backup", BACKUP_INTERVAL, run_backup
+            )
+        if "sketches" not in _BACKGROUND_JOBS:
+            _BACKGROUND_JOBS["sketches"] = run_background_job(
+                "sketches", SKETCH_FLUSH_INTERVAL, flush_sketches
+            )
+        if (
+            REPLICA_DATABASE
+            and REPLICA_INTERVAL > 0
+            and "replica" not in _BACKGROUND_JOBS
+        ):
+            _BACKGROUND_JOBS["replica"] = run_background_job(
+                "replica", REPLICA_INTERVAL, run_replica_sync
+            )
+
+
+def stop_background_jobs():
+    with _BACKGROUND_JOBS_LOCK:
+        for stop in _BACKGROUND_JOBS.values():
+            stop.set()
+        _BACKGROUND_JOBS.clear()
+
+
+@app.before_request
+def ensure_background_jobs():
+    # WSGI servers import the app without going through main()
+    if BACKGROUND_JOBS and not app.testing and not _BACKGROUND_JOBS:
+        start_background_jobs()
+
+
+def get_vote_history(user_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """One page of a user's votes, newest first, and the cursor of the next"""
+    conn = get_read_db()
+    c = conn.cursor()
+    # Keyset pagination: seek in idx_votes_user_id_id instead of OFFSET
+    if before is None:
+        c.execute(
+            """SELECT id, hex_color, is_anika_blue, timestamp FROM votes
+               WHERE user_id = ?
+               ORDER BY id DESC LIMIT ?""",
+            (user_id, limit + 1),
+        )
+    else:
+        c.execute(
+            """SELECT id, hex_color, is_anika_blue, timestamp FROM votes
+               WHERE user_id = ? AND id < ?
+               ORDER BY id DESC LIMIT ?""",
+            (user_id, before, limit + 1),
+        )
+    rows = c.fetchall()
+    conn.close()
+
+    items = []
+    for row in rows[:limit]:
+        details = get_color_details(row["hex_color"])
+        items.append(
+            {
+                "id": row["id"],
+                "hex": row["hex_color"],
+                "anika_blue": bool(row["is_anika_blue"]),
+                "timestamp": row["timestamp"],
+                "descriptive_name": details.descriptive_name,
+                "css_name": details.css_name,
+            }
+        )
+
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    return items, next_cursor
 
 
 def get_user_base_color(user_id):
@@ -527,36 +1388,130 @@ def set_user_base_color(user_id, base_color):
     """Save the base color for a user"""
     conn = get_db()
     c = conn.cursor()
+    # Unchanged colors are not written, which keeps their cached lookups valid
     c.execute(
-        """INSERT OR REPLACE INTO user_base_colors (user_id, base_color)
-           VALUES (?, ?)""",
+        """INSERT INTO user_base_colors (user_id, base_color) VALUES (?, ?)
+           ON CONFLICT(user_id) DO UPDATE SET
+               base_color = excluded.base_color, timestamp = CURRENT_TIMESTAMP
+           WHERE base_color != excluded.base_color""",
         (user_id, base_color),
     )
     conn.commit()
     conn.close()
 
 
+class BaseColorCollision(Exception):
+    """Several users share the base color, none of them can be picked"""
+
+    def __init__(self, base_color, user_ids):
+        super().__init__(f"{len(user_ids)} users share the base color {base_color}")
+        self.base_color = base_color
+        self.user_ids = user_ids
+
+
+def find_users_by_base_color(base_color, limit=2):
+    """Up to limit user_ids with this base color, an empty tuple for none.
+
+    Results are cached per worker until a base color changes to or from
+    this one, so repeated guesses of unused colors never reach the table.
+    """
+    base_color = normalize_hex_color(base_color) or base_color.lower()
+
+    def lookup():
+        conn = get_db()
+        c = conn.cursor()
+        c.execute(
+            """SELECT user_id FROM user_base_colors
+               WHERE lower(base_color) = ? ORDER BY user_id LIMIT ?""",
+            (base_color, limit),
+        )
+        user_ids = tuple(row["user_id"] for row in c)
+        conn.close()
+        return user_ids
+
+    cache = get_base_color_cache()
+    cache.sync()
+    return cache.get(
+        f"base_color:{base_color}", ("base_color_users", base_color, limit), lookup
+    )
+
+
 def find_user_by_base_color(base_color):
-    """Find a user_id by their base color"""
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "SELECT user_id FROM user_base_colors WHERE base_color = ?", (base_color,)
+    """Find the user_id with this base color, None if there is none.
+
+    Raises BaseColorCollision instead of picking one of several users.
+    """
+    user_ids = find_users_by_base_color(base_color)
+    if len(user_ids) > 1:
+        raise BaseColorCollision(base_color, user_ids)
+    return user_ids[0] if user_ids else None
+
+
+def show_next_shade(conn, user_id):
+    """Pick the next shade for a user and record that it was shown"""
+    shade = generate_blue_shade()
+    conn.execute(
+        "INSERT INTO shown_shades (user_id, hex_color) VALUES (?, ?)",
+        (user_id, shade),
+    )
+    conn.commit()
+    record_shown_shade_sketch(shade)
+    return shade
+
+
+def render_shade_card(shade):
+    return render_template(
+        "shade_card.html",
+        shade=shade,
+        shade_details=get_color_details(shade),
     )
-    result = c.fetchone()
-    conn.close()
-    return result["user_id"] if result else None
 
 
 @app.route("/")
 @ensure_user_id
+@rate_limited("write")
 def index():
-    return render_template(
-        "index.html",
-        debug=DEBUG,
-        livereload_token=get_live_reload_token() if DEBUG else None,
-        livereload_interval=int(LIVERELOAD_POLL_INTERVAL * 1000),
+    # The first card and the stats come with the page, one connection for all
+    conn = get_db()
+    try:
+        shade = show_next_shade(conn, session["user_id"])
+        user_avg = build_color_context(
+            get_cached_user_average(session["user_id"], conn)
+        )
+        stats_html, snapshot = render_stats_fragment(user_avg, conn)
+    finally:
+        conn.close()
+
+    response = make_response(
+        render_template(
+            "index.html",
+            shade_card=Markup(render_shade_card(shade)),
+            stats=Markup(stats_html),
+            debug=DEBUG,
+            livereload_token=get_live_reload_token() if DEBUG else None,
+            livereload_interval=int(LIVERELOAD_POLL_INTERVAL * 1000),
+        )
     )
+    # Every page carries a freshly recorded shade, never serve it twice
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Stats-Snapshot-Age"] = f"{snapshot['age']:.1f}"
+    return response
+
+
+@app.route("/static/dist/<filename>")
+def hashed_asset(filename):
+    """Serve a content-hashed asset, precompressed when the client allows it"""
+    negotiated = get_asset_bundle().negotiate(filename, request.accept_encodings)
+    if negotiated is None:
+        abort(404)
+
+    body, encoding = negotiated
+    response = app.response_class(body, mimetype=AssetBundle.mimetype(filename))
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 
 @app.route("/__livereload")
@@ -577,29 +1532,21 @@ def livereload_endpoint():
 
 @app.route("/next-shade")
 @ensure_user_id
+@rate_limited("write")
 def next_shade():
     """Get the next shade to show the user"""
-    shade = generate_blue_shade()
-
-    # Store that we've shown this shade to the user
     conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO shown_shades (user_id, hex_color) VALUES (?, ?)",
-        (session["user_id"], shade),
-    )
-    conn.commit()
-    conn.close()
+    try:
+        shade = show_next_shade(conn, session["user_id"])
+    finally:
+        conn.close()
 
-    return render_template(
-        "shade_card.html",
-        shade=shade,
-        shade_details=get_color_details(shade),
-    )
+    return render_shade_card(shade)
 
 
 @app.route("/vote", methods=["POST"])
 @ensure_user_id
+@rate_limited("write")
 def vote():
     """Record a user's vote for a shade"""
     shade = request.form.get("shade")
@@ -616,35 +1563,46 @@ def vote():
             "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
             (session["user_id"], shade, is_anika_blue),
         )
+        record_vote_buckets(
+            c, vote_bucket_rows(session["user_id"], shade, is_anika_blue, time.time())
+        )
+        rgb = parse_rgb(shade) if is_anika_blue else None
+        if rgb:
+            update_clusters(c, rgb, CLUSTER_COUNT)
         conn.commit()
         conn.close()
 
+        # Our own write must invalidate the cached averages right away
+        get_cache().sync()
+        record_vote_sketches(session["user_id"], shade, is_anika_blue)
+
     # Get updated averages
-    user_avg_tuple = get_user_average(session["user_id"])
+    user_avg_tuple = get_cached_user_average(session["user_id"])
     if user_avg_tuple:
         set_user_base_color(session["user_id"], user_avg_tuple[0])
 
     user_avg = build_color_context(user_avg_tuple)
-    global_avg = build_color_context(get_global_average())
 
-    return render_template("stats.html", user_avg=user_avg, global_avg=global_avg)
+    return render_stats(user_avg)
 
 
 @app.route("/stats")
 @ensure_user_id
+@rate_limited("read")
+@replica_reads
 def stats():
     """Get current statistics"""
-    user_avg = build_color_context(get_user_average(session["user_id"]))
-    global_avg = build_color_context(get_global_average())
+    user_avg = build_color_context(get_cached_user_average(session["user_id"]))
 
-    return render_template("stats.html", user_avg=user_avg, global_avg=global_avg)
+    return render_stats(user_avg)
 
 
 @app.route("/save-base-color", methods=["POST"])
 @ensure_user_id
+@rate_limited("write")
 def save_base_color():
     """Save the current user's base color"""
-    user_avg_tuple = get_user_average(session["user_id"])
+    user_avg_tuple = get_cached_user_average(session["user_id"])
 
     if user_avg_tuple:
         base_color = user_avg_tuple[0]
@@ -655,6 +1613,7 @@ def save_base_color():
 
 
 @app.route("/load-base-color", methods=["POST"])
+@rate_limited("write")
 def load_base_color():
     """Load a user session by their base color"""
     base_color = request.form.get("base_color", "").strip()
@@ -666,7 +1625,19 @@ def load_base_color():
     if not base_color.startswith("#") or len(base_color) != 7:
         return jsonify({"success": False, "error": "Invalid hex color format"}), 400
 
-    user_id = find_user_by_base_color(base_color)
+    try:
+        user_id = find_user_by_base_color(base_color)
+    except BaseColorCollision:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": "Several users share this base color, "
+                    "it cannot restore a session",
+                }
+            ),
+            409,
+        )
 
     if user_id:
         session["user_id"] = user_id
@@ -679,6 +1650,8 @@ def load_base_color():
 
 
 @app.route("/favicon.ico")
+@rate_limited("read")
+@replica_reads
 def favicon():
     """Generate a dynamic favicon based on user's Anika Blue color"""
     # Get user ID from session if available
@@ -686,16 +1659,17 @@ def favicon():
 
     # Determine which color to use
     color = None
+    snapshot = None
     if user_id:
-        user_avg = get_user_average(user_id)
+        user_avg = get_cached_user_average(user_id)
         if user_avg:
             color = user_avg[0]
 
-    # If no user color, use global average
+    # If no user color, use the (possibly slightly stale) global average
     if not color:
-        global_avg = get_global_average()
-        if global_avg:
-            color = global_avg[0]
+        snapshot = get_stats_snapshot()
+        if snapshot["average"]:
+            color = snapshot["average"]
         else:
             # Default to a nice blue if no data exists
             color = "#667eea"
@@ -713,4 +1687,102 @@ def favicon():
     img.save(img_io, "ICO")
     img_io.seek(0)
 
-    return send_file(img_io, mimetype="image/x-icon")
+    response = send_file(img_io, mimetype="image/x-icon")
+    if snapshot is not None:
+        response.headers["X-Stats-Snapshot-Age"] = f"{snapshot['age']:.1f}"
+    return response
+
+
+@app.route("/export/<table>.<fmt>")
+def export(table, fmt):
+    """Stream a whole table as CSV or NDJSON (requires EXPORT_TOKEN)"""
+    if not EXPORT_TOKEN:
+        abort(404)
+
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not secrets.compare_digest(token, EXPORT_TOKEN):
+        return jsonify({"success": False, "error": "Invalid export token"}), 403
+
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    def generate():
+        conn = get_db()
+        try:
+            yield from export_table(conn, table, fmt)
+        finally:
+            conn.close()
+
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename={table}.{fmt}"
+    return response
+
+
+@app.route("/history")
+@ensure_user_id
+@rate_limited("read")
+def history():
+    """Page through the current user's votes, newest first"""
+    try:
+        before = request.args.get("before")
+        before = int(before) if before else None
+        limit = int(request.args.get("limit", HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid pagination"}), 400
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    items, next_cursor = get_vote_history(session["user_id"], before, limit)
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
+@app.route("/clusters")
+@rate_limited("read")
+@replica_reads
+def clusters():
+    """The distinct Anika Blues found among all yes votes, largest first"""
+    conn = get_read_db()
+    centers = get_clusters(conn.cursor())
+    conn.close()
+
+    total = sum(size for _, size in centers)
+    items = []
+    for hex_color, size in centers:
+        details = get_color_details(hex_color)
+        items.append(
+            {
+                "hex": hex_color,
+                "size": size,
+                "share": size / total,
+                "descriptive_name": details.descriptive_name,
+                "css_name": details.css_name,
+                "combined_name": details.combined_name,
+            }
+        )
+    return jsonify({"clusters": items, "vote_count": total})
+
+
+@app.route("/top-shades")
+@rate_limited("read")
+@replica_reads
+def top_shades():
+    """The exact shades most often voted Anika Blue, from the sketch"""
+    try:
+        limit = int(request.args.get("limit", TOP_SHADES_LIMIT))
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid limit"}), 400
+    limit = max(1, min(limit, TOP_SHADES_CAPACITY))
+
+    items = []
+    for hex_color, count, error in get_top_shades(limit):
+        details = get_color_details(hex_color)
+        items.append(
+            {
+                "hex": hex_color,
+                "count": count,
+                "error": error,
+                "descriptive_name": details.descriptive_name,
+                "css_name": details.css_name,
+                "combined_name": details.combined_name,
+            }
+        )
+    return jsonify({"shades": items})
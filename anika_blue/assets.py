@@ -0,0 +1,128 @@
+"""Content-hashed, precompressed static assets for Anika Blue.
+
+``build_assets`` runs at build time (``anika-blue build-assets``) and writes
+``static/dist/<name>.<hash>.<ext>`` together with ``.gz`` and, when the
+optional ``brotli`` package is installed, ``.br`` siblings plus a
+``manifest.json``.  ``AssetBundle.load`` picks those files up at startup and
+falls back to hashing/compressing the sources in memory when no (or an
+outdated) build is present, so development checkouts work unchanged.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+ASSET_SOURCES = ("app.css", "app.js")
+DIST_DIRNAME = "dist"
+MANIFEST_NAME = "manifest.json"
+# Preferred first when negotiating Accept-Encoding
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def hashed_name(name: str, content: bytes) -> str:
+    stem, _, ext = name.rpartition(".")
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"{stem}.{digest}.{ext}"
+
+
+def compress(content: bytes, encoding: str) -> bytes | None:
+    if encoding == "gzip":
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(content, quality=11)
+    return None
+
+
+def build_assets(static_dir: Path) -> dict:
+    """Write hashed and precompressed copies of the asset sources"""
+    dist_dir = Path(static_dir) / DIST_DIRNAME
+    dist_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {}
+    for name in ASSET_SOURCES:
+        content = (Path(static_dir) / name).read_bytes()
+        hashed = hashed_name(name, content)
+        (dist_dir / hashed).write_bytes(content)
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            compressed = compress(content, encoding)
+            if compressed is not None:
+                (dist_dir / f"{hashed}{suffix}").write_bytes(compressed)
+        manifest[name] = hashed
+
+    (dist_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2) + "\n")
+    return manifest
+
+
+class AssetBundle:
+    """In-memory table of hashed assets and their encoded variants"""
+
+    def __init__(self, static_dir: Path):
+        self.static_dir = Path(static_dir)
+        self.urls = {}  # source name -> hashed name
+        self.files = {}  # hashed name -> {encoding or "identity": bytes}
+        self.mtimes = {}
+
+    @classmethod
+    def load(cls, static_dir: Path) -> "AssetBundle":
+        bundle = cls(static_dir)
+        dist_dir = bundle.static_dir / DIST_DIRNAME
+        try:
+            manifest = json.loads((dist_dir / MANIFEST_NAME).read_text())
+        except (OSError, ValueError):
+            manifest = {}
+
+        for name in ASSET_SOURCES:
+            source = bundle.static_dir / name
+            if not source.exists():
+                continue
+            content = source.read_bytes()
+            hashed = hashed_name(name, content)
+            variants = {"identity": content}
+
+            if manifest.get(name) == hashed:
+                for encoding, suffix in ENCODING_SUFFIXES.items():
+                    built = dist_dir / f"{hashed}{suffix}"
+                    if built.exists():
+                        variants[encoding] = built.read_bytes()
+            else:
+                # No up-to-date build, compress once now instead
+                for encoding in ENCODING_SUFFIXES:
+                    compressed = compress(content, encoding)
+                    if compressed is not None:
+                        variants[encoding] = compressed
+
+            bundle.urls[name] = hashed
+            bundle.files[hashed] = variants
+            bundle.mtimes[name] = source.stat().st_mtime_ns
+
+        return bundle
+
+    def is_stale(self) -> bool:
+        for name, mtime in self.mtimes.items():
+            source = self.static_dir / name
+            if not source.exists() or source.stat().st_mtime_ns != mtime:
+                return True
+        return False
+
+    def negotiate(self, hashed: str, accept_encodings) -> tuple[bytes, str] | None:
+        """Return the best encoded body for a hashed asset and its encoding"""
+        variants = self.files.get(hashed)
+        if variants is None:
+            return None
+
+        for encoding in ENCODING_SUFFIXES:
+            if encoding in variants and accept_encodings.quality(encoding) > 0:
+                return variants[encoding], encoding
+        return variants["identity"], "identity"
+
+    @staticmethod
+    def mimetype(hashed: str) -> str:
+        return mimetypes.guess_type(hashed)[0] or "application/octet-stream"
@@ -0,0 +1,155 @@
+"""Online backups of the Anika Blue database.
+
+Backups use ``sqlite3.Connection.backup`` and copy ``pages`` pages per step.
+The source is only locked during a step, the progress callback sleeps
+``sleep`` seconds between steps so that concurrent ``/vote`` writes are never
+blocked for long.  SQLite restarts the copy whenever another connection
+writes to the source; after ``max_restarts`` restarts the copy is taken in a
+single step instead, so a busy database still gets backed up.
+
+Each copy is written to a ``.partial`` file, checked with
+``PRAGMA integrity_check`` and only then renamed into place, after which old
+backups beyond ``keep`` are rotated out.  A lock file in the backup directory
+and ``min_interval`` let every worker run the backup job while only one of
+them copies per interval.
+"""
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, every worker backs up on its own
+    fcntl = None
+
+BACKUP_PREFIX = "anika_blue-"
+BACKUP_SUFFIX = ".db"
+PARTIAL_SUFFIX = ".partial"
+LOCK_NAME = ".backup.lock"
+MAX_RESTARTS = 3
+
+
+class TooManyRestarts(Exception):
+    """Writes kept restarting a stepwise backup"""
+
+
+def backup_filename(now: float) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now))
+    return f"{BACKUP_PREFIX}{stamp}.{int(now % 1 * 1_000_000):06d}{BACKUP_SUFFIX}"
+
+
+def list_backups(backup_dir) -> list[Path]:
+    """Existing backups, oldest first"""
+    backup_dir = Path(backup_dir)
+    if not backup_dir.is_dir():
+        return []
+    return sorted(backup_dir.glob(f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}"))
+
+
+def verify_backup(path) -> str:
+    """Run an integrity check on a backup, returns "ok" when it is sound"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    except sqlite3.DatabaseError as exc:
+        return str(exc)
+    finally:
+        conn.close()
+    return "\n".join(row[0] for row in rows)
+
+
+def rotate_backups(backup_dir, keep: int) -> list[Path]:
+    """Delete all but the newest ``keep`` backups (0 keeps everything)"""
+    if keep <= 0:
+        return []
+    expired = list_backups(backup_dir)[:-keep]
+    for path in expired:
+        path.unlink()
+    return expired
+
+
+def copy_in_steps(source, destination, pages, sleep, max_restarts, progress=None):
+    """Back up pages at a time, sleeping in between, returns the restart count.
+
+    Raises TooManyRestarts once writes restarted the copy more than
+    max_restarts times.
+    """
+    state = {"remaining": None, "restarts": 0}
+
+    def step(status, remaining, total):
+        if progress:
+            progress(status, remaining, total)
+        # A step that ends up no closer to the end started over
+        previous = state["remaining"]
+        if (
+            status == sqlite3.SQLITE_OK
+            and previous is not None
+            and remaining >= previous
+        ):
+            state["restarts"] += 1
+            if state["restarts"] > max_restarts:
+                raise TooManyRestarts(f"{state['restarts']} restarts")
+        state["remaining"] = remaining
+        # Called between steps, when the source is not locked
+        if remaining and sleep > 0:
+            time.sleep(sleep)
+
+    source.backup(destination, pages=pages, progress=step)
+    return state["restarts"]
+
+
+def create_backup(
+    database,
+    backup_dir,
+    pages: int = 256,
+    sleep: float = 0.05,
+    keep: int = 7,
+    progress=None,
+    max_restarts: int = MAX_RESTARTS,
+    min_interval: float = 0,
+) -> Path | None:
+    """Copy the live database into backup_dir, verify it and rotate old copies.
+
+    Returns the new backup, or None if the newest one is younger than
+    min_interval seconds or another process is taking a backup right now.
+    """
+    backup_dir = Path(backup_dir)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    lock = os.open(backup_dir / LOCK_NAME, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+        backups = list_backups(backup_dir)
+        if backups and time.time() - backups[-1].stat().st_mtime < min_interval:
+            return None
+
+        target = backup_dir / backup_filename(time.time())
+        partial = target.with_name(target.name + PARTIAL_SUFFIX)
+        source = sqlite3.connect(database)
+        destination = sqlite3.connect(partial)
+        try:
+            try:
+                copy_in_steps(source, destination, pages, sleep, max_restarts, progress)
+            except TooManyRestarts:
+                # Steady writes never let a stepwise copy finish, copy at once
+                source.backup(destination, progress=progress)
+        finally:
+            destination.close()
+            source.close()
+
+        result = verify_backup(partial)
+        if result != "ok":
+            partial.unlink()
+            raise RuntimeError(f"Backup of {database} failed integrity check: {result}")
+
+        os.replace(partial, target)
+        rotate_backups(backup_dir, keep)
+        return target
+    finally:
+        os.close(lock)  # also releases the flock
@@ -0,0 +1,89 @@
+"""Online k-means over the "yes" votes, to find several Anika Blues.
+
+The cluster centers live in the ``vote_clusters`` table and are updated by
+``update_clusters`` inside the transaction that records a vote: the vote is
+assigned to the nearest center, which then moves towards it by
+``1 / size`` (MacQueen's online k-means), so the centers always equal the
+mean of the votes assigned to them.  A vote costs O(k) instead of a refit
+over the whole ``votes`` table; ``fit_clusters`` replays all yes votes the
+same way and is only needed after bulk changes such as imports.
+
+The first ``k`` distinct colors seed the centers, later votes never create
+new clusters.
+"""
+
+CLUSTERS_TABLE = """CREATE TABLE IF NOT EXISTS vote_clusters
+         (id INTEGER PRIMARY KEY,
+          r REAL NOT NULL,
+          g REAL NOT NULL,
+          b REAL NOT NULL,
+          size INTEGER NOT NULL)"""
+FIT_FETCH_SIZE = 10_000
+
+
+def assign(centers, rgb):
+    """Index of the center closest to rgb, or None without centers"""
+    best, best_distance = None, None
+    for index, (r, g, b, _) in enumerate(centers):
+        distance = (r - rgb[0]) ** 2 + (g - rgb[1]) ** 2 + (b - rgb[2]) ** 2
+        if best_distance is None or distance < best_distance:
+            best, best_distance = index, distance
+    return best
+
+
+def add_point(centers, rgb, k):
+    """Fold one color into a list of [r, g, b, size] centers, returns its index"""
+    index = assign(centers, rgb)
+    if len(centers) < k and (
+        index is None or tuple(centers[index][:3]) != tuple(map(float, rgb))
+    ):
+        centers.append([float(rgb[0]), float(rgb[1]), float(rgb[2]), 1])
+        return len(centers) - 1
+
+    center = centers[index]
+    center[3] += 1
+    for channel in range(3):
+        center[channel] += (rgb[channel] - center[channel]) / center[3]
+    return index
+
+
+def load_centers(c):
+    c.execute("SELECT r, g, b, size FROM vote_clusters ORDER BY id")
+    return [list(row) for row in c.fetchall()]
+
+
+def update_clusters(c, rgb, k):
+    """Move the clusters for one new yes vote, within the caller's transaction"""
+    centers = load_centers(c)
+    index = add_point(centers, rgb, k)
+    c.execute(
+        """INSERT OR REPLACE INTO vote_clusters (id, r, g, b, size)
+           VALUES (?, ?, ?, ?, ?)""",
+        (index, *centers[index]),
+    )
+
+
+def fit_clusters(conn, k, parse):
+    """Recompute the clusters from scratch over all yes votes, in vote order"""
+    centers = []
+    c = conn.cursor()
+    c.execute("SELECT hex_color FROM votes WHERE is_anika_blue = 1 ORDER BY id")
+    while rows := c.fetchmany(FIT_FETCH_SIZE):
+        for rgb in filter(None, (parse(row[0]) for row in rows)):
+            add_point(centers, rgb, k)
+
+    c.execute("DELETE FROM vote_clusters")
+    c.executemany(
+        "INSERT INTO vote_clusters (id, r, g, b, size) VALUES (?, ?, ?, ?, ?)",
+        [(index, *center) for index, center in enumerate(centers)],
+    )
+    return centers
+
+
+def get_clusters(c):
+    """(hex, size) of the cluster centers, largest first"""
+    c.execute("SELECT r, g, b, size FROM vote_clusters ORDER BY size DESC, id")
+    return [
+        (f"#{round(r):02x}{round(g):02x}{round(b):02x}", size)
+        for r, g, b, size in c.fetchall()
+    ]
@@ -0,0 +1,138 @@
+"""Per-process caches that stay coherent with writes from other processes.
+
+Every cached value belongs to a *scope* ("global", "votes", "user:<id>",
+"base_color:<hex>").  Triggers on the ``votes`` and ``user_base_colors``
+tables bump a row per scope in ``cache_generations`` (see
+``GENERATION_TRIGGERS`` and ``BASE_COLOR_TRIGGERS``), whoever the writer is.
+
+``CoherentCache.sync`` is called at request start and runs
+``PRAGMA data_version`` on a long-lived watcher connection: the value only
+changes when another connection committed something, so the common case costs
+no table reads at all.  When it changed, cached entries are re-validated
+lazily against the generation of their own scope, so a vote by one user
+drops that user's entries (and the global ones for "yes" votes) only.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+GENERATIONS_TABLE = """CREATE TABLE IF NOT EXISTS cache_generations
+         (scope TEXT PRIMARY KEY,
+          generation INTEGER NOT NULL)"""
+
+_BUMP = """INSERT INTO cache_generations (scope, generation) SELECT {scope}, 1
+            WHERE {condition}
+            ON CONFLICT(scope) DO UPDATE SET generation = generation + 1;"""
+
+
+def _bump_statements(rows):
+    scopes = [("'votes'", "1")]
+    for row in rows:
+        scopes.append((f"'user:' || {row}.user_id", "1"))
+        scopes.append(("'global'", f"{row}.is_anika_blue = 1"))
+    return "\n    ".join(
+        _BUMP.format(scope=scope, condition=condition) for scope, condition in scopes
+    )
+
+
+# Like the base colors below, an update invalidates the scopes of both the
+# old and the new row: moving a vote to another user or flipping it from
+# yes to no changes what the old user and the global stats see.
+GENERATION_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS votes_{event.lower()}_cache_generations
+        AFTER {event} ON votes
+        BEGIN
+            {_bump_statements(rows)}
+        END"""
+    for event, rows in (
+        ("INSERT", ("NEW",)),
+        ("DELETE", ("OLD",)),
+        ("UPDATE", ("OLD", "NEW")),
+    )
+]
+
+# Created by earlier versions with a different body, replaced on startup
+OUTDATED_TRIGGERS = ("votes_update_cache_generations",)
+
+
+def _base_color_bump_statements(rows):
+    return "\n    ".join(
+        _BUMP.format(scope=f"'base_color:' || lower({row}.base_color)", condition="1")
+        for row in rows
+    )
+
+
+# A changed base color invalidates the lookups of its old and its new value.
+# INSERT OR REPLACE only fires the DELETE trigger with recursive_triggers on.
+BASE_COLOR_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS user_base_colors_{event.lower()}_cache_generations
+        AFTER {event} ON user_base_colors
+        BEGIN
+            {_base_color_bump_statements(rows)}
+        END"""
+    for event, rows in (
+        ("INSERT", ("NEW",)),
+        ("DELETE", ("OLD",)),
+        ("UPDATE", ("OLD", "NEW")),
+    )
+]
+
+
+class CoherentCache:
+    """LRU cache whose entries are invalidated by scope generations"""
+
+    def __init__(self, database, max_entries: int = 10_000):
+        self.database = database
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(database, check_same_thread=False)
+        self.data_version = None
+        self.epoch = 0
+        # key -> [value, scope, generation, epoch it was last validated in]
+        self.entries = OrderedDict()
+
+    def sync(self):
+        """Cheap check for commits by other connections since the last call"""
+        with self.lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self.data_version:
+                self.data_version = version
+                self.epoch += 1
+
+    def generation(self, scope):
+        row = self.conn.execute(
+            "SELECT generation FROM cache_generations WHERE scope = ?", (scope,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, scope, key, compute):
+        """Cached value for key, recomputed if its scope changed meanwhile"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[3] != self.epoch:
+                    if self.generation(scope) == entry[2]:
+                        entry[3] = self.epoch
+                    else:
+                        del self.entries[key]
+                        entry = None
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    return entry[0]
+
+            # Read the generation first, a concurrent write then invalidates us
+            generation = self.generation(scope)
+            epoch = self.epoch
+
+        value = compute()
+
+        with self.lock:
+            self.entries[key] = [value, scope, generation, epoch]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,214 @@
+"""Named color palettes with a spatial index for nearest-name lookups.
+
+A ``Palette`` keeps its colors in an implicit k-d tree: the entries are
+ordered so that the median of every ``[lo, hi)`` range splits it along the
+axis ``depth % 3``, which needs no node objects and makes the built tree
+trivially serializable (``save_palette_index``/``load_palette``).  Lookups
+are O(log n) on average, so palettes of tens of thousands of names cost
+about the same as the 148 CSS3 colors.
+
+Distances are Euclidean in the palette's color ``space``: "rgb" (0-255
+channels) or the perceptually uniform "oklab".  CIEDE2000 is deliberately
+not offered, it violates the triangle inequality that the tree pruning
+relies on.
+"""
+
+import csv
+import io
+import json
+import math
+from pathlib import Path
+
+import webcolors
+
+INDEX_FORMAT = "anika-blue-palette-index"
+INDEX_VERSION = 1
+SPACES = ("rgb", "oklab")
+
+
+def hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
+    return tuple(webcolors.hex_to_rgb(webcolors.normalize_hex(hex_color)))
+
+
+def _linearize(channel: float) -> float:
+    channel /= 255
+    if channel <= 0.04045:
+        return channel / 12.92
+    return ((channel + 0.055) / 1.055) ** 2.4
+
+
+def rgb_to_oklab(rgb) -> tuple[float, float, float]:
+    """sRGB (0-255) to OKLab, see https://bottosson.github.io/posts/oklab/"""
+    r, g, b = (_linearize(channel) for channel in rgb)
+    l_ = math.cbrt(0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b)
+    m_ = math.cbrt(0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b)
+    s_ = math.cbrt(0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b)
+    return (
+        0.2104542553 * l_ + 0.7936177850 * m_ - 0.0040720468 * s_,
+        1.9779984951 * l_ - 2.4285922050 * m_ + 0.4505937099 * s_,
+        0.0259040371 * l_ + 0.7827717662 * m_ - 0.8086757660 * s_,
+    )
+
+
+def to_space(rgb, space: str) -> tuple:
+    if space == "rgb":
+        return tuple(float(channel) for channel in rgb)
+    if space == "oklab":
+        return rgb_to_oklab(rgb)
+    raise ValueError(f"Unknown color space: {space}")
+
+
+class Palette:
+    """Named colors searchable by nearest distance in a color space"""
+
+    def __init__(self, name, entries, space: str = "rgb", _ordered=False):
+        """entries are (hex, name) pairs; hex values are normalized"""
+        self.name = name
+        self.space = space
+        items = []
+        for hex_color, color_name in entries:
+            rgb = hex_to_rgb(hex_color)
+            items.append(
+                (to_space(rgb, space), webcolors.normalize_hex(hex_color), color_name)
+            )
+        if not _ordered:
+            self._build(items, 0, len(items), 0)
+        self.points = [item[0] for item in items]
+        self.hexes = [item[1] for item in items]
+        self.names = [item[2] for item in items]
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def _build(cls, items, lo, hi, depth):
+        """Order items[lo:hi] in place as an implicit k-d tree"""
+        if hi - lo <= 1:
+            return
+        axis = depth % 3
+        items[lo:hi] = sorted(items[lo:hi], key=lambda item: item[0][axis])
+        mid = (lo + hi) // 2
+        cls._build(items, lo, mid, depth + 1)
+        cls._build(items, mid + 1, hi, depth + 1)
+
+    def nearest(self, hex_color: str):
+        """(hex, name, distance) of the closest entry, or None if empty"""
+        if not self.points:
+            return None
+        target = to_space(hex_to_rgb(hex_color), self.space)
+        best = [math.inf, None]
+        self._search(target, 0, len(self.points), 0, best)
+        index = best[1]
+        return self.hexes[index], self.names[index], math.sqrt(best[0])
+
+    def _search(self, target, lo, hi, depth, best):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        point = self.points[mid]
+        distance = (
+            (point[0] - target[0]) ** 2
+            + (point[1] - target[1]) ** 2
+            + (point[2] - target[2]) ** 2
+        )
+        if distance < best[0]:
+            best[0], best[1] = distance, mid
+
+        diff = target[depth % 3] - point[depth % 3]
+        if diff < 0:
+            near, far = (lo, mid), (mid + 1, hi)
+        else:
+            near, far = (mid + 1, hi), (lo, mid)
+        self._search(target, *near, depth + 1, best)
+        if diff * diff < best[0]:
+            self._search(target, *far, depth + 1, best)
+
+    def to_index(self) -> dict:
+        return {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "name": self.name,
+            "space": self.space,
+            "entries": [list(entry) for entry in zip(self.hexes, self.names)],
+        }
+
+    @classmethod
+    def from_index(cls, index: dict) -> "Palette":
+        if index.get("format") != INDEX_FORMAT or index.get("version") != INDEX_VERSION:
+            raise ValueError("Not a palette index")
+        return cls(index["name"], index["entries"], index["space"], _ordered=True)
+
+
+def read_palette_entries(path):
+    """(hex, name) pairs from a palette file.
+
+    JSON files map names to hex values (or hold a list of [name, hex]);
+    other files have one "name<TAB or comma>hex" per line, like the XKCD
+    rgb.txt.  Lines without a valid hex value, e.g. headers, are skipped.
+    """
+    path = Path(path)
+    text = path.read_text(encoding="utf-8")
+    if path.suffix == ".json":
+        data = json.loads(text)
+        pairs = data.items() if isinstance(data, dict) else data
+    else:
+        delimiter = "\t" if "\t" in text else ","
+        pairs = (row[:2] for row in csv.reader(io.StringIO(text), delimiter=delimiter))
+
+    entries = []
+    for pair in pairs:
+        if len(pair) < 2:
+            continue
+        color_name, hex_color = (field.strip() for field in pair)
+        try:
+            hex_to_rgb(hex_color)
+        except ValueError:
+            continue
+        entries.append((hex_color, color_name))
+    return entries
+
+
+def load_palette(path, space: str = "rgb") -> Palette:
+    """Load a palette file, or a precomputed index as-is"""
+    path = Path(path)
+    if path.suffix == ".json":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(data, dict) and data.get("format") == INDEX_FORMAT:
+            return Palette.from_index(data)
+    return Palette(path.stem, read_palette_entries(path), space)
+
+
+def save_palette_index(palette: Palette, path):
+    Path(path).write_text(json.dumps(palette.to_index()), encoding="utf-8")
+
+
+def css3_palette(space: str = "rgb") -> Palette:
+    entries = [
+        (webcolors.name_to_hex(name, spec=webcolors.CSS3), name)
+        for name in webcolors.names(webcolors.CSS3)
+    ]
+    # Aliases such as aqua/cyan share a hex value, the last name wins
+    unique = {webcolors.normalize_hex(hex_color): name for hex_color, name in entries}
+    return Palette("css3", unique.items(), space)
+
+
+PALETTES = {"css3": css3_palette}
+_LOADED = {}
+
+
+def register_palette(name, factory):
+    """Make a palette available by name; factory(space) builds it on first use"""
+    PALETTES[name] = factory
+
+
+def get_palette(name: str = "css3", space: str = "rgb") -> Palette:
+    """A registered palette by name, or one loaded from a file path"""
+    key = (name, space)
+    if key not in _LOADED:
+        if name in PALETTES:
+            _LOADED[key] = PALETTES[name](space)
+        elif Path(name).is_file():
+            _LOADED[key] = load_palette(name, space)
+        else:
+            raise ValueError(f"Unknown color palette: {name}")
+    return _LOADED[key]
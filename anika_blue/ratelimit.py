@@ -0,0 +1,106 @@
+"""Token-bucket rate limiting shared by all worker processes on a host.
+
+Buckets live in a small memory-mapped file: a fixed table of ``slots``
+entries of (key hash, tokens, last update), addressed by open hashing with a
+short probe window.  Updates take an exclusive ``flock`` on the file (plus a
+thread lock, since flock does not exclude threads sharing a descriptor), so
+limits hold across gunicorn workers without a database round trip.  When the
+table is full the least recently updated entry in the probe window is
+recycled, which at worst hands a fresh burst to a long idle client.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, fall back to per-process limits
+    fcntl = None
+
+SLOT = struct.Struct("<Qdd")  # key hash, tokens, updated at
+PROBE_WINDOW = 8
+
+
+def key_hash(key: str) -> int:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1  # 0 marks an empty slot
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by arbitrary strings, stored in a shared file"""
+
+    def __init__(self, path, slots: int = 65536):
+        self.path = str(path)
+        self.slots = slots
+        self.lock = threading.Lock()
+        size = slots * SLOT.size
+
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0)
+        self.fd = os.open(self.path, flags, 0o600)
+        stat = os.fstat(self.fd)
+        # Anyone else who can write the buckets can lift or exhaust the limits
+        if (hasattr(os, "getuid") and stat.st_uid != os.getuid()) or (
+            stat.st_mode & 0o022
+        ):
+            os.close(self.fd)
+            raise PermissionError(
+                f"{self.path} must be owned by this user and not writable by others"
+            )
+        if stat.st_size < size:
+            self._locked(lambda: os.ftruncate(self.fd, size))
+        self.map = mmap.mmap(self.fd, size)
+
+    def _locked(self, func):
+        with self.lock:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                return func()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _find_slot(self, hashed: int) -> tuple[int, bool]:
+        """Offset of the slot for a key and whether it already holds it"""
+        start = hashed % self.slots
+        oldest_offset, oldest_updated = None, None
+        for probe in range(PROBE_WINDOW):
+            offset = ((start + probe) % self.slots) * SLOT.size
+            slot_hash, _, updated = SLOT.unpack_from(self.map, offset)
+            if slot_hash == hashed:
+                return offset, True
+            if slot_hash == 0:
+                return offset, False
+            if oldest_updated is None or updated < oldest_updated:
+                oldest_offset, oldest_updated = offset, updated
+        return oldest_offset, False
+
+    def acquire(self, key: str, rate: float, burst: float, now=None) -> float:
+        """Take one token; returns 0 if allowed, else seconds until a retry"""
+        hashed = key_hash(key)
+        now = time.time() if now is None else now
+
+        def take():
+            offset, found = self._find_slot(hashed)
+            if found:
+                _, tokens, updated = SLOT.unpack_from(self.map, offset)
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            else:
+                tokens = burst
+
+            if tokens >= 1:
+                SLOT.pack_into(self.map, offset, hashed, tokens - 1, now)
+                return 0.0
+
+            SLOT.pack_into(self.map, offset, hashed, tokens, now)
+            return (1 - tokens) / rate if rate > 0 else float("inf")
+
+        return self._locked(take)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
@@ -0,0 +1,199 @@
+"""Parallel, resumable rebuild of the user base colors from the votes table.
+
+``rebuild_base_colors`` walks the yes votes in ``user_id`` order, one query
+of about ``REBUILD_CHUNK_SIZE`` votes per chunk (keyset pagination, a user
+is never split across chunks), and averages the chunks in a process pool
+while the next ones are read.  Results are upserted in chunk order, one
+transaction per chunk together with the ``rebuild_checkpoint`` row, so an
+interrupted rebuild can resume after the last user it stored.  The same
+transaction deletes the stored base colors of the users in the chunk's range
+that have no yes votes left, so the table ends up matching the votes.
+
+Once every base color is stored the checkpoint moves to the
+``AGGREGATES_STAGE``; the caller rebuilds the other derived tables and
+removes the checkpoint in the same transaction.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
+CHECKPOINT_TABLE = """CREATE TABLE IF NOT EXISTS rebuild_checkpoint
+         (id INTEGER PRIMARY KEY CHECK (id = 1),
+          stage TEXT NOT NULL,
+          last_user_id TEXT,
+          users INTEGER NOT NULL,
+          votes INTEGER NOT NULL,
+          updated_at REAL NOT NULL)"""
+BASE_COLORS_STAGE = "base_colors"
+AGGREGATES_STAGE = "aggregates"
+REBUILD_CHUNK_SIZE = 100_000
+
+
+def load_checkpoint(c):
+    """The checkpoint of an unfinished rebuild as a dict, or None"""
+    c.execute(
+        "SELECT stage, last_user_id, users, votes, updated_at FROM rebuild_checkpoint"
+    )
+    row = c.fetchone()
+    if row is None:
+        return None
+    return dict(zip(("stage", "last_user_id", "users", "votes", "updated_at"), row))
+
+
+def save_checkpoint(c, stage, last_user_id, users, votes):
+    c.execute(
+        """INSERT OR REPLACE INTO rebuild_checkpoint
+           (id, stage, last_user_id, users, votes, updated_at)
+           VALUES (1, ?, ?, ?, ?, ?)""",
+        (stage, last_user_id, users, votes, time.time()),
+    )
+    return load_checkpoint(c)
+
+
+def clear_checkpoint(c):
+    c.execute("DELETE FROM rebuild_checkpoint")
+
+
+def read_chunk(c, after, size):
+    """[(user_id, hex_color)] of about size yes votes of the users after after"""
+    if after is None:
+        c.execute(
+            """SELECT user_id, hex_color FROM votes WHERE is_anika_blue = 1
+               ORDER BY user_id LIMIT ?""",
+            (size,),
+        )
+    else:
+        c.execute(
+            """SELECT user_id, hex_color FROM votes
+               WHERE is_anika_blue = 1 AND user_id > ?
+               ORDER BY user_id LIMIT ?""",
+            (after, size),
+        )
+    rows = [(user_id, hex_color) for user_id, hex_color in c.fetchall()]
+    if len(rows) < size:
+        return rows
+
+    # The last user may continue past the limit, leave them to the next chunk
+    last = rows[-1][0]
+    cut = len(rows)
+    while cut and rows[cut - 1][0] == last:
+        cut -= 1
+    if cut:
+        return rows[:cut]
+
+    # A single user with more than size votes
+    c.execute(
+        "SELECT user_id, hex_color FROM votes WHERE is_anika_blue = 1 AND user_id = ?",
+        (last,),
+    )
+    return [(user_id, hex_color) for user_id, hex_color in c.fetchall()]
+
+
+def delete_stale_base_colors(c, after, last):
+    """Delete base colors of users in (after, last] without yes votes.
+
+    after None starts at the first user, last None goes past the last one.
+    """
+    conditions, params = [], []
+    if after is not None:
+        conditions.append("user_id > ?")
+        params.append(after)
+    if last is not None:
+        conditions.append("user_id <= ?")
+        params.append(last)
+    conditions.append("""NOT EXISTS (SELECT 1 FROM votes
+           WHERE votes.user_id = user_base_colors.user_id AND is_anika_blue = 1)""")
+    c.execute(f"DELETE FROM user_base_colors WHERE {' AND '.join(conditions)}", params)
+
+
+def average_users(average, rows):
+    """[(user_id, base_color)] of user_id-ordered (user_id, hex_color) rows"""
+    return [
+        (user_id, average(hex_color for _, hex_color in group)[0])
+        for user_id, group in groupby(rows, key=itemgetter(0))
+    ]
+
+
+def rebuild_base_colors(
+    conn,
+    average,
+    workers=1,
+    chunk_size=REBUILD_CHUNK_SIZE,
+    resume=False,
+    progress=None,
+):
+    """Store the average yes vote of every user in user_base_colors.
+
+    average turns an iterable of colors into (hex, count) and must be
+    picklable for workers > 1.  With resume, continues after the checkpoint
+    of an interrupted rebuild.  progress(checkpoint, total_votes) is called
+    after every stored chunk.  Returns the final checkpoint.
+    """
+    c = conn.cursor()
+    checkpoint = load_checkpoint(c) if resume else None
+    if checkpoint is None:
+        checkpoint = save_checkpoint(c, BASE_COLORS_STAGE, None, 0, 0)
+        conn.commit()
+    if checkpoint["stage"] != BASE_COLORS_STAGE:
+        return checkpoint
+
+    total = None
+    if progress:
+        c.execute("SELECT COUNT(*) FROM votes WHERE is_anika_blue = 1")
+        total = c.fetchone()[0]
+
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    pending = deque()  # (last user_id, votes, future) in chunk order
+
+    def store(last_user_id, votes, future):
+        nonlocal checkpoint
+        base_colors = future.result()
+        delete_stale_base_colors(c, checkpoint["last_user_id"], last_user_id)
+        c.executemany(
+            """INSERT OR REPLACE INTO user_base_colors (user_id, base_color)
+               VALUES (?, ?)""",
+            base_colors,
+        )
+        checkpoint = save_checkpoint(
+            c,
+            BASE_COLORS_STAGE,
+            last_user_id,
+            checkpoint["users"] + len(base_colors),
+            checkpoint["votes"] + votes,
+        )
+        conn.commit()
+        if progress:
+            progress(checkpoint, total)
+
+    try:
+        after = checkpoint["last_user_id"]
+        while rows := read_chunk(c, after, chunk_size):
+            after = rows[-1][0]
+            if pool is None:
+                future = Future()
+                future.set_result(average_users(average, rows))
+            else:
+                future = pool.submit(average_users, average, rows)
+            pending.append((after, len(rows), future))
+            # Keep every worker busy while the oldest chunk is stored
+            while len(pending) > 2 * workers:
+                store(*pending.popleft())
+        while pending:
+            store(*pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    delete_stale_base_colors(c, checkpoint["last_user_id"], None)
+    checkpoint = save_checkpoint(
+        c,
+        AGGREGATES_STAGE,
+        checkpoint["last_user_id"],
+        checkpoint["users"],
+        checkpoint["votes"],
+    )
+    conn.commit()
+    return checkpoint
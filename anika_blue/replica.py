@@ -0,0 +1,167 @@
+"""Read-only replica of the database for the stats endpoints.
+
+``sync_replica`` ships the changes since the previous sync: it attaches the
+primary to the replica and, in one transaction, appends the rows of the
+``APPEND_ONLY_TABLES`` past the replica's highest id, re-copies the small
+``DERIVED_TABLES``, upserts the base colors changed since the last sync
+and stamps the time.  The primary is only read for those few rows, so
+writers are not held up by a copy of the whole database, and readers of
+the replica always see a complete, consistent state.
+
+Inserting the votes fires the replica's own cache generation triggers, so
+its ``votes`` generation matches the primary's unless votes were updated or
+deleted there.  In that case, on a schema change or for a new replica, the
+primary is copied whole into a ``.partial`` file with the online backup API
+and atomically renamed over the replica instead; connections opened before
+keep reading the previous file until they are closed.
+
+Every worker may run the sync periodically: an exclusive lock next to the
+replica and the stamped time make sure only one of them copies per
+interval.
+"""
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, every worker syncs on its own
+    fcntl = None
+
+META_TABLE = """CREATE TABLE IF NOT EXISTS replica_meta
+         (id INTEGER PRIMARY KEY CHECK (id = 1),
+          synced_at REAL NOT NULL)"""
+LOCK_SUFFIX = ".lock"
+PARTIAL_SUFFIX = ".partial"
+# Tables the app only appends to, shipped past the replica's highest id
+APPEND_ONLY_TABLES = ("votes", "shown_shades")
+# Small tables derived from the votes, copied whole on every sync
+DERIVED_TABLES = ("stats_snapshot", "vote_buckets", "vote_clusters", "sketch_state")
+
+
+def replica_synced_at(conn):
+    """When the primary was copied into the replica behind conn, or None"""
+    try:
+        row = conn.execute("SELECT synced_at FROM replica_meta").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def read_synced_at(replica):
+    if not Path(replica).exists():
+        return None
+    conn = sqlite3.connect(f"file:{replica}?mode=ro", uri=True)
+    try:
+        return replica_synced_at(conn)
+    finally:
+        conn.close()
+
+
+def schema(conn, name):
+    return conn.execute(f"""SELECT type, name, sql FROM {name}.sqlite_master
+            WHERE name != 'replica_meta' ORDER BY type, name""").fetchall()
+
+
+def votes_generation(conn, name):
+    row = conn.execute(
+        f"SELECT generation FROM {name}.cache_generations WHERE scope = 'votes'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def ship_changes(database, replica, synced_at):
+    """Apply the primary's changes to the replica, False if it needs a copy"""
+    conn = sqlite3.connect(replica, isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS source", (str(database),))
+        conn.execute("BEGIN IMMEDIATE")
+        previous = replica_synced_at(conn)
+        if previous is None or schema(conn, "main") != schema(conn, "source"):
+            conn.execute("ROLLBACK")
+            return False
+
+        tables = {name for _, name, _ in schema(conn, "main")}
+        for table in APPEND_ONLY_TABLES:
+            if table in tables:
+                conn.execute(f"""INSERT INTO main.{table} SELECT * FROM source.{table}
+                        WHERE id > (SELECT IFNULL(MAX(id), 0) FROM main.{table})
+                        ORDER BY id""")
+        for table in DERIVED_TABLES:
+            if table in tables:
+                conn.execute(f"DELETE FROM main.{table}")
+                conn.execute(f"INSERT INTO main.{table} SELECT * FROM source.{table}")
+        if "user_base_colors" in tables:
+            # Timestamps have a one second resolution
+            conn.execute(
+                """INSERT OR REPLACE INTO main.user_base_colors
+                   SELECT * FROM source.user_base_colors
+                   WHERE timestamp >= datetime(?, 'unixepoch', '-1 second')""",
+                (previous,),
+            )
+
+        # Votes of the primary were updated or deleted, not only appended
+        if "cache_generations" in tables and votes_generation(
+            conn, "main"
+        ) != votes_generation(conn, "source"):
+            conn.execute("ROLLBACK")
+            return False
+
+        conn.execute(
+            "UPDATE main.replica_meta SET synced_at = ? WHERE id = 1", (synced_at,)
+        )
+        conn.execute("COMMIT")
+        return True
+    finally:
+        conn.close()
+
+
+def copy_replica(database, replica, synced_at, pages=-1):
+    """Replace the replica by a full copy of the primary"""
+    partial = replica.with_name(replica.name + PARTIAL_SUFFIX)
+    source = sqlite3.connect(database)
+    destination = sqlite3.connect(partial)
+    try:
+        source.backup(destination, pages=pages)
+        destination.execute(META_TABLE)
+        destination.execute(
+            "INSERT OR REPLACE INTO replica_meta (id, synced_at) VALUES (1, ?)",
+            (synced_at,),
+        )
+        destination.commit()
+    finally:
+        destination.close()
+        source.close()
+
+    os.replace(partial, replica)
+
+
+def sync_replica(database, replica, min_interval: float = 0, pages: int = -1):
+    """Refresh the replica unless it is younger than min_interval seconds.
+
+    Ships the changes since the last sync when possible, otherwise copies
+    the whole primary pages at a time.  Returns the new sync time, or None
+    if the replica was fresh enough or another process is syncing it right
+    now.
+    """
+    replica = Path(replica)
+    lock = os.open(str(replica) + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+        synced_at = read_synced_at(replica)
+        if synced_at is not None and time.time() - synced_at < min_interval:
+            return None
+
+        synced_at = time.time()
+        if not (replica.exists() and ship_changes(database, replica, synced_at)):
+            copy_replica(database, replica, synced_at, pages)
+        return synced_at
+    finally:
+        os.close(lock)  # also releases the flock
@@ -0,0 +1,201 @@
+"""Streaming sketches of the votes that never need a scan of the table.
+
+Each worker updates small in-memory *delta* sketches in the request path and
+periodically merges them into the copy stored in the ``sketch_state`` table
+(``flush_sketch``), inside a write transaction so concurrent workers never
+lose each other's updates.  All sketches here are mergeable: merging the
+deltas of every worker gives the same guarantees as one sketch over the
+whole stream.
+
+``SpaceSaving`` finds the most frequent items (Metwally et al.) using
+``capacity`` counters: every reported count overestimates the true count by
+at most its ``error``, which is at most total / capacity, and every item
+occurring more often than that is guaranteed to be reported.
+
+``HyperLogLog`` estimates the number of distinct items (Flajolet et al.) in
+2 ** precision one-byte registers.  The relative standard error is
+1.04 / sqrt(2 ** precision), 1.6% for the default precision of 12 (4 KiB),
+so about 95% of the estimates are within 3.3% of the true count; small
+counts use linear counting and are close to exact.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+
+SKETCH_TABLE = """CREATE TABLE IF NOT EXISTS sketch_state
+         (name TEXT PRIMARY KEY,
+          version INTEGER NOT NULL,
+          state BLOB NOT NULL)"""
+
+
+class SpaceSaving:
+    """Top-k frequent items with bounded overestimation"""
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counters = {}  # item -> [count, error]
+        # Lazily updated min-heap of (count, item); stale entries are skipped
+        self.heap = []
+
+    def __len__(self):
+        return len(self.counters)
+
+    def min_count(self) -> int:
+        """Count of the smallest counter once full, the bound for unseen items"""
+        if len(self.counters) < self.capacity:
+            return 0
+        while True:
+            count, item = self.heap[0]
+            if self.counters.get(item, (None,))[0] == count:
+                return count
+            heapq.heappop(self.heap)
+
+    def add(self, item, weight: int = 1):
+        counter = self.counters.get(item)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = self.counters[item] = [0, 0]
+            else:
+                floor = self.min_count()
+                _, evicted = heapq.heappop(self.heap)
+                del self.counters[evicted]
+                counter = self.counters[item] = [floor, floor]
+        counter[0] += weight
+        heapq.heappush(self.heap, (counter[0], item))
+        if len(self.heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self.heap = [(count, item) for item, (count, _) in self.counters.items()]
+        heapq.heapify(self.heap)
+
+    def merge(self, other: "SpaceSaving"):
+        """Fold another sketch in, items missing on one side count its floor"""
+        own_floor, other_floor = self.min_count(), other.min_count()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(item, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(
+                item, (other_floor, other_floor)
+            )
+            merged[item] = [count + other_count, error + other_error]
+
+        kept = heapq.nlargest(
+            self.capacity, merged.items(), key=lambda entry: entry[1][0]
+        )
+        self.counters = {item: counter for item, counter in kept}
+        self._rebuild_heap()
+
+    def top(self, limit: int):
+        """[(item, count, error)] of the most frequent items, largest first"""
+        return [
+            (item, count, error)
+            for item, (count, error) in heapq.nlargest(
+                limit, self.counters.items(), key=lambda entry: entry[1][0]
+            )
+        ]
+
+    def to_bytes(self) -> bytes:
+        counters = [[item, count, error] for item, count, error in self.top(len(self))]
+        return json.dumps({"capacity": self.capacity, "counters": counters}).encode()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpaceSaving":
+        state = json.loads(data)
+        sketch = cls(state["capacity"])
+        sketch.counters = {
+            item: [count, error] for item, count, error in state["counters"]
+        }
+        sketch._rebuild_heap()
+        return sketch
+
+
+class HyperLogLog:
+    """Approximate count of distinct strings"""
+
+    # 2 ** -rank for every possible register value
+    POWERS = tuple(2.0**-rank for rank in range(65))
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def __bool__(self):
+        return any(self.registers)
+
+    def add(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "little")
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        # Position of the leftmost 1 bit in the remaining bits
+        rank = rest_bits - rest.bit_length() + 1
+        self.registers[index] = max(self.registers[index], rank)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> float:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        raw = alpha * size * size / sum(self.POWERS[rank] for rank in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * size and zeros:
+            return size * math.log(size / zeros)
+        return raw
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        sketch = cls(data[0])
+        sketch.registers = bytearray(data[1:])
+        return sketch
+
+
+def load_sketch(c, name, cls):
+    """(sketch, version) stored under name, or (None, 0)"""
+    c.execute("SELECT version, state FROM sketch_state WHERE name = ?", (name,))
+    row = c.fetchone()
+    if row is None:
+        return None, 0
+    return cls.from_bytes(row[1]), row[0]
+
+
+def sketch_version(c, name) -> int:
+    c.execute("SELECT version FROM sketch_state WHERE name = ?", (name,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def save_sketch(c, name, sketch):
+    c.execute(
+        """INSERT INTO sketch_state (name, version, state) VALUES (?, 1, ?)
+           ON CONFLICT(name) DO UPDATE SET
+               version = version + 1, state = excluded.state""",
+        (name, sketch.to_bytes()),
+    )
+
+
+def flush_sketch(conn, name, delta):
+    """Merge a worker's delta into the stored sketch, atomically"""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        stored, _ = load_sketch(c, name, type(delta))
+        if stored is None:
+            stored = delta
+        else:
+            stored.merge(delta)
+        save_sketch(c, name, stored)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return stored
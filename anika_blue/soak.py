@@ -0,0 +1,205 @@
+"""Soak test: drive a long mix of requests through the app and watch for drift.
+
+Requests go through Flask's test client, in-process, so the numbers reflect
+the application code rather than a WSGI server.  Every ``sample_every``
+requests a sample records the process RSS, the memory traced by
+``tracemalloc`` (with the allocation sites that grew most since the end of
+the warm-up), the file descriptors open on the database files and the
+latency percentiles of the requests since the previous sample.
+
+After the warm-up, which fills caches and pools, the growth of each series
+is fitted with a least-squares slope per 1000 requests and compared with
+the configured limits.  The result is a plain dict, meant to be written as
+JSON and compared between versions.
+"""
+
+import os
+import random
+import time
+import tracemalloc
+
+# Path, method and relative weight of the requests in the mix
+REQUEST_MIX = (
+    ("/next-shade", "GET", 30),
+    ("/vote", "POST", 30),
+    ("/stats", "GET", 25),
+    ("/favicon.ico", "GET", 10),
+    ("/load-base-color", "POST", 5),
+)
+# Series checked against a maximum slope (units per 1000 requests)
+SLOPE_SERIES = ("rss_bytes", "traced_bytes", "sqlite_fds", "p99_ms")
+
+
+def rss_bytes():
+    """Resident set size of this process, None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def open_database_files(database):
+    """Descriptors this process holds on the database and its journals"""
+    database = os.path.realpath(database)
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+    count = 0
+    for fd in fds:
+        try:
+            target = os.readlink(f"/proc/self/fd/{fd}")
+        except OSError:
+            continue
+        if target.startswith(database):
+            count += 1
+    return count
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def slope(points):
+    """Least-squares slope of (x, y) points, None for fewer than two"""
+    points = [(x, y) for x, y in points if y is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def top_growth(snapshot, baseline, limit):
+    """Allocation sites that grew most since the baseline snapshot"""
+    if baseline is None:
+        return []
+    return [
+        {"where": str(stat.traceback), "size_diff": stat.size_diff, "size": stat.size}
+        for stat in snapshot.compare_to(baseline, "lineno")[:limit]
+    ]
+
+
+def request_data(path, rng, generate_shade):
+    if path == "/vote":
+        vote = rng.choice(("yes", "yes", "no", "skip"))
+        return {"shade": generate_shade(), "vote": vote}
+    if path == "/load-base-color":
+        return {"base_color": generate_shade()}
+    return None
+
+
+def run_soak(
+    app,
+    database,
+    generate_shade,
+    requests=1_000_000,
+    sample_every=10_000,
+    warmup=20_000,
+    clients=50,
+    trace=True,
+    top_allocators=10,
+    seed=0,
+    progress=None,
+):
+    """Send a seeded random mix of requests, returns samples and slopes"""
+    rng = random.Random(seed)
+    paths, methods, weights = zip(*REQUEST_MIX)
+    sessions = [app.test_client() for _ in range(clients)]
+    # Restoring a session switches the client's user, keep that apart
+    restorer = app.test_client()
+
+    if trace:
+        tracemalloc.start()
+    baseline = None
+    samples = []
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    try:
+        for sent in range(1, requests + 1):
+            index = rng.choices(range(len(paths)), weights)[0]
+            path = paths[index]
+            client = restorer if path == "/load-base-color" else rng.choice(sessions)
+
+            before = time.perf_counter()
+            response = client.open(
+                path,
+                method=methods[index],
+                data=request_data(path, rng, generate_shade),
+            )
+            latencies.append(time.perf_counter() - before)
+            if response.status_code >= 500:
+                errors += 1
+            response.close()
+
+            if sent % sample_every and sent != requests:
+                continue
+
+            snapshot = None
+            if trace:
+                # Leave out what tracing itself allocates
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(False, tracemalloc.__file__)]
+                )
+            if trace and baseline is None and sent >= warmup:
+                baseline = snapshot
+            sample = {
+                "requests": sent,
+                "elapsed": time.perf_counter() - started,
+                "rss_bytes": rss_bytes(),
+                "traced_bytes": tracemalloc.get_traced_memory()[0] if trace else None,
+                "sqlite_fds": open_database_files(database),
+                "p50_ms": percentile(latencies, 0.5) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "errors": errors,
+                "top_allocators": (
+                    top_growth(snapshot, baseline, top_allocators) if trace else []
+                ),
+            }
+            samples.append(sample)
+            latencies.clear()
+            if progress:
+                progress(sample)
+    finally:
+        if trace:
+            tracemalloc.stop()
+
+    steady = [sample for sample in samples if sample["requests"] > warmup]
+    slopes = {
+        series: slope(
+            [(sample["requests"] / 1000, sample[series]) for sample in steady]
+        )
+        for series in SLOPE_SERIES
+    }
+    return {
+        "requests": requests,
+        "warmup": warmup,
+        "sample_every": sample_every,
+        "mix": {path: weight for path, _, weight in REQUEST_MIX},
+        "samples": samples,
+        "slopes": slopes,
+        "errors": errors,
+    }
+
+
+def check_slopes(result, limits):
+    """Descriptions of series growing faster than their limit (per 1000 requests)"""
+    failures = []
+    for series, limit in limits.items():
+        value = result["slopes"].get(series)
+        if limit is not None and value is not None and value > limit:
+            failures.append(
+                f"{series} grows by {value:.4g} per 1000 requests (limit {limit:.4g})"
+            )
+    if result["errors"]:
+        failures.append(f"{result['errors']} requests failed with a server error")
+    return failures
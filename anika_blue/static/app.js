@@ -0,0 +1,1002 @@
+let currentShade = null;
+let currentUserBaseColor = null;
+let currentGlobalBaseColor = null;
+const HEX_COLOR_REGEX = /^#[0-9a-f]{6}$/i;
+
+function startLiveReload() {
+    if (!DEBUG_MODE || !LIVE_RELOAD_POLL_MS) {
+        return;
+    }
+
+    const pollInterval = Math.max(750, LIVE_RELOAD_POLL_MS);
+    const endpoint = '/__livereload';
+    let stopped = false;
+    let intervalId;
+
+    async function poll() {
+        if (stopped) {
+            return;
+        }
+
+        try {
+            const response = await fetch(endpoint, { cache: 'no-store' });
+
+            if (!response.ok) {
+                if (response.status === 404) {
+                    stopped = true;
+                    if (intervalId) {
+                        clearInterval(intervalId);
+                    }
+                }
+                return;
+            }
+
+            const data = await response.json();
+            if (!data?.version) {
+                return;
+            }
+
+            if (liveReloadToken && data.version === liveReloadToken) {
+                return;
+            }
+
+            liveReloadToken = data.version;
+            window.location.reload();
+        } catch (error) {
+            console.debug('Live reload poll failed', error);
+        }
+    }
+
+    poll();
+    intervalId = setInterval(poll, pollInterval);
+}
+
+async function loadNextShade() {
+    try {
+        const response = await fetch('/next-shade');
+        if (!response.ok) {
+            console.warn('Could not load next shade:', response.status);
+            return;
+        }
+        const html = await response.text();
+
+        // Extract the shade from the response
+        const tempDiv = document.createElement('div');
+        tempDiv.innerHTML = html;
+        const shadeElement = tempDiv.querySelector('.shade-display');
+        const newShade = shadeElement ? shadeElement.getAttribute('data-shade') || shadeElement.dataset.shade || null : null;
+        let newShadeName = shadeElement ? shadeElement.getAttribute('data-shade-name') || shadeElement.dataset.shadeName || null : null;
+        const newShadeCombined = shadeElement ? shadeElement.getAttribute('data-shade-combined') || shadeElement.dataset.shadeCombined || null : null;
+        const hexElement = tempDiv.querySelector('.hex-code');
+        const newHex = hexElement ? hexElement.textContent.trim() : null;
+        const nameElement = tempDiv.querySelector('.shade-name');
+        if (!newShadeName && nameElement) {
+            newShadeName = nameElement.textContent.trim();
+        }
+        const combinedText = newShadeCombined || (nameElement ? nameElement.textContent.trim() : null);
+
+        if (!newShade || !newHex) {
+            console.error('Could not extract shade from response');
+            return;
+        }
+
+        // Get existing elements
+        const shadeContainer = document.getElementById('shade-container');
+        let existingShadeDisplay = shadeContainer.querySelector('.shade-display');
+        let existingHexCode = shadeContainer.querySelector('.hex-code');
+        let existingControls = shadeContainer.querySelector('.controls');
+        let existingShadeName = shadeContainer.querySelector('.shade-name');
+
+        if (!existingShadeDisplay || !existingHexCode || !existingControls || !existingShadeName) {
+            shadeContainer.innerHTML = html;
+            existingShadeDisplay = shadeContainer.querySelector('.shade-display');
+            existingHexCode = shadeContainer.querySelector('.hex-code');
+            existingControls = shadeContainer.querySelector('.controls');
+            existingShadeName = shadeContainer.querySelector('.shade-name');
+        }
+
+        // Fade out hex code, update it, then fade in
+        existingHexCode.style.opacity = '0';
+        setTimeout(() => {
+            existingHexCode.textContent = newHex;
+            const labelParts = [];
+            if (newHex) {
+                labelParts.push(newHex);
+            }
+            if (combinedText) {
+                labelParts.push(combinedText);
+            }
+            existingHexCode.setAttribute('aria-label', `Copy ${labelParts.join(' ')} to clipboard`);
+            existingHexCode.setAttribute('title', 'Tap to copy');
+            existingHexCode.style.opacity = '1';
+            if (existingShadeName) {
+                const combined = combinedText || '';
+                existingShadeName.textContent = combined;
+                existingShadeName.setAttribute('data-copy-text', combined);
+                existingShadeName.setAttribute('aria-label', `Copy ${combined}`);
+            }
+        }, 150);
+        if (existingShadeDisplay && newShade) {
+            existingShadeDisplay.setAttribute('data-shade', newShade);
+            if (newShadeName) {
+                existingShadeDisplay.setAttribute('data-shade-name', newShadeName);
+            }
+            if (combinedText) {
+                existingShadeDisplay.setAttribute('data-shade-combined', combinedText);
+            } else {
+                existingShadeDisplay.removeAttribute('data-shade-combined');
+            }
+        }
+        if (existingControls) {
+            existingControls.style.removeProperty('background-color');
+            existingControls.style.removeProperty('color');
+        }
+
+        currentShade = newShade;
+        updateShadeContext(newShade);
+
+        // Reattach button listeners (in case controls were replaced)
+        attachButtonListeners();
+        attachCopyableText(shadeContainer);
+    } catch (error) {
+        console.error('Error loading shade:', error);
+    }
+}
+
+async function loadStats() {
+    try {
+        const response = await fetch('/stats');
+        if (!response.ok) {
+            console.warn('Could not load stats:', response.status);
+            return;
+        }
+        const html = await response.text();
+        document.getElementById('stats-container').innerHTML = html;
+        updateStoredColorsFromStats();
+    } catch (error) {
+        console.error('Error loading stats:', error);
+    }
+}
+
+async function submitVote(voteValue) {
+    const hexMatch = document.querySelector('.hex-code');
+    if (!hexMatch) return;
+
+    const shade = hexMatch.textContent.trim();
+
+    const formData = new FormData();
+    formData.append('shade', shade);
+    formData.append('vote', voteValue);
+
+    try {
+        const response = await fetch('/vote', {
+            method: 'POST',
+            body: formData
+        });
+        if (!response.ok) {
+            // e.g. 429 when voting too fast; the vote was not recorded
+            console.warn('Vote rejected:', response.status);
+            return;
+        }
+        const html = await response.text();
+        document.getElementById('stats-container').innerHTML = html;
+        updateStoredColorsFromStats();
+
+        // Update favicon after voting
+        updateFavicon();
+
+        const historyDetails = document.getElementById('history');
+        if (historyDetails && historyDetails.open) {
+            resetHistory();
+            loadHistoryPage();
+        }
+
+        // Load next shade with smooth transition (no delay needed)
+        loadNextShade();
+    } catch (error) {
+        console.error('Error voting:', error);
+    }
+}
+
+// generation counts resets; a page requested before the last reset is stale
+const historyState = { cursor: null, loading: false, done: false, observer: null, generation: 0 };
+
+function resetHistory() {
+    historyState.generation += 1;
+    historyState.cursor = null;
+    historyState.loading = false;
+    historyState.done = false;
+    const list = document.getElementById('history-list');
+    if (list) {
+        list.innerHTML = '';
+    }
+}
+
+function renderHistoryItem(item) {
+    const li = document.createElement('li');
+    const swatch = document.createElement('span');
+    swatch.className = 'history-swatch';
+    swatch.style.backgroundColor = item.hex;
+    const hex = document.createElement('span');
+    hex.className = 'history-hex';
+    hex.textContent = item.hex;
+    const name = document.createElement('span');
+    name.className = 'history-name';
+    name.textContent = item.css_name ? `${item.descriptive_name} / ${item.css_name}` : item.descriptive_name;
+    const verdict = document.createElement('span');
+    verdict.textContent = item.anika_blue ? '✓' : '❌';
+    verdict.title = item.anika_blue ? 'Anika Blue' : 'Not Anika Blue';
+    li.append(swatch, hex, name, verdict);
+    return li;
+}
+
+async function loadHistoryPage() {
+    if (historyState.loading || historyState.done) {
+        return;
+    }
+
+    const list = document.getElementById('history-list');
+    const status = document.getElementById('history-sentinel');
+    const generation = historyState.generation;
+    const isStale = () => generation !== historyState.generation;
+    historyState.loading = true;
+    try {
+        const params = new URLSearchParams();
+        if (historyState.cursor !== null) {
+            params.set('before', historyState.cursor);
+        }
+        const response = await fetch(`/history?${params}`);
+        if (isStale()) {
+            return;
+        }
+        if (!response.ok) {
+            console.warn('Could not load history:', response.status);
+            return;
+        }
+        const data = await response.json();
+        if (isStale()) {
+            return;
+        }
+        data.items.forEach((item) => list.appendChild(renderHistoryItem(item)));
+        historyState.cursor = data.next_cursor;
+        historyState.done = data.next_cursor === null;
+        if (status) {
+            status.textContent = historyState.done && !list.children.length ? 'No votes yet' : '';
+        }
+        if (historyState.observer && status && !historyState.done) {
+            // Re-observe so a sentinel that is still visible fetches another page
+            historyState.observer.unobserve(status);
+            historyState.observer.observe(status);
+        }
+    } catch (error) {
+        if (!isStale()) {
+            console.error('Error loading history:', error);
+        }
+    } finally {
+        // A reset already cleared the flag, and a newer request may own it
+        if (!isStale()) {
+            historyState.loading = false;
+        }
+    }
+}
+
+function setupHistory() {
+    const details = document.getElementById('history');
+    const scroller = document.getElementById('history-scroll');
+    const sentinel = document.getElementById('history-sentinel');
+    if (!details || !scroller || !sentinel) {
+        return;
+    }
+
+    // Infinite scroll: fetch the next page whenever the sentinel scrolls into view
+    if ('IntersectionObserver' in window) {
+        historyState.observer = new IntersectionObserver((entries) => {
+            if (details.open && entries.some((entry) => entry.isIntersecting)) {
+                loadHistoryPage();
+            }
+        }, { root: scroller });
+        historyState.observer.observe(sentinel);
+    }
+
+    details.addEventListener('toggle', () => {
+        if (details.open) {
+            resetHistory();
+            loadHistoryPage();
+        }
+    });
+}
+
+function attachButtonListeners() {
+    attachVoteHandler('.btn-yes', 'yes');
+    attachVoteHandler('.btn-no', 'no');
+    attachHexCopy();
+}
+
+function attachVoteHandler(selector, voteType) {
+    const button = document.querySelector(selector);
+    if (!button) {
+        return;
+    }
+
+    button.onclick = (e) => {
+        const target = e.currentTarget;
+        target.classList.add('animate-success');
+        setTimeout(() => target.classList.remove('animate-success'), 400);
+        submitVote(voteType);
+    };
+}
+
+function attachHexCopy() {
+    const hexEl = document.querySelector('.hex-code.copyable');
+    if (!hexEl) {
+        return;
+    }
+
+    hexEl.onclick = copyCurrentShadeHex;
+    hexEl.onkeydown = (evt) => {
+        if (evt.key === 'Enter' || evt.key === ' ' || evt.key === 'Spacebar') {
+            evt.preventDefault();
+            copyCurrentShadeHex({ currentTarget: hexEl });
+        }
+    };
+}
+
+async function copyCurrentShadeHex(event) {
+    try {
+        const hexEl = event?.currentTarget || document.querySelector('.hex-code.copyable');
+        const shadeValue = hexEl ? hexEl.textContent.trim() : '';
+        if (!shadeValue) {
+            showMessage('shade-message', 'No color to copy yet', 'error');
+            return;
+        }
+
+        const normalized = normalizeHex(shadeValue);
+        if (!normalized || !HEX_COLOR_REGEX.test(normalized)) {
+            showMessage('shade-message', 'Invalid color value', 'error');
+            return;
+        }
+
+        const copied = await copyTextToClipboard(normalized);
+        if (copied) {
+            showMessage('shade-message', `Color ${normalized} copied to clipboard!`, 'success', normalized);
+        } else {
+            showMessage('shade-message', 'Unable to copy color to clipboard', 'error');
+        }
+    } catch (error) {
+        console.error('Error copying current shade:', error);
+        showMessage('shade-message', 'Unable to copy color to clipboard', 'error');
+    }
+}
+
+function generateComplementaryBackground(hex) {
+    if (!hex || !HEX_COLOR_REGEX.test(hex)) {
+        return null;
+    }
+
+    // Extract RGB values
+    const r = parseInt(hex.slice(1, 3), 16);
+    const g = parseInt(hex.slice(3, 5), 16);
+    const b = parseInt(hex.slice(5, 7), 16);
+
+    // Convert to HSL for easier manipulation
+    const r_norm = r / 255;
+    const g_norm = g / 255;
+    const b_norm = b / 255;
+
+    const max = Math.max(r_norm, g_norm, b_norm);
+    const min = Math.min(r_norm, g_norm, b_norm);
+    const diff = max - min;
+
+    // Calculate lightness
+    const lightness = (max + min) / 2;
+
+    // Calculate saturation
+    let saturation = 0;
+    if (diff !== 0) {
+        saturation = lightness > 0.5 ? diff / (2 - max - min) : diff / (max + min);
+    }
+
+    // Calculate hue
+    let hue = 0;
+    if (diff !== 0) {
+        if (max === r_norm) hue = ((g_norm - b_norm) / diff + (g_norm < b_norm ? 6 : 0)) / 6;
+        else if (max === g_norm) hue = ((b_norm - r_norm) / diff + 2) / 6;
+        else hue = ((r_norm - g_norm) / diff + 4) / 6;
+    }
+
+    // Create a background that's more contrasted:
+    // - Shift hue by 15-30 degrees for subtle difference
+    // - Adjust lightness to create contrast
+    // - Reduce saturation slightly for background feel
+
+    let bgHue = (hue + 0.08) % 1; // Shift hue by ~30 degrees
+    let bgSaturation = Math.max(0.1, saturation * 0.7); // Reduce saturation
+    let bgLightness = lightness;
+
+    // Adjust lightness for better contrast
+    if (lightness > 0.6) {
+        bgLightness = Math.max(0.2, lightness - 0.4); // Darker background for light colors
+    } else {
+        bgLightness = Math.min(0.8, lightness + 0.3); // Lighter background for dark colors
+    }
+
+    // Convert HSL back to RGB
+    function hslToRgb(h, s, l) {
+        const hue2rgb = (p, q, t) => {
+            if (t < 0) t += 1;
+            if (t > 1) t -= 1;
+            if (t < 1/6) return p + (q - p) * 6 * t;
+            if (t < 1/2) return q;
+            if (t < 2/3) return p + (q - p) * (2/3 - t) * 6;
+            return p;
+        };
+
+        let r, g, b;
+        if (s === 0) {
+            r = g = b = l; // achromatic
+        } else {
+            const q = l < 0.5 ? l * (1 + s) : l + s - l * s;
+            const p = 2 * l - q;
+            r = hue2rgb(p, q, h + 1/3);
+            g = hue2rgb(p, q, h);
+            b = hue2rgb(p, q, h - 1/3);
+        }
+
+        return [Math.round(r * 255), Math.round(g * 255), Math.round(b * 255)];
+    }
+
+    const [bgR, bgG, bgB] = hslToRgb(bgHue, bgSaturation, bgLightness);
+    return `#${bgR.toString(16).padStart(2, '0')}${bgG.toString(16).padStart(2, '0')}${bgB.toString(16).padStart(2, '0')}`;
+}
+
+function updateShadeContext(color) {
+    const normalized = normalizeHex(color);
+    const root = document.documentElement;
+    const hasValidShade = normalized && HEX_COLOR_REGEX.test(normalized);
+
+    if (hasValidShade) {
+        // Generate a complementary background color
+        const backgroundHex = generateComplementaryBackground(normalized);
+
+        if (backgroundHex) {
+            root.style.setProperty('--page-background', backgroundHex);
+            const pageTextColor = getReadableTextColor(backgroundHex);
+            root.style.setProperty('--page-foreground', pageTextColor);
+        } else {
+            // Fallback to original color if generation fails
+            root.style.setProperty('--page-background', normalized);
+            const pageTextColor = getReadableTextColor(normalized);
+            root.style.setProperty('--page-foreground', pageTextColor);
+        }
+
+        // Set the exact color for the shade preview
+        root.style.setProperty('--shade-color', normalized);
+    } else {
+        root.style.removeProperty('--page-background');
+        root.style.removeProperty('--page-foreground');
+        root.style.removeProperty('--shade-color');
+    }
+}
+
+async function saveBaseColor(event, overrideHex = null) {
+    const saveBtn = event?.currentTarget || event?.target;
+    if (saveBtn) {
+        saveBtn.classList.add('animate-success');
+        setTimeout(() => saveBtn.classList.remove('animate-success'), 400);
+    }
+
+    const colorToCopy = overrideHex || currentUserBaseColor || currentGlobalBaseColor;
+    if (!colorToCopy) {
+        showMessage('save-message', 'No color available yet. Make a selection first!', 'error');
+        return;
+    }
+
+    const normalizedColor = ensureHexPrefix(colorToCopy);
+
+    try {
+        const copied = await copyTextToClipboard(normalizedColor);
+        if (copied) {
+            showMessage('save-message', `Color ${normalizedColor} copied to clipboard!`, 'success', normalizedColor);
+        } else {
+            showMessage('save-message', 'Unable to copy color to clipboard', 'error');
+        }
+    } catch (error) {
+        console.error('Error copying base color:', error);
+        showMessage('save-message', 'Unable to copy color to clipboard', 'error');
+    }
+}
+
+async function loadBaseColor(event) {
+    const baseInput = document.getElementById('base-color-input');
+    const baseColor = baseInput ? baseInput.value.trim() : '';
+
+    updateRestorePreview(baseColor);
+
+    if (!baseColor) {
+        setRestoreInlineMessage('Please enter a color hex code', 'error');
+        if (baseInput) {
+            baseInput.focus();
+            baseInput.select();
+        }
+        return;
+    }
+
+    const loadBtn = event?.currentTarget || event?.target;
+    if (loadBtn) {
+        loadBtn.classList.add('animate-success');
+        setTimeout(() => loadBtn.classList.remove('animate-success'), 400);
+    }
+
+    const normalizedInput = normalizeHex(baseColor);
+    const isValidHex = normalizedInput && HEX_COLOR_REGEX.test(normalizedInput);
+    const normalizedUser = normalizeHex(currentUserBaseColor);
+
+    if (!isValidHex) {
+        setRestoreInlineMessage('Enter a valid 6-digit hex color', 'error');
+        showMessage('restore-message', 'Invalid color value', 'error');
+        if (baseInput) {
+            baseInput.focus();
+            baseInput.select();
+        }
+        return;
+    }
+
+    if (normalizedUser && normalizedInput === normalizedUser) {
+        closeRestoreModal();
+        showMessage('restore-message', 'Already using this Anika Blue. Refreshing...', 'success');
+        setTimeout(() => {
+            loadStats();
+            loadNextShade();
+            updateFavicon();
+        }, 500);
+        if (baseInput) {
+            baseInput.value = '';
+        }
+        return;
+    }
+
+    clearRestoreInlineMessage();
+    closeRestoreModal();
+
+    const formData = new FormData();
+    formData.append('base_color', normalizedInput);
+
+    try {
+        const response = await fetch('/load-base-color', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+
+        if (data.success) {
+            showMessage('restore-message', 'Session restored! Reloading...', 'success');
+            // Reload stats and shade after a brief delay
+            setTimeout(() => {
+                loadStats();
+                loadNextShade();
+                updateFavicon();
+                if (baseInput) {
+                    baseInput.value = '';
+                }
+            }, 1000);
+        } else {
+            showMessage('restore-message', data.error || 'Failed to load color', 'error');
+        }
+    } catch (error) {
+        console.error('Error loading base color:', error);
+        showMessage('restore-message', 'Error loading color', 'error');
+    }
+}
+
+function openRestoreModal(event) {
+    const trigger = event?.currentTarget || event?.target;
+    if (trigger && !trigger.classList.contains('restore-pill')) {
+        trigger.classList.add('animate-success');
+        setTimeout(() => trigger.classList.remove('animate-success'), 400);
+    }
+
+    const modal = document.getElementById('restore-modal');
+    if (!modal) return;
+    modal.classList.add('visible');
+
+    const input = document.getElementById('base-color-input');
+    clearRestoreInlineMessage();
+    if (input) {
+        const defaultValue = currentUserBaseColor || currentGlobalBaseColor || '';
+        input.value = defaultValue;
+        updateRestorePreview(defaultValue);
+        // Delay focus slightly to ensure visibility on mobile keyboards
+        setTimeout(() => {
+            input.focus();
+            input.select();
+        }, 50);
+    }
+}
+
+function closeRestoreModal() {
+    const modal = document.getElementById('restore-modal');
+    if (!modal) return;
+    modal.classList.remove('visible');
+    clearRestoreInlineMessage();
+    updateRestorePreview(currentUserBaseColor || currentGlobalBaseColor || '');
+}
+
+function updateStoredColorsFromStats() {
+    const container = document.getElementById('stats-container');
+    if (!container) {
+        return;
+    }
+
+    const userEl = container.querySelector('[data-color-role="user"]');
+    const globalEl = container.querySelector('[data-color-role="global"]');
+
+    currentUserBaseColor = userEl ? userEl.textContent.trim() : null;
+    currentGlobalBaseColor = globalEl ? globalEl.textContent.trim() : null;
+
+    const copyTargets = container.querySelectorAll('.color-swatch.copyable');
+    copyTargets.forEach((swatch) => {
+        const role = swatch.dataset.copyRole;
+        swatch.onclick = (evt) => {
+            evt.preventDefault();
+            const overrideColor = role === 'user' ? currentUserBaseColor : role === 'global' ? currentGlobalBaseColor : null;
+            saveBaseColor(evt, overrideColor);
+        };
+        swatch.onkeydown = (evt) => {
+            if (evt.key === 'Enter' || evt.key === ' ' || evt.key === 'Spacebar') {
+                evt.preventDefault();
+                const overrideColor = role === 'user' ? currentUserBaseColor : role === 'global' ? currentGlobalBaseColor : null;
+                saveBaseColor({ currentTarget: swatch }, overrideColor);
+            }
+        };
+    });
+
+    attachCopyableText(container);
+
+    const preview = document.getElementById('restore-color-preview');
+    if (preview) {
+        preview.onclick = copyRestorePreview;
+        preview.onkeydown = (evt) => {
+            if (evt.key === 'Enter' || evt.key === ' ' || evt.key === 'Spacebar') {
+                evt.preventDefault();
+                copyRestorePreview({ currentTarget: preview });
+            }
+        };
+    }
+
+    const restoreModal = document.getElementById('restore-modal');
+    if (!restoreModal || !restoreModal.classList.contains('visible')) {
+        updateRestorePreview(currentUserBaseColor || currentGlobalBaseColor || '');
+    }
+}
+
+function normalizeHex(hex) {
+    if (!hex) {
+        return null;
+    }
+    let value = hex.trim().toLowerCase();
+    if (!value.startsWith('#')) {
+        value = `#${value}`;
+    }
+    return value;
+}
+
+function ensureHexPrefix(hex) {
+    if (!hex) {
+        return hex;
+    }
+    return hex.trim().startsWith('#') ? hex.trim() : `#${hex.trim()}`;
+}
+
+async function copyTextToClipboard(text) {
+    if (!text) {
+        return false;
+    }
+
+    const value = String(text);
+
+    if (navigator.clipboard && navigator.clipboard.writeText) {
+        try {
+            await navigator.clipboard.writeText(value);
+            return true;
+        } catch (clipboardError) {
+            if (clipboardError && clipboardError.name !== 'NotAllowedError') {
+                console.warn('navigator.clipboard.writeText failed, falling back', clipboardError);
+            }
+        }
+    }
+
+    let textarea;
+    try {
+        textarea = document.createElement('textarea');
+        textarea.value = value;
+        textarea.setAttribute('readonly', '');
+        textarea.style.position = 'fixed';
+        textarea.style.top = '-1000px';
+        textarea.style.opacity = '0';
+        document.body.appendChild(textarea);
+        textarea.select();
+        textarea.setSelectionRange(0, value.length);
+        const successful = document.execCommand('copy');
+        return successful;
+    } catch (fallbackError) {
+        console.error('Fallback clipboard copy failed:', fallbackError);
+        return false;
+    } finally {
+        if (textarea && textarea.parentNode) {
+            textarea.parentNode.removeChild(textarea);
+        }
+    }
+}
+
+function attachCopyableText(root = document) {
+    const elements = root.querySelectorAll('[data-copy-text]');
+    elements.forEach((el) => {
+        if (el.dataset.copyBound === 'true') {
+            return;
+        }
+        const value = el.getAttribute('data-copy-text');
+        if (!value) {
+            return;
+        }
+        const trimmedValue = value.trim();
+        if (!trimmedValue) {
+            return;
+        }
+        if (el.classList.contains('hex-code')) {
+            return;
+        }
+
+        const handleCopy = async (evt) => {
+            evt.preventDefault();
+            evt.stopPropagation();
+            try {
+                const copied = await copyTextToClipboard(trimmedValue);
+                if (copied) {
+                    if (HEX_COLOR_REGEX.test(trimmedValue)) {
+                        showMessage('shade-message', `Color ${trimmedValue} copied to clipboard!`, 'success', trimmedValue);
+                    } else {
+                        showMessage('shade-message', `"${trimmedValue}" copied to clipboard!`, 'success');
+                    }
+                } else {
+                    showMessage('shade-message', 'Unable to copy value', 'error');
+                }
+            } catch (error) {
+                console.error('Error copying text value:', error);
+                showMessage('shade-message', 'Unable to copy value', 'error');
+            }
+        };
+
+        el.addEventListener('click', handleCopy);
+        el.addEventListener('keydown', (evt) => {
+            if (evt.key === 'Enter' || evt.key === ' ' || evt.key === 'Spacebar') {
+                handleCopy(evt);
+            }
+        });
+        el.addEventListener('touchend', (evt) => {
+            handleCopy(evt);
+        });
+        el.dataset.copyBound = 'true';
+    });
+}
+
+function getReadableTextColor(hex) {
+    if (!hex || !HEX_COLOR_REGEX.test(hex)) {
+        return '#1f2933';
+    }
+    const r = parseInt(hex.slice(1, 3), 16);
+    const g = parseInt(hex.slice(3, 5), 16);
+    const b = parseInt(hex.slice(5, 7), 16);
+    const luminance = (0.299 * r + 0.587 * g + 0.114 * b) / 255;
+    return luminance > 0.6 ? '#1f2933' : '#fdfdfd';
+}
+
+function updateRestorePreview(rawValue) {
+    const preview = document.getElementById('restore-color-preview');
+    const input = document.getElementById('base-color-input');
+    if (!preview) {
+        return;
+    }
+
+    const normalized = normalizeHex(rawValue);
+    const isValid = normalized && HEX_COLOR_REGEX.test(normalized);
+
+    if (input) {
+        input.classList.toggle('invalid', !isValid && rawValue.trim() !== '');
+        input.classList.toggle('valid', !!isValid);
+    }
+
+    if (isValid) {
+        preview.style.background = normalized;
+        preview.style.backgroundColor = normalized;
+        preview.style.borderColor = 'rgba(0, 0, 0, 0.1)';
+        preview.title = normalized;
+        preview.setAttribute('data-valid', 'true');
+    } else {
+        preview.style.background = '';
+        preview.style.backgroundColor = '';
+        preview.style.borderColor = rawValue.trim() ? '#f5b1b8' : '#e0e0e0';
+        preview.removeAttribute('title');
+        preview.setAttribute('data-valid', 'false');
+    }
+
+    const copyBtn = document.getElementById('restore-copy-btn');
+    if (copyBtn) {
+        copyBtn.disabled = !isValid;
+    }
+}
+
+function setRestoreInlineMessage(message, type) {
+    const messageEl = document.getElementById('restore-inline-message');
+    if (!messageEl) return;
+    messageEl.textContent = message;
+    messageEl.classList.remove('error', 'success');
+    if (type) {
+        messageEl.classList.add(type);
+    }
+}
+
+function clearRestoreInlineMessage() {
+    setRestoreInlineMessage('', null);
+}
+
+async function copyRestoreColor(event) {
+    const button = event?.currentTarget || event?.target;
+    const input = document.getElementById('base-color-input');
+    if (button && button.disabled) {
+        return;
+    }
+    if (button) {
+        button.classList.add('copy-feedback');
+        setTimeout(() => button.classList.remove('copy-feedback'), 250);
+    }
+
+    if (!input) {
+        showMessage('restore-message', 'No color to copy yet', 'error');
+        return;
+    }
+
+    const normalized = normalizeHex(input.value);
+
+    if (!normalized || !HEX_COLOR_REGEX.test(normalized)) {
+        setRestoreInlineMessage('Enter a valid 6-digit hex color first', 'error');
+        showMessage('restore-message', 'Invalid color value', 'error');
+        if (input) {
+            input.focus();
+            input.select();
+        }
+        return;
+    }
+
+    try {
+        const copied = await copyTextToClipboard(normalized);
+        if (copied) {
+            showMessage('restore-message', `Color ${normalized} copied to clipboard!`, 'success', normalized);
+        } else {
+            showMessage('restore-message', 'Unable to copy color', 'error');
+        }
+    } catch (error) {
+        console.error('Error copying restore color:', error);
+        showMessage('restore-message', 'Unable to copy color', 'error');
+    }
+}
+
+async function copyRestorePreview(event) {
+    const input = document.getElementById('base-color-input');
+    if (!input) {
+        showMessage('restore-message', 'No color to copy yet', 'error');
+        return;
+    }
+
+    const normalized = normalizeHex(input.value);
+
+    if (!normalized || !HEX_COLOR_REGEX.test(normalized)) {
+        setRestoreInlineMessage('Enter a valid 6-digit hex color first', 'error');
+        showMessage('restore-message', 'Invalid color value', 'error');
+        if (input) {
+            input.focus();
+            input.select();
+        }
+        return;
+    }
+
+    try {
+        const copied = await copyTextToClipboard(normalized);
+        if (copied) {
+            showMessage('restore-message', `Color ${normalized} copied to clipboard!`, 'success', normalized);
+        } else {
+            showMessage('restore-message', 'Unable to copy color', 'error');
+        }
+    } catch (error) {
+        console.error('Error copying restore color:', error);
+        showMessage('restore-message', 'Unable to copy color', 'error');
+    }
+}
+
+function updateFavicon() {
+    // Force favicon refresh by adding a timestamp
+    const link = document.querySelector("link[rel='icon']");
+    if (link) {
+        link.href = '/favicon.ico?' + new Date().getTime();
+    }
+}
+
+function showMessage(elementId, message, type, highlightHex = null) {
+    document.querySelectorAll('.toast').forEach((toast) => toast.remove());
+    // Create toast element
+    const toast = document.createElement('div');
+    toast.className = `toast ${type}`;
+    if (highlightHex) {
+        const normalizedHighlight = normalizeHex(highlightHex);
+        const idx = message.indexOf(normalizedHighlight);
+        if (normalizedHighlight && idx >= 0) {
+            const before = message.slice(0, idx);
+            const after = message.slice(idx + normalizedHighlight.length);
+
+            toast.append(document.createTextNode(before));
+
+            const chip = document.createElement('span');
+            chip.className = 'toast-color-chip';
+            chip.textContent = normalizedHighlight;
+            chip.style.background = normalizedHighlight;
+            chip.style.color = getReadableTextColor(normalizedHighlight);
+            toast.append(chip);
+
+            toast.append(document.createTextNode(after));
+        } else {
+            toast.textContent = message;
+        }
+    } else {
+        toast.textContent = message;
+    }
+
+    // Add to body
+    document.body.appendChild(toast);
+
+    // Remove after animation completes
+    setTimeout(() => {
+        toast.remove();
+    }, 5000);
+}
+
+// Pick up the first card rendered by the server, returns false if there is none
+function initRenderedShade() {
+    const shadeContainer = document.getElementById('shade-container');
+    const shadeElement = shadeContainer ? shadeContainer.querySelector('.shade-display') : null;
+    if (!shadeElement || !shadeElement.dataset.shade) {
+        return false;
+    }
+    currentShade = shadeElement.dataset.shade;
+    updateShadeContext(currentShade);
+    attachButtonListeners();
+    return true;
+}
+
+// Initialize on load
+document.addEventListener('DOMContentLoaded', () => {
+    if (!initRenderedShade()) {
+        loadNextShade();
+    }
+    if (document.querySelector('#stats-container .stats-container')) {
+        updateStoredColorsFromStats();
+    } else {
+        loadStats();
+    }
+    startLiveReload();
+    setupHistory();
+
+    const baseInput = document.getElementById('base-color-input');
+    if (baseInput) {
+        baseInput.addEventListener('input', (evt) => {
+            updateRestorePreview(evt.target.value);
+        });
+        updateRestorePreview(baseInput.value);
+    }
+
+    attachCopyableText(document);
+
+    document.addEventListener('keydown', (evt) => {
+        if (evt.key === 'Escape') {
+            closeRestoreModal();
+        }
+    });
+});
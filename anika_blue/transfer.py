@@ -0,0 +1,134 @@
+"""Streaming export and bulk import of the Anika Blue tables.
+
+Exports walk a table in ``FETCH_SIZE`` pages by rowid and yield encoded
+lines, so memory use does not depend on the table size.  Every page is its
+own short query: a slow download never holds a read lock that would block
+writers.  Imports insert with ``executemany`` in batches and only commit
+every ``IMPORT_TRANSACTION_SIZE`` rows.
+
+Exported ids are only kept when importing into an empty table, or with
+``replace`` which overwrites rows with the same key; otherwise the rows get
+new ids so they never replace existing ones.
+"""
+
+import csv
+import io
+import json
+from itertools import islice
+
+EXPORT_TABLES = {
+    "votes": ("id", "user_id", "hex_color", "is_anika_blue", "timestamp"),
+    "shown_shades": ("id", "user_id", "hex_color", "timestamp"),
+    "user_base_colors": ("user_id", "base_color", "timestamp"),
+}
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+FETCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 10_000
+IMPORT_TRANSACTION_SIZE = 200_000
+
+
+def iter_rows(conn, table):
+    """Yield all rows of an exportable table in rowid order, page by page"""
+    columns = EXPORT_TABLES[table]
+    query = (
+        f"SELECT rowid, {', '.join(columns)} FROM {table} "
+        "WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    )
+    last = -1
+    while rows := conn.execute(query, (last, FETCH_SIZE)).fetchall():
+        last = rows[-1][0]
+        for row in rows:
+            yield tuple(row)[1:]
+
+
+def iter_csv(conn, table):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_TABLES[table])
+
+    for count, row in enumerate(iter_rows(conn, table), start=1):
+        writer.writerow(tuple(row))
+        if count % FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_ndjson(conn, table):
+    columns = EXPORT_TABLES[table]
+    lines = []
+    for row in iter_rows(conn, table):
+        lines.append(json.dumps(dict(zip(columns, row))) + "\n")
+        if len(lines) == FETCH_SIZE:
+            yield "".join(lines)
+            lines.clear()
+
+    yield "".join(lines)
+
+
+def export_table(conn, table, fmt):
+    """Encoded chunks of a table export, ``fmt`` being "csv" or "ndjson" """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt == "csv":
+        return iter_csv(conn, table)
+    if fmt == "ndjson":
+        return iter_ndjson(conn, table)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def read_records(fileobj, fmt):
+    """Parse an export back into dicts, lazily"""
+    if fmt == "csv":
+        for record in csv.DictReader(fileobj):
+            yield {key: value if value != "" else None for key, value in record.items()}
+    elif fmt == "ndjson":
+        for line in fileobj:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+
+def import_records(conn, table, records, replace=False):
+    """Bulk insert records into a table, returns the number of rows written"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return 0
+
+    # Only accept known columns; ids are kept only where they can't clash
+    columns = [column for column in EXPORT_TABLES[table] if column in first]
+    empty = conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+    if not (replace or empty) and "id" in columns:
+        columns.remove("id")
+    if not columns:
+        raise ValueError(f"No {table} columns found in import data")
+    statement = (
+        f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO {table} "
+        f"({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    )
+
+    cursor = conn.cursor()
+    rows = (tuple(record.get(column) for column in columns) for record in records)
+    batch = [tuple(first.get(column) for column in columns)]
+    batch.extend(islice(rows, IMPORT_BATCH_SIZE - 1))
+
+    total = 0
+    uncommitted = 0
+    while batch:
+        cursor.executemany(statement, batch)
+        total += cursor.rowcount
+        uncommitted += len(batch)
+        if uncommitted >= IMPORT_TRANSACTION_SIZE:
+            conn.commit()
+            uncommitted = 0
+        batch = list(islice(rows, IMPORT_BATCH_SIZE))
+
+    conn.commit()
+    return total
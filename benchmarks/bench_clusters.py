@@ -0,0 +1,68 @@
+"""Cost of a full k-means refit versus incremental updates by database size.
+
+python benchmarks/bench_clusters.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from importlib import import_module
+from pathlib import Path
+
+app_module = import_module("anika_blue.app")
+
+
+def seed_votes(conn, count):
+    conn.executemany(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, 1)",
+        ((f"user{i % 1000}", app_module.generate_blue_shade()) for i in range(count)),
+    )
+    conn.commit()
+
+
+def time_refit(conn, k):
+    start = time.perf_counter()
+    app_module.fit_clusters(conn, k, app_module.parse_rgb)
+    conn.commit()
+    return time.perf_counter() - start
+
+
+def time_update(conn, k, votes):
+    c = conn.cursor()
+    start = time.perf_counter()
+    for _ in range(votes):
+        rgb = app_module.parse_rgb(app_module.generate_blue_shade())
+        app_module.update_clusters(c, rgb, k)
+    elapsed = time.perf_counter() - start
+    conn.rollback()
+    return elapsed / votes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("-k", type=int, default=app_module.CLUSTER_COUNT)
+    parser.add_argument("--updates", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'yes votes':>10} {'refit ms':>10} {'update us':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.DATABASE = str(Path(tmp) / "bench.db")
+        app_module.init_db()
+        conn = app_module.get_db()
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed_votes(conn, size - seeded)
+            seeded = size
+            refit = time_refit(conn, args.k)
+            update = time_update(conn, args.k, args.updates)
+            print(f"{size:>10} {refit * 1000:>10.1f} {update * 1e6:>10.1f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
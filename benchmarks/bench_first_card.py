@@ -0,0 +1,78 @@
+"""Time to first card: the inline render of / versus the old request chain.
+
+The old page fetched /next-shade and /stats after loading the shell, three
+serial round trips before the user saw a card; now / renders both inline.
+The chain is replayed against today's /, so its server time is an upper
+bound of the old one.
+Server time is measured through the test client, --rtt adds a modelled
+network round trip per request.
+
+python benchmarks/bench_first_card.py --votes 10000 --rtt 50
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from importlib import import_module
+from pathlib import Path
+
+app_module = import_module("anika_blue.app")
+
+CHAIN = ("/", "/next-shade", "/stats")
+
+
+def seed_votes(count):
+    conn = app_module.get_db()
+    conn.executemany(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+        (
+            (f"user{i % 1000}", app_module.generate_blue_shade(), i % 3 != 0)
+            for i in range(count)
+        ),
+    )
+    conn.commit()
+    conn.close()
+    app_module.rebuild_derived_data()
+
+
+def time_paths(paths, repeat):
+    """Median server time of loading paths one after the other, fresh users"""
+    timings = []
+    for _ in range(repeat):
+        client = app_module.app.test_client()
+        start = time.perf_counter()
+        for path in paths:
+            client.get(path).close()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--votes", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--rtt", type=float, default=50.0, help="milliseconds")
+    args = parser.parse_args()
+
+    random.seed(0)
+    app_module.app.config["RATE_LIMIT_ENABLED"] = False
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.DATABASE = str(Path(tmp) / "bench.db")
+        app_module.init_db()
+        seed_votes(args.votes)
+        # Warm the caches and the snapshot
+        time_paths(CHAIN, 5)
+
+        print(
+            f"{'page load':>10} {'requests':>9} {'server ms':>10} {'first card ms':>14}"
+        )
+        for label, paths in (("inline", ("/",)), ("chain", CHAIN)):
+            server = time_paths(paths, args.repeat) * 1000
+            first_card = server + len(paths) * args.rtt
+            print(f"{label:>10} {len(paths):>9} {server:>10.2f} {first_card:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
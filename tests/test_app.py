@@ -1,9 +1,12 @@
 """Tests for the Anika Blue application."""
 
 import os
+import random
 import sqlite3
 import tempfile
+import tracemalloc
 from importlib import import_module
+from typing import ClassVar
 
 import pytest
 from anika_blue.app import (
@@ -31,6 +34,7 @@ def client():
     db_fd, db_path = tempfile.mkstemp()
     app.config["TESTING"] = True
     app.config["DATABASE"] = db_path
+    app.config["RATE_LIMIT_ENABLED"] = False
 
     # Override the DATABASE environment variable for the app
     os.environ["DATABASE"] = db_path
@@ -128,16 +132,23 @@ class TestColorAveraging:
     def test_get_color_details_exact(self):
         """Exact CSS color names are returned in the details payload."""
         details = get_color_details("#0000ff")
-        assert details["css_name"] == "Blue"
-        assert "Blue" in details["display_name"]
+        assert details.css_name == "Blue"
+        assert "Blue" in details.display_name
 
     def test_get_color_details_closest_match(self):
         """Nearest descriptive names are returned when no exact match exists."""
         details = get_color_details("#123456")
-        assert isinstance(details["descriptive_name"], str)
-        assert details["descriptive_name"] != "Unknown Color"
-        if details["css_name"]:
-            assert details["css_display_name"].startswith("~ ")
+        assert isinstance(details.descriptive_name, str)
+        assert details.descriptive_name != "Unknown Color"
+        if details.css_name:
+            assert details.css_display_name.startswith("~ ")
+
+    def test_get_color_details_is_shared(self):
+        """Details are immutable and computed once per normalized color."""
+        details = get_color_details("#0000ff")
+        assert get_color_details(" 0000FF") is details
+        with pytest.raises(AttributeError):
+            details.css_name = "Red"
 
     def test_get_user_average_no_votes(self, db_connection):
         """Test that user average returns None when no votes exist."""
@@ -258,6 +269,48 @@ class TestBaseColor:
         result = find_user_by_base_color("#ffffff")
         assert result is None
 
+    def test_find_user_by_base_color_collision(self, db_connection):
+        """Several users with the same base color are reported, not picked."""
+        app_module = get_app_module()
+
+        set_user_base_color("user1", "#667eea")
+        set_user_base_color("user2", "#667EEA")
+        with pytest.raises(app_module.BaseColorCollision) as excinfo:
+            find_user_by_base_color("#667eea")
+        assert excinfo.value.user_ids == ("user1", "user2")
+
+        # Moving away resolves the collision
+        set_user_base_color("user2", "#667eeb")
+        assert find_user_by_base_color("#667EEA") == "user1"
+        assert find_user_by_base_color("#667eeb") == "user2"
+
+    def test_base_color_lookups_are_cached(self, db_connection, monkeypatch):
+        """Failed lookups are remembered until a user gets that color."""
+        app_module = get_app_module()
+        assert find_user_by_base_color("#123456") is None
+
+        def no_db():
+            raise AssertionError("lookup was not cached")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(app_module, "get_db", no_db)
+            assert find_user_by_base_color("#123456") is None
+
+        # Another worker's write invalidates the cached miss
+        conn = sqlite3.connect(db_connection)
+        conn.execute(
+            "INSERT OR REPLACE INTO user_base_colors (user_id, base_color) "
+            "VALUES ('user1', '#123456')"
+        )
+        conn.commit()
+        conn.close()
+        assert find_user_by_base_color("#123456") == "user1"
+
+        # Including the old color of a replaced row
+        app_module.set_user_base_color("user1", "#654321")
+        assert find_user_by_base_color("#123456") is None
+        assert find_user_by_base_color("#654321") == "user1"
+
 
 class TestRoutes:
     """Tests for Flask routes."""
@@ -371,8 +424,595 @@ class TestRoutes:
         response = client.post("/load-base-color", data={"base_color": "#ffffff"})
         assert response.status_code == 404
 
+    def test_load_base_color_collision(self, db_connection, client):
+        """A base color shared by several users restores no session."""
+        set_user_base_color("user1", "#3a5fcd")
+        set_user_base_color("user2", "#3a5fcd")
+        response = client.post("/load-base-color", data={"base_color": "#3A5FCD"})
+        assert response.status_code == 409
+        assert response.get_json()["success"] is False
+
+        set_user_base_color("user2", "#3a5fce")
+        response = client.post("/load-base-color", data={"base_color": "#3A5FCD"})
+        assert response.status_code == 200
+
     def test_favicon_route(self, client):
         """Test that favicon route returns an image."""
         response = client.get("/favicon.ico")
         assert response.status_code == 200
         assert response.mimetype == "image/x-icon"
+
+    def test_global_stats_fragment_cached_until_snapshot_changes(
+        self, client, db_connection
+    ):
+        """The global stats block is reused until the stats snapshot changes."""
+        app_module = get_app_module()
+        app_module.DATABASE = db_connection
+
+        client.post("/vote", data={"shade": "#0000ff", "vote": "no"})
+        app_module.flush_sketches()
+        app_module.refresh_stats_snapshot()
+        response = client.get("/stats")
+        assert b"Be the first to define Anika Blue!" in response.data
+        assert "X-Stats-Snapshot-Age" in response.headers
+        cached_html = app_module._GLOBAL_STATS_FRAGMENT_CACHE["html"]
+
+        client.post("/vote", data={"shade": "#00ff00", "vote": "no"})
+        app_module.flush_sketches()
+        app_module.refresh_stats_snapshot()
+        client.get("/stats")
+        assert app_module._GLOBAL_STATS_FRAGMENT_CACHE["html"] is cached_html
+
+        # The snapshot is allowed to lag behind until it is refreshed
+        response = client.post("/vote", data={"shade": "#0000ff", "vote": "yes"})
+        assert b"Be the first to define Anika Blue!" in response.data
+
+        app_module.flush_sketches()
+        app_module.refresh_stats_snapshot()
+        response = client.get("/stats")
+        assert b"Be the first to define Anika Blue!" not in response.data
+        # The average only counts yes votes, the voters are labelled apart
+        html = response.get_data(as_text=True)
+        assert "Based on 1 Anika Blue vote<" in html
+        assert "≈ 1 voter\n" in html
+
+    def test_index_renders_first_card_and_stats(self, client):
+        """The first shade and the stats come with the page, never cached."""
+        response = client.get("/")
+        assert response.headers["Cache-Control"] == "no-store"
+        assert "ETag" not in response.headers
+        html = response.get_data(as_text=True)
+        assert 'class="shade-display"' in html
+        assert "Your Anika Blue value" in html
+        assert "Loading..." not in html
+
+        conn = get_app_module().get_db()
+        (shade,) = conn.execute(
+            "SELECT hex_color FROM shown_shades ORDER BY rowid DESC LIMIT 1"
+        ).fetchone()
+        conn.close()
+        assert f'data-shade="{shade}"' in html
+
+    def test_hashed_asset_route(self, client):
+        """Hashed assets are immutable and served precompressed when accepted."""
+        app_module = get_app_module()
+        with app.test_request_context():
+            css_url = app_module.asset_url("app.css")
+        assert css_url.startswith("/static/dist/app.")
+
+        response = client.get(css_url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "immutable" in response.headers["Cache-Control"]
+        assert response.headers["Vary"] == "Accept-Encoding"
+
+        response = client.get(css_url)
+        assert "Content-Encoding" not in response.headers
+        assert response.mimetype == "text/css"
+
+        response = client.get("/static/dist/app.000000000000.css")
+        assert response.status_code == 404
+
+
+class TestStatsSnapshot:
+    """Tests for the materialized global stats snapshot."""
+
+    def test_refresh_stats_snapshot(self, db_connection):
+        """The snapshot holds the global average, counts and color details."""
+        app_module = get_app_module()
+
+        snapshot = app_module.refresh_stats_snapshot()
+        assert snapshot["average"] is None
+        assert snapshot["count"] == 0
+        empty_version = snapshot["version"]
+
+        conn = sqlite3.connect(db_connection)
+        conn.executemany(
+            "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+            [("user1", "#0000ff", 1), ("user2", "#000099", 1), ("user2", "#ff0000", 0)],
+        )
+        conn.commit()
+        conn.close()
+
+        # Distinct counts come from the sketches, rebuilt from the raw rows
+        app_module.rebuild_derived_data()
+        snapshot = app_module.refresh_stats_snapshot()
+        assert (snapshot["average"], snapshot["count"]) == get_global_average()
+        assert snapshot["distinct_users"] == 2
+        assert snapshot["distinct_yes_shades"] == 2
+        assert snapshot["details"] == get_color_details(snapshot["average"])
+        assert snapshot["version"] == empty_version + 1
+
+        # Unchanged data keeps the version so cached fragments stay valid
+        assert app_module.refresh_stats_snapshot()["version"] == snapshot["version"]
+
+    def test_refresh_skips_recent_snapshot(self, db_connection, monkeypatch):
+        """A snapshot younger than min_interval is kept without any scan."""
+        app_module = get_app_module()
+        snapshot = app_module.refresh_stats_snapshot()
+
+        def scan():
+            raise AssertionError("scanned the votes")
+
+        monkeypatch.setattr(app_module, "get_cached_global_average", scan)
+        skipped = app_module.refresh_stats_snapshot(min_interval=60)
+        assert skipped["computed_at"] == snapshot["computed_at"]
+        with pytest.raises(AssertionError):
+            app_module.refresh_stats_snapshot()
+
+    def test_get_stats_snapshot_respects_max_age(self, db_connection):
+        """Reads are served from the snapshot until it exceeds the bound."""
+        app_module = get_app_module()
+        app_module.refresh_stats_snapshot()
+
+        conn = sqlite3.connect(db_connection)
+        conn.execute(
+            "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+            ("user1", "#0000ff", 1),
+        )
+        conn.commit()
+        conn.close()
+
+        assert app_module.get_stats_snapshot(max_age=60)["count"] == 0
+        assert app_module.get_stats_snapshot(max_age=0)["count"] == 1
+
+
+class TestExport:
+    """Tests for data export and derived data rebuilds."""
+
+    def test_export_disabled_without_token(self, client, monkeypatch):
+        """Exports are not exposed unless EXPORT_TOKEN is configured."""
+        monkeypatch.setattr(get_app_module(), "EXPORT_TOKEN", None)
+        response = client.get("/export/votes.csv")
+        assert response.status_code == 404
+
+    def test_export_streams_table(self, client, db_connection, monkeypatch):
+        """Exports require the token and stream the requested table."""
+        app_module = get_app_module()
+        monkeypatch.setattr(app_module, "EXPORT_TOKEN", "secret")
+
+        client.post("/vote", data={"shade": "#0000ff", "vote": "yes"})
+
+        response = client.get("/export/votes.csv")
+        assert response.status_code == 403
+
+        headers = {"Authorization": "Bearer secret"}
+        response = client.get("/export/votes.ndjson", headers=headers)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == "application/x-ndjson"
+        assert b'"hex_color": "#0000ff"' in response.data
+
+        response = client.get("/export/sessions.csv", headers=headers)
+        assert response.status_code == 404
+
+    def test_rebuild_derived_data(self, db_connection):
+        """Base colors and the stats snapshot are rebuilt from votes."""
+        app_module = get_app_module()
+
+        conn = sqlite3.connect(db_connection)
+        conn.executemany(
+            "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+            [("user1", "#0000ff", 1), ("user1", "#000099", 1), ("user2", "#00ff00", 0)],
+        )
+        conn.commit()
+        conn.close()
+
+        app_module.rebuild_derived_data()
+
+        assert get_user_base_color("user1") == get_user_average("user1")[0]
+        assert get_user_base_color("user2") is None
+        assert app_module.get_stats_snapshot()["count"] == 2
+
+        # A completed rebuild leaves nothing to resume
+        conn = sqlite3.connect(db_connection)
+        assert conn.execute("SELECT * FROM rebuild_checkpoint").fetchall() == []
+        conn.close()
+
+
+class TestRateLimit:
+    """Tests for per-session and per-address rate limiting."""
+
+    @pytest.fixture
+    def limited_client(self, client, tmp_path, monkeypatch):
+        app_module = get_app_module()
+        limiter = app_module.TokenBucketLimiter(tmp_path / "ratelimit", slots=64)
+        monkeypatch.setitem(app_module._RATE_LIMITER, "limiter", limiter)
+        monkeypatch.setitem(app_module.RATE_LIMITS, "write", (0.001, 2))
+        monkeypatch.setitem(app_module.RATE_LIMITS, "read", (0.001, 3))
+        monkeypatch.setitem(app.config, "RATE_LIMIT_ENABLED", True)
+        yield client
+        limiter.close()
+
+    def test_write_budget(self, limited_client, db_connection):
+        """Writes beyond the burst are rejected with Retry-After."""
+        assert limited_client.get("/next-shade").status_code == 200
+        assert limited_client.get("/next-shade").status_code == 200
+
+        response = limited_client.get("/next-shade")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
+
+        response = limited_client.post(
+            "/vote", data={"shade": "#0000ff", "vote": "yes"}
+        )
+        assert response.status_code == 429
+
+        conn = sqlite3.connect(db_connection)
+        assert conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0] == 0
+        conn.close()
+
+    def test_reads_and_writes_have_separate_budgets(self, limited_client):
+        """Exhausting the write budget leaves reads untouched."""
+        for _ in range(2):
+            limited_client.get("/next-shade")
+        assert limited_client.get("/next-shade").status_code == 429
+        assert limited_client.get("/stats").status_code == 200
+
+    def test_address_budget_is_shared_between_sessions(self, limited_client):
+        """New sessions from the same address still hit the address budget."""
+        # 2 writes per session, 4 times as many per address
+        for index in range(4):
+            with limited_client.session_transaction() as sess:
+                sess["user_id"] = f"user{index}"
+            assert limited_client.get("/next-shade").status_code == 200
+            assert limited_client.get("/next-shade").status_code == 200
+
+        with limited_client.session_transaction() as sess:
+            sess["user_id"] = "fresh_user"
+        assert limited_client.get("/next-shade").status_code == 429
+
+
+class TestWindowStats:
+    """Tests for the time-windowed rolling stats."""
+
+    def record(self, user_id, hex_color, is_anika_blue, timestamp):
+        app_module = get_app_module()
+        conn = app_module.get_db()
+        app_module.record_vote_buckets(
+            conn.cursor(),
+            app_module.vote_bucket_rows(user_id, hex_color, is_anika_blue, timestamp),
+        )
+        conn.commit()
+        conn.close()
+
+    def test_windows(self, db_connection):
+        """Votes only count towards the windows they fall into."""
+        app_module = get_app_module()
+        now = 1_700_000_000
+        self.record("user1", "#0000ff", 1, now - 60)
+        self.record("user1", "#000099", 1, now - 2 * 3600)
+        self.record("user2", "#00ff00", 0, now - 3 * 24 * 3600)
+        self.record("user2", "#ff0000", 1, now - 30 * 24 * 3600)
+
+        hour, day, week = app_module.get_window_stats("global", now)
+        assert (hour["vote_count"], day["vote_count"], week["vote_count"]) == (1, 2, 3)
+        assert hour["average"].hex == "#0000ff"
+        assert day["average"].hex == "#0000cc"
+        assert day["average"].count == 2
+        assert week["average"].count == 2
+
+        hour, day, week = app_module.get_window_stats("user:user2", now)
+        assert hour["average"] is None and hour["vote_count"] == 0
+        assert week["average"] is None and week["vote_count"] == 1
+
+    def test_prune_vote_buckets(self, db_connection):
+        """Buckets outside every window are removed."""
+        app_module = get_app_module()
+        now = 1_700_000_000
+        self.record("user1", "#0000ff", 1, now - 2 * 3600)
+        self.record("user1", "#0000ff", 1, now - 8 * 24 * 3600)
+
+        app_module.prune_vote_buckets(now)
+
+        conn = sqlite3.connect(db_connection)
+        rows = conn.execute(
+            "SELECT resolution, COUNT(*) FROM vote_buckets GROUP BY resolution"
+        ).fetchall()
+        conn.close()
+        # One hourly bucket per scope survives, the minute buckets are gone
+        assert rows == [(3600, 2)]
+        _, day, _ = app_module.get_window_stats("global", now)
+        assert day["vote_count"] == 1
+
+    def test_rebuild_vote_buckets(self, db_connection):
+        """Buckets are rebuilt from the votes of the last week."""
+        app_module = get_app_module()
+        conn = sqlite3.connect(db_connection)
+        conn.executemany(
+            """INSERT INTO votes (user_id, hex_color, is_anika_blue, timestamp)
+               VALUES (?, ?, ?, datetime('now', ?))""",
+            [
+                ("user1", "#0000ff", 1, "-10 minutes"),
+                ("user1", "#000099", 0, "-5 hours"),
+                ("user2", "#0000ff", 1, "-30 days"),
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+        app_module.rebuild_derived_data()
+
+        hour, day, week = app_module.get_window_stats("user:user1")
+        assert (hour["vote_count"], day["vote_count"], week["vote_count"]) == (1, 2, 2)
+        assert week["average"].hex == "#0000ff"
+        assert app_module.get_window_stats("user:user2")[2]["vote_count"] == 0
+
+    def test_stats_route_shows_windows(self, client, db_connection):
+        """Votes are reflected in the windowed stats right away."""
+        client.post("/vote", data={"shade": "#0000ff", "vote": "yes"})
+        response = client.get("/stats")
+        assert b"Recent trends" in response.data
+        assert b"1 of 1 vote" in response.data
+
+
+class TestHistory:
+    """Tests for the keyset-paginated vote history."""
+
+    def test_history_pages(self, client, db_connection):
+        """History pages walk a user's votes newest first via the cursor."""
+        with client.session_transaction() as sess:
+            sess["user_id"] = "test_user"
+
+        conn = sqlite3.connect(db_connection)
+        conn.executemany(
+            "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+            [("test_user", f"#0000{i:02x}", i % 2) for i in range(5)]
+            + [("other_user", "#ffffff", 1)],
+        )
+        conn.commit()
+        conn.close()
+
+        data = client.get("/history?limit=2").get_json()
+        assert [item["hex"] for item in data["items"]] == ["#000004", "#000003"]
+        assert data["items"][0]["anika_blue"] is False
+        assert data["items"][1]["anika_blue"] is True
+        assert data["items"][0]["descriptive_name"]
+
+        seen = [item["id"] for item in data["items"]]
+        while data["next_cursor"] is not None:
+            data = client.get(
+                f"/history?limit=2&before={data['next_cursor']}"
+            ).get_json()
+            seen.extend(item["id"] for item in data["items"])
+
+        assert seen == [5, 4, 3, 2, 1]
+
+    def test_history_empty_and_invalid(self, client):
+        """Users without votes get an empty page; bad cursors are rejected."""
+        data = client.get("/history").get_json()
+        assert data == {"items": [], "next_cursor": None}
+
+        assert client.get("/history?before=abc").status_code == 400
+
+    def test_history_uses_index(self, db_connection):
+        """The history query seeks in the (user_id, id) index."""
+        conn = sqlite3.connect(db_connection)
+        plan = conn.execute(
+            """EXPLAIN QUERY PLAN SELECT id, hex_color, is_anika_blue, timestamp
+               FROM votes WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?""",
+            ("test_user", 10, 21),
+        ).fetchall()
+        conn.close()
+        assert "idx_votes_user_id_id" in plan[0][3]
+        assert not any("TEMP B-TREE" in row[3] for row in plan)
+
+
+class TestClusters:
+    """Tests for the Anika Blue clusters."""
+
+    def test_clusters_route(self, client, db_connection, monkeypatch):
+        """Yes votes are grouped into named clusters, largest first."""
+        monkeypatch.setattr(get_app_module(), "CLUSTER_COUNT", 2)
+        for shade in ("#0000ff", "#87ceeb", "#0000fe"):
+            client.post("/vote", data={"shade": shade, "vote": "yes"})
+        client.post("/vote", data={"shade": "#ff0000", "vote": "no"})
+
+        data = client.get("/clusters").get_json()
+        assert data["vote_count"] == 3
+        assert [item["size"] for item in data["clusters"]] == [2, 1]
+        assert data["clusters"][1]["css_name"] == "Sky Blue"
+        assert data["clusters"][0]["share"] == pytest.approx(2 / 3)
+
+    def test_rebuild_refits_clusters(self, client, db_connection):
+        """Rebuilding derived data reproduces the incremental clusters."""
+        for shade in ("#0000ff", "#87ceeb", "#000080", "#4169e1", "#0000cc"):
+            client.post("/vote", data={"shade": shade, "vote": "yes"})
+        before = client.get("/clusters").get_json()
+
+        get_app_module().rebuild_derived_data()
+        assert client.get("/clusters").get_json() == before
+
+
+class TestReplica:
+    """Tests for serving the stats endpoints from a read-only replica."""
+
+    @pytest.fixture
+    def replica(self, client, db_connection, tmp_path, monkeypatch):
+        path = str(tmp_path / "replica.db")
+        monkeypatch.setattr(get_app_module(), "REPLICA_DATABASE", path)
+        return path
+
+    def history_size(self, response):
+        return len(response.get_json()["items"])
+
+    def test_reads_follow_the_replica(self, client, replica):
+        """Stats reads lag behind until the next sync, own votes do not."""
+        app_module = get_app_module()
+        client.post("/vote", data={"shade": "#0000ff", "vote": "yes"})
+
+        # Without a synced replica the primary answers
+        response = client.get("/stats")
+        assert "X-Replica-Lag" not in response.headers
+        assert b"Based on 1 vote" in response.data
+
+        app_module.sync_replica(app_module.DATABASE, replica)
+        response = client.post("/vote", data={"shade": "#000099", "vote": "yes"})
+        assert b"Based on 2 votes" in response.data
+
+        # The history of the user's own votes always reads the primary
+        response = client.get("/history")
+        assert "X-Replica-Lag" not in response.headers
+        assert self.history_size(response) == 2
+        response = client.get("/stats")
+        assert float(response.headers["X-Replica-Lag"]) >= 0
+        assert b"Based on 1 vote" in response.data
+
+        app_module.sync_replica(app_module.DATABASE, replica)
+        assert b"Based on 2 votes" in client.get("/stats").data
+        assert "X-Replica-Lag" in client.get("/favicon.ico").headers
+
+
+class TestTopShades:
+    """Tests for the most voted shades leaderboard."""
+
+    def exact_top(self, db_path, limit):
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(
+            """SELECT hex_color, COUNT(*) FROM votes WHERE is_anika_blue = 1
+               GROUP BY hex_color ORDER BY COUNT(*) DESC, hex_color LIMIT ?""",
+            (limit,),
+        ).fetchall()
+        conn.close()
+        return [list(row) for row in rows]
+
+    def test_votes_are_counted(self, client, db_connection):
+        """Votes show up in the leaderboard once the worker flushed them."""
+        app_module = get_app_module()
+        for shade, times in (("#0000ff", 3), ("#000099", 2), ("#87ceeb", 1)):
+            for _ in range(times):
+                client.post("/vote", data={"shade": shade, "vote": "yes"})
+        client.post("/vote", data={"shade": "#ff0000", "vote": "no"})
+        assert client.get("/top-shades").get_json()["shades"] == []
+
+        app_module.flush_sketches()
+        shades = client.get("/top-shades?limit=2").get_json()["shades"]
+        assert [[shade["hex"], shade["count"]] for shade in shades] == (
+            self.exact_top(db_connection, 2)
+        )
+        assert shades[0]["css_name"] == "Blue"
+        assert shades[0]["error"] == 0
+
+    def test_counts_stay_within_error_bounds(self, client, db_connection, monkeypatch):
+        """With more shades than counters, estimates bound the exact counts."""
+        app_module = get_app_module()
+        capacity = 10
+        monkeypatch.setattr(app_module, "TOP_SHADES_CAPACITY", capacity)
+        app_module.flush_sketches()  # fresh deltas with the smaller capacity
+
+        rng = random.Random(5)
+        shades = [f"#0000{value:02x}" for value in range(64)]
+        weights = [1 / rank for rank in range(1, 65)]
+        for i, shade in enumerate(rng.choices(shades, weights, k=400)):
+            client.post("/vote", data={"shade": shade, "vote": "yes"})
+            # Several flushes, as if the votes came from different workers
+            if i % 100 == 99:
+                app_module.flush_sketches()
+        app_module.flush_sketches()
+
+        exact = dict(self.exact_top(db_connection, len(shades)))
+        assert len(exact) > capacity
+        total = sum(exact.values())
+        top = client.get(f"/top-shades?limit={capacity}").get_json()["shades"]
+        assert len(top) == capacity
+        assert any(shade["error"] for shade in top)  # some counters were evicted
+        for shade in top:
+            assert shade["count"] - shade["error"] <= exact.get(shade["hex"], 0)
+            assert exact.get(shade["hex"], 0) <= shade["count"]
+            assert shade["error"] <= total / capacity
+        # Every shade above the error bound is guaranteed to be reported
+        reported = {shade["hex"] for shade in top}
+        frequent = {shade for shade, count in exact.items() if count > total / capacity}
+        assert frequent <= reported
+
+
+class TestDistinctCounts:
+    """Tests for the estimated distinct voters and shades."""
+
+    def test_stats_show_distinct_counts(self, client, db_connection):
+        """Flushed sketches of all clients are counted in the global stats."""
+        app_module = get_app_module()
+        other = app.test_client()
+        for voter in (client, other):
+            voter.get("/next-shade")
+            voter.post("/vote", data={"shade": "#0000ff", "vote": "yes"})
+        other.post("/vote", data={"shade": "#87ceeb", "vote": "yes"})
+
+        app_module.flush_sketches()
+        snapshot = app_module.refresh_stats_snapshot()
+        assert snapshot["distinct_users"] == 2
+        assert snapshot["distinct_yes_shades"] == 2
+        assert 1 <= snapshot["distinct_shades_shown"] <= 2
+        assert "≈ 2 voters" in client.get("/stats").get_data(as_text=True)
+
+    def test_init_db_migrates_snapshot(self, db_connection):
+        """Snapshots of older databases gain the distinct shade columns."""
+        conn = sqlite3.connect(db_connection)
+        conn.execute("DROP TABLE stats_snapshot")
+        conn.execute("""CREATE TABLE stats_snapshot
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  version INTEGER NOT NULL,
+                  average TEXT,
+                  vote_count INTEGER NOT NULL,
+                  distinct_users INTEGER NOT NULL,
+                  details TEXT,
+                  computed_at REAL NOT NULL)""")
+        conn.execute("INSERT INTO stats_snapshot VALUES (1, 3, NULL, 0, 0, NULL, 0)")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        snapshot = get_app_module().get_stats_snapshot(max_age=float("inf"))
+        assert snapshot["version"] == 3
+        assert snapshot["distinct_yes_shades"] == 0
+
+
+class TestAllocationBudget:
+    """Per-request memory allocation stays bounded."""
+
+    BUDGETS: ClassVar[dict[str, int]] = {"/next-shade": 48 * 1024, "/stats": 64 * 1024}
+    REQUESTS = 25
+
+    def peak_allocation(self, client, url):
+        """Median peak of bytes allocated while serving url"""
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(self.REQUESTS):
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                assert client.get(url).status_code == 200
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        return sorted(peaks)[len(peaks) // 2]
+
+    def test_requests_stay_under_budget(self, client, db_connection):
+        """Warm /next-shade and /stats requests allocate less than their budget."""
+        for _ in range(10):
+            client.post("/vote", data={"shade": "#1a2b9c", "vote": "yes"})
+            client.get("/next-shade")
+            client.get("/stats")
+
+        for url, budget in self.BUDGETS.items():
+            assert self.peak_allocation(client, url) < budget, url
@@ -0,0 +1,74 @@
+"""Tests for the hashed static asset bundle."""
+
+import gzip
+
+from werkzeug.datastructures import Accept
+
+from anika_blue.assets import (
+    DIST_DIRNAME,
+    MANIFEST_NAME,
+    AssetBundle,
+    build_assets,
+    hashed_name,
+)
+
+
+def write_sources(static_dir):
+    (static_dir / "app.css").write_text("body { color: blue; }\n" * 50)
+    (static_dir / "app.js").write_text("console.log('anika');\n" * 50)
+
+
+def test_hashed_name_changes_with_content():
+    first = hashed_name("app.css", b"a")
+    second = hashed_name("app.css", b"b")
+    assert first.startswith("app.") and first.endswith(".css")
+    assert first != second
+
+
+def test_build_assets_writes_hashed_and_gzipped_files(tmp_path):
+    write_sources(tmp_path)
+    manifest = build_assets(tmp_path)
+
+    dist_dir = tmp_path / DIST_DIRNAME
+    assert (dist_dir / MANIFEST_NAME).exists()
+    for name, hashed in manifest.items():
+        source = (tmp_path / name).read_bytes()
+        assert (dist_dir / hashed).read_bytes() == source
+        assert gzip.decompress((dist_dir / f"{hashed}.gz").read_bytes()) == source
+
+
+def test_bundle_uses_build_output(tmp_path):
+    write_sources(tmp_path)
+    manifest = build_assets(tmp_path)
+    hashed = manifest["app.css"]
+    (tmp_path / DIST_DIRNAME / f"{hashed}.gz").write_bytes(b"prebuilt")
+
+    bundle = AssetBundle.load(tmp_path)
+    assert bundle.urls["app.css"] == hashed
+    assert bundle.files[hashed]["gzip"] == b"prebuilt"
+
+
+def test_bundle_ignores_outdated_build(tmp_path):
+    write_sources(tmp_path)
+    build_assets(tmp_path)
+    (tmp_path / "app.css").write_text("body { color: navy; }\n")
+
+    bundle = AssetBundle.load(tmp_path)
+    hashed = bundle.urls["app.css"]
+    assert hashed == hashed_name("app.css", b"body { color: navy; }\n")
+    assert gzip.decompress(bundle.files[hashed]["gzip"]) == (b"body { color: navy; }\n")
+
+
+def test_negotiate_prefers_compressed_variant(tmp_path):
+    write_sources(tmp_path)
+    bundle = AssetBundle.load(tmp_path)
+    hashed = bundle.urls["app.js"]
+
+    _, encoding = bundle.negotiate(hashed, Accept([("gzip", 1)]))
+    assert encoding == "gzip"
+
+    body, encoding = bundle.negotiate(hashed, Accept([]))
+    assert encoding == "identity"
+    assert body == (tmp_path / "app.js").read_bytes()
+
+    assert bundle.negotiate("missing.css", Accept([])) is None
@@ -0,0 +1,159 @@
+"""Tests for online database backups."""
+
+import sqlite3
+import threading
+import time
+from itertools import pairwise
+
+import pytest
+
+from anika_blue.backup import (
+    LOCK_NAME,
+    create_backup,
+    list_backups,
+    rotate_backups,
+    verify_backup,
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "live.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE votes (id INTEGER PRIMARY KEY, hex_color TEXT)")
+    conn.executemany(
+        "INSERT INTO votes (hex_color) VALUES (?)",
+        [(f"#0000{i % 256:02x}" * 20,) for i in range(5000)],
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count_votes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_create_backup(database, tmp_path):
+    backup_dir = tmp_path / "backups"
+    steps = []
+
+    path = create_backup(
+        database,
+        backup_dir,
+        pages=8,
+        sleep=0,
+        progress=lambda status, remaining, total: steps.append(remaining),
+    )
+
+    assert path.parent == backup_dir
+    assert list_backups(backup_dir) == [path]
+    assert count_votes(path) == 5000
+    assert verify_backup(path) == "ok"
+    assert len(steps) > 1
+
+
+def steady_writer(database, every=0.002):
+    """Start a thread committing a vote every few milliseconds, returns its stop"""
+    done = threading.Event()
+
+    def write():
+        conn = sqlite3.connect(database, timeout=5)
+        while not done.wait(every):
+            conn.execute("INSERT INTO votes (hex_color) VALUES ('#0000ff')")
+            conn.commit()
+        conn.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+
+    def stop():
+        done.set()
+        thread.join()
+
+    return stop
+
+
+def test_create_backup_with_concurrent_writes(database, tmp_path):
+    stop = steady_writer(database)
+    try:
+        path = create_backup(database, tmp_path / "backups", pages=64, sleep=0.001)
+    finally:
+        stop()
+
+    assert verify_backup(path) == "ok"
+    assert 5000 <= count_votes(path) <= count_votes(database)
+
+
+def test_backup_sleeps_between_steps(database, tmp_path):
+    steps = []
+    start = time.monotonic()
+    create_backup(
+        database,
+        tmp_path / "backups",
+        pages=16,
+        sleep=0.01,
+        progress=lambda status, remaining, total: steps.append(remaining),
+    )
+    assert len(steps) > 5
+    assert time.monotonic() - start >= (len(steps) - 1) * 0.01
+
+
+def test_backup_gives_up_stepping_under_steady_writes(database, tmp_path):
+    """Restarts by writers are capped, the copy then finishes in one step."""
+    steps = []
+    stop = steady_writer(database)
+    try:
+        start = time.monotonic()
+        path = create_backup(
+            database,
+            tmp_path / "backups",
+            pages=8,
+            sleep=0.01,
+            max_restarts=2,
+            progress=lambda status, remaining, total: steps.append(remaining),
+        )
+        elapsed = time.monotonic() - start
+    finally:
+        stop()
+
+    assert elapsed < 10
+    assert verify_backup(path) == "ok"
+    assert count_votes(path) >= 5000
+    # Stepping was abandoned before the end, the last step copied everything
+    assert steps[-1] == 0
+    assert any(later >= earlier for earlier, later in pairwise(steps))
+
+
+def test_backup_skips_recent_and_locked(database, tmp_path):
+    backup_dir = tmp_path / "backups"
+    first = create_backup(database, backup_dir, sleep=0, min_interval=60)
+    assert first is not None
+    assert create_backup(database, backup_dir, sleep=0, min_interval=60) is None
+    assert create_backup(database, backup_dir, sleep=0) is not None
+
+    # Another process is backing up right now
+    fcntl = pytest.importorskip("fcntl")
+    with open(backup_dir / LOCK_NAME, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert create_backup(database, backup_dir, sleep=0) is None
+
+
+def test_rotate_backups(database, tmp_path):
+    backup_dir = tmp_path / "backups"
+    paths = [create_backup(database, backup_dir, sleep=0, keep=0) for _ in range(4)]
+    assert list_backups(backup_dir) == paths
+
+    assert rotate_backups(backup_dir, 2) == paths[:2]
+    assert list_backups(backup_dir) == paths[2:]
+    assert rotate_backups(backup_dir, 0) == []
+
+
+def test_verify_backup_detects_garbage(tmp_path):
+    path = tmp_path / "anika_blue-broken.db"
+    path.write_bytes(b"not a database" * 100)
+    assert verify_backup(path) != "ok"
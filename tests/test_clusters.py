@@ -0,0 +1,73 @@
+"""Tests for the online k-means over yes votes."""
+
+import random
+import sqlite3
+
+import pytest
+
+from anika_blue.clusters import (
+    CLUSTERS_TABLE,
+    add_point,
+    fit_clusters,
+    get_clusters,
+    update_clusters,
+)
+
+
+def parse(hex_color):
+    return tuple(int(hex_color[i : i + 2], 16) for i in (1, 3, 5))
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(CLUSTERS_TABLE)
+    conn.execute("""CREATE TABLE votes (id INTEGER PRIMARY KEY, hex_color TEXT,
+                               is_anika_blue INTEGER)""")
+    yield conn
+    conn.close()
+
+
+def test_centers_are_means_of_their_points():
+    rng = random.Random(1)
+    centers, assigned = [], {}
+    for _ in range(500):
+        blob = rng.choice([(20, 40, 200), (120, 180, 250)])
+        rgb = tuple(channel + rng.randint(-10, 10) for channel in blob)
+        assigned.setdefault(add_point(centers, rgb, 2), []).append(rgb)
+
+    assert len(centers) == 2
+    for index, points in assigned.items():
+        assert centers[index][3] == len(points)
+        for channel in range(3):
+            mean = sum(point[channel] for point in points) / len(points)
+            assert centers[index][channel] == pytest.approx(mean)
+
+
+def test_duplicate_colors_do_not_seed_clusters():
+    centers = []
+    for _ in range(3):
+        add_point(centers, (0, 0, 255), 4)
+    assert centers == [[0.0, 0.0, 255.0, 3]]
+
+
+def test_incremental_updates_match_refit(conn):
+    rng = random.Random(2)
+    c = conn.cursor()
+    for _ in range(300):
+        hex_color = f"#{rng.randrange(0x1000000):06x}"
+        is_yes = rng.random() < 0.7
+        c.execute(
+            "INSERT INTO votes (hex_color, is_anika_blue) VALUES (?, ?)",
+            (hex_color, is_yes),
+        )
+        if is_yes:
+            update_clusters(c, parse(hex_color), 3)
+    incremental = get_clusters(c)
+
+    fit_clusters(conn, 3, parse)
+    assert get_clusters(c) == incremental
+    assert (
+        sum(size for _, size in incremental)
+        == c.execute("SELECT COUNT(*) FROM votes WHERE is_anika_blue = 1").fetchone()[0]
+    )
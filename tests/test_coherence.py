@@ -0,0 +1,127 @@
+"""Tests for cross-process cache coherence."""
+
+import sqlite3
+
+import pytest
+
+from anika_blue.coherence import GENERATION_TRIGGERS, GENERATIONS_TABLE, CoherentCache
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "coherence.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE votes
+           (id INTEGER PRIMARY KEY, user_id TEXT, hex_color TEXT, is_anika_blue INT)""")
+    conn.execute(GENERATIONS_TABLE)
+    for trigger in GENERATION_TRIGGERS:
+        conn.execute(trigger)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def cache(database):
+    cache = CoherentCache(database, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def vote(database, user_id, is_anika_blue=1):
+    """Write like another worker process would, on its own connection"""
+    conn = sqlite3.connect(database)
+    conn.execute(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+        (user_id, "#0000ff", is_anika_blue),
+    )
+    conn.commit()
+    conn.close()
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_cached_until_scope_changes(database, cache):
+    compute = Counter()
+    cache.sync()
+    assert cache.get("user:alice", "alice", compute) == 1
+    assert cache.get("user:alice", "alice", compute) == 1
+
+    # Not visible before the next sync, e.g. the next request
+    vote(database, "alice")
+    assert cache.get("user:alice", "alice", compute) == 1
+
+    cache.sync()
+    assert cache.get("user:alice", "alice", compute) == 2
+
+
+def test_only_affected_scopes_are_invalidated(database, cache):
+    alice, bob, world = Counter(), Counter(), Counter()
+    cache.sync()
+    cache.get("user:alice", "alice", alice)
+    cache.get("user:bob", "bob", bob)
+    cache.get("global", "global", world)
+
+    vote(database, "bob", is_anika_blue=0)
+    cache.sync()
+    cache.get("user:alice", "alice", alice)
+    cache.get("user:bob", "bob", bob)
+    cache.get("global", "global", world)
+    assert (alice.calls, bob.calls, world.calls) == (1, 2, 1)
+
+    vote(database, "bob", is_anika_blue=1)
+    cache.sync()
+    cache.get("user:alice", "alice", alice)
+    cache.get("global", "global", world)
+    assert (alice.calls, world.calls) == (1, 2)
+
+
+def test_deletes_invalidate(database, cache):
+    vote(database, "alice")
+    compute = Counter()
+    cache.sync()
+    cache.get("user:alice", "alice", compute)
+
+    conn = sqlite3.connect(database)
+    conn.execute("DELETE FROM votes WHERE user_id = 'alice'")
+    conn.commit()
+    conn.close()
+
+    cache.sync()
+    assert cache.get("user:alice", "alice", compute) == 2
+
+
+def test_updates_invalidate_old_and_new_row(database, cache):
+    vote(database, "alice")
+    alice, bob, world = Counter(), Counter(), Counter()
+    cache.sync()
+    cache.get("user:alice", "alice", alice)
+    cache.get("user:bob", "bob", bob)
+    cache.get("global", "global", world)
+
+    conn = sqlite3.connect(database)
+    conn.execute(
+        "UPDATE votes SET user_id = 'bob', is_anika_blue = 0 WHERE user_id = 'alice'"
+    )
+    conn.commit()
+    conn.close()
+
+    cache.sync()
+    cache.get("user:alice", "alice", alice)
+    cache.get("user:bob", "bob", bob)
+    cache.get("global", "global", world)
+    assert (alice.calls, bob.calls, world.calls) == (2, 2, 2)
+
+
+def test_lru_eviction(cache):
+    compute = Counter()
+    for key in ("a", "b", "c", "d"):
+        cache.get(f"user:{key}", key, compute)
+    assert list(cache.entries) == ["b", "c", "d"]
@@ -0,0 +1,94 @@
+"""Tests for the color palettes and their nearest-name index."""
+
+import math
+import random
+
+import pytest
+
+from anika_blue.palettes import (
+    Palette,
+    css3_palette,
+    get_palette,
+    hex_to_rgb,
+    load_palette,
+    rgb_to_oklab,
+    save_palette_index,
+    to_space,
+)
+
+
+def random_hex(rng):
+    return f"#{rng.randrange(0x1000000):06x}"
+
+
+def brute_force_distance(palette, hex_color):
+    target = to_space(hex_to_rgb(hex_color), palette.space)
+    return min(math.dist(point, target) for point in palette.points)
+
+
+@pytest.mark.parametrize("space", ["rgb", "oklab"])
+def test_nearest_matches_linear_scan(space):
+    rng = random.Random(42)
+    palette = Palette("random", [(random_hex(rng), str(i)) for i in range(2000)], space)
+
+    for _ in range(200):
+        hex_color = random_hex(rng)
+        _, _, distance = palette.nearest(hex_color)
+        assert distance == pytest.approx(brute_force_distance(palette, hex_color))
+
+
+def test_css3_palette():
+    palette = css3_palette()
+    assert palette.nearest("#0000FF") == ("#0000ff", "blue", 0.0)
+    assert palette.nearest("#0000fe")[1] == "blue"
+
+
+def test_empty_palette():
+    assert Palette("empty", []).nearest("#0000ff") is None
+
+
+def test_oklab_of_white_and_black():
+    assert rgb_to_oklab((255, 255, 255)) == pytest.approx((1, 0, 0), abs=1e-4)
+    assert rgb_to_oklab((0, 0, 0)) == pytest.approx((0, 0, 0), abs=1e-9)
+
+
+def test_load_tsv_palette(tmp_path):
+    path = tmp_path / "rgb.txt"
+    path.write_text(
+        "License: http://creativecommons.org/publicdomain/zero/1.0/\n"
+        "cloudy blue\t#acc2d9\t\n"
+        "dark pastel green\t#56ae57\t\n"
+    )
+    palette = load_palette(path)
+    assert len(palette) == 2
+    assert palette.nearest("#abc2d9")[:2] == ("#acc2d9", "cloudy blue")
+
+
+def test_load_json_palette(tmp_path):
+    path = tmp_path / "blues.json"
+    path.write_text('{"Anika Blue": "#3a5fcd", "Not Blue": "#ff0000"}')
+    palette = load_palette(path, "oklab")
+    assert palette.space == "oklab"
+    assert palette.nearest("#3b5fcd")[1] == "Anika Blue"
+
+
+def test_index_roundtrip(tmp_path):
+    rng = random.Random(7)
+    palette = Palette(
+        "random", [(random_hex(rng), str(i)) for i in range(500)], "oklab"
+    )
+    path = tmp_path / "palette.index.json"
+    save_palette_index(palette, path)
+
+    loaded = load_palette(path)
+    assert loaded.space == "oklab"
+    assert loaded.hexes == palette.hexes
+    for _ in range(50):
+        hex_color = random_hex(rng)
+        assert loaded.nearest(hex_color) == palette.nearest(hex_color)
+
+
+def test_get_palette(tmp_path):
+    assert get_palette("css3") is get_palette("css3")
+    with pytest.raises(ValueError):
+        get_palette(str(tmp_path / "missing.json"))
@@ -0,0 +1,78 @@
+"""Tests for the shared token-bucket rate limiter."""
+
+import multiprocessing
+
+import pytest
+
+from anika_blue.ratelimit import TokenBucketLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    limiter = TokenBucketLimiter(tmp_path / "buckets", slots=16)
+    yield limiter
+    limiter.close()
+
+
+def test_burst_then_refill(limiter):
+    assert limiter.acquire("a", rate=1, burst=2, now=100.0) == 0
+    assert limiter.acquire("a", rate=1, burst=2, now=100.0) == 0
+    assert limiter.acquire("a", rate=1, burst=2, now=100.0) == pytest.approx(1.0)
+
+    # Half a token later it is still too early
+    assert limiter.acquire("a", rate=1, burst=2, now=100.5) == pytest.approx(0.5)
+    assert limiter.acquire("a", rate=1, burst=2, now=101.0) == 0
+
+
+def test_keys_are_independent(limiter):
+    assert limiter.acquire("a", rate=1, burst=1, now=0.0) == 0
+    assert limiter.acquire("a", rate=1, burst=1, now=0.0) > 0
+    assert limiter.acquire("b", rate=1, burst=1, now=0.0) == 0
+
+
+def test_full_table_recycles_oldest_slot(limiter):
+    for index in range(100):
+        assert limiter.acquire(f"key{index}", rate=1, burst=1, now=float(index)) == 0
+    assert limiter.acquire("key99", rate=1, burst=1, now=99.0) > 0
+
+
+def test_state_is_shared_between_instances(limiter, tmp_path):
+    other = TokenBucketLimiter(tmp_path / "buckets", slots=16)
+    try:
+        assert limiter.acquire("a", rate=1, burst=1, now=0.0) == 0
+        assert other.acquire("a", rate=1, burst=1, now=0.0) > 0
+    finally:
+        other.close()
+
+
+def test_refuses_a_file_others_can_write(tmp_path):
+    path = tmp_path / "buckets"
+    path.touch()
+    path.chmod(0o666)
+    with pytest.raises(PermissionError):
+        TokenBucketLimiter(path, slots=16)
+
+
+def take_tokens(path, count, results):
+    limiter = TokenBucketLimiter(path, slots=16)
+    allowed = sum(
+        limiter.acquire("shared", rate=0.0001, burst=50) == 0 for _ in range(count)
+    )
+    limiter.close()
+    results.put(allowed)
+
+
+def test_state_is_shared_between_processes(tmp_path):
+    path = tmp_path / "buckets"
+    TokenBucketLimiter(path, slots=16).close()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=take_tokens, args=(path, 40, results))
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sum(results.get() for _ in workers) == 50
@@ -0,0 +1,124 @@
+"""Tests for the parallel, resumable rebuild of the base colors."""
+
+import random
+import sqlite3
+
+import pytest
+
+from anika_blue.app import average_hex_colors
+from anika_blue.rebuild import (
+    AGGREGATES_STAGE,
+    BASE_COLORS_STAGE,
+    CHECKPOINT_TABLE,
+    load_checkpoint,
+    read_chunk,
+    rebuild_base_colors,
+    save_checkpoint,
+)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(CHECKPOINT_TABLE)
+    conn.execute("""CREATE TABLE votes (id INTEGER PRIMARY KEY, user_id TEXT,
+                               hex_color TEXT, is_anika_blue INTEGER)""")
+    conn.execute("""CREATE TABLE user_base_colors (user_id TEXT PRIMARY KEY,
+                               base_color TEXT NOT NULL)""")
+    rng = random.Random(3)
+    conn.executemany(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+        [
+            (f"user{rng.randrange(40):02d}", f"#{rng.randrange(0x1000000):06x}", yes)
+            for yes in rng.choices((0, 1), k=1000)
+        ],
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def expected_base_colors(conn):
+    rows = conn.execute(
+        "SELECT user_id, hex_color FROM votes WHERE is_anika_blue = 1"
+    ).fetchall()
+    users = {}
+    for user_id, hex_color in rows:
+        users.setdefault(user_id, []).append(hex_color)
+    return {user: average_hex_colors(colors)[0] for user, colors in users.items()}
+
+
+def base_colors(conn):
+    return dict(conn.execute("SELECT user_id, base_color FROM user_base_colors"))
+
+
+def test_chunks_never_split_users(conn):
+    c = conn.cursor()
+    seen, after = [], None
+    while rows := read_chunk(c, after, 25):
+        users = [user_id for user_id, _ in rows]
+        assert not set(users) & set(seen)
+        seen.extend(dict.fromkeys(users))
+        after = rows[-1][0]
+    assert seen == sorted(expected_base_colors(conn))
+
+
+def test_chunk_of_one_large_user(conn):
+    rows = read_chunk(conn.cursor(), None, 3)
+    assert len({user_id for user_id, _ in rows}) == 1
+    assert len(rows) > 3
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rebuild_base_colors(conn, workers):
+    progress = []
+    checkpoint = rebuild_base_colors(
+        conn,
+        average_hex_colors,
+        workers=workers,
+        chunk_size=50,
+        progress=lambda checkpoint, total: progress.append((checkpoint, total)),
+    )
+
+    expected = expected_base_colors(conn)
+    assert base_colors(conn) == expected
+    assert checkpoint["stage"] == AGGREGATES_STAGE
+    assert checkpoint["users"] == len(expected)
+    votes = [checkpoint["votes"] for checkpoint, _ in progress]
+    assert votes == sorted(votes)
+    assert votes[-1] == progress[-1][1] == checkpoint["votes"]
+
+
+def test_rebuild_removes_base_colors_without_yes_votes(conn):
+    rebuild_base_colors(conn, average_hex_colors, chunk_size=50)
+    users = sorted(expected_base_colors(conn))
+    # Users without yes votes before, among and after the remaining ones
+    conn.execute("DELETE FROM votes WHERE user_id = ?", (users[5],))
+    conn.executemany(
+        "INSERT INTO user_base_colors (user_id, base_color) VALUES (?, '#0000ff')",
+        [("user",), (users[0] + "a",), (users[-1] + "a",)],
+    )
+    conn.commit()
+
+    rebuild_base_colors(conn, average_hex_colors, chunk_size=50)
+    assert base_colors(conn) == expected_base_colors(conn)
+    assert users[5] not in base_colors(conn)
+
+
+def test_resume_after_checkpoint(conn):
+    expected = expected_base_colors(conn)
+    done = sorted(expected)[:10]
+    save_checkpoint(conn.cursor(), BASE_COLORS_STAGE, done[-1], len(done), 0)
+    conn.commit()
+
+    checkpoint = rebuild_base_colors(conn, average_hex_colors, resume=True)
+    assert set(base_colors(conn)) == set(expected) - set(done)
+    assert checkpoint["users"] == len(expected)
+
+    # A finished base color stage is not repeated
+    conn.execute("DELETE FROM user_base_colors")
+    rebuild_base_colors(conn, average_hex_colors, resume=True)
+    assert base_colors(conn) == {}
+    rebuild_base_colors(conn, average_hex_colors)
+    assert base_colors(conn) == expected
+    assert load_checkpoint(conn.cursor())["stage"] == AGGREGATES_STAGE
@@ -0,0 +1,133 @@
+"""Tests for the read-only stats replica."""
+
+import sqlite3
+import time
+
+import pytest
+
+from anika_blue.coherence import GENERATION_TRIGGERS, GENERATIONS_TABLE
+from anika_blue.replica import read_synced_at, sync_replica
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "primary.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE votes (id INTEGER PRIMARY KEY, hex_color TEXT)")
+    conn.execute("INSERT INTO votes (hex_color) VALUES ('#0000ff')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count_votes(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_sync_copies_and_stamps(database, tmp_path):
+    replica = tmp_path / "replica.db"
+    before = time.time()
+    synced_at = sync_replica(database, replica)
+
+    assert before <= synced_at <= time.time()
+    assert read_synced_at(replica) == synced_at
+    assert count_votes(replica) == 1
+    assert not (tmp_path / "replica.db.partial").exists()
+
+
+@pytest.fixture
+def app_database(tmp_path):
+    """A primary with votes triggers bumping the cache generations"""
+    path = tmp_path / "app.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE votes (id INTEGER PRIMARY KEY, user_id TEXT,
+                                        hex_color TEXT, is_anika_blue INTEGER)""")
+    conn.execute("CREATE TABLE stats_snapshot (id INTEGER PRIMARY KEY, average TEXT)")
+    conn.execute(GENERATIONS_TABLE)
+    for trigger in GENERATION_TRIGGERS:
+        conn.execute(trigger)
+    conn.execute(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue)"
+        " VALUES ('a', '#0000ff', 1)"
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def execute(path, *statements):
+    """Write like the app does, on another connection"""
+    conn = sqlite3.connect(path)
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def test_sync_ships_new_rows_in_place(app_database, tmp_path):
+    replica = tmp_path / "replica.db"
+    sync_replica(app_database, replica)
+    inode = replica.stat().st_ino
+    reader = sqlite3.connect(replica)
+
+    execute(
+        app_database,
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue)"
+        " VALUES ('b', '#0000fe', 1)",
+        "INSERT INTO stats_snapshot (id, average) VALUES (1, '#0000fe')",
+    )
+    sync_replica(app_database, replica)
+
+    # Updated in place, open connections see the new rows
+    assert replica.stat().st_ino == inode
+    assert reader.execute("SELECT COUNT(*) FROM votes").fetchone()[0] == 2
+    assert reader.execute("SELECT average FROM stats_snapshot").fetchone() == (
+        "#0000fe",
+    )
+    # The replica's own triggers kept its generations in step
+    assert reader.execute(
+        "SELECT * FROM cache_generations ORDER BY scope"
+    ).fetchall() == [
+        ("global", 2),
+        ("user:a", 1),
+        ("user:b", 1),
+        ("votes", 2),
+    ]
+    reader.close()
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        "UPDATE votes SET is_anika_blue = 0 WHERE user_id = 'a'",
+        "DELETE FROM votes WHERE user_id = 'a'",
+        "ALTER TABLE votes ADD COLUMN weight INTEGER",
+    ],
+)
+def test_sync_copies_whole_after_other_changes(app_database, tmp_path, change):
+    replica = tmp_path / "replica.db"
+    sync_replica(app_database, replica)
+    inode = replica.stat().st_ino
+
+    execute(app_database, change)
+    sync_replica(app_database, replica)
+
+    assert replica.stat().st_ino != inode
+    query = "SELECT * FROM votes ORDER BY id"
+    conn = sqlite3.connect(app_database)
+    expected = conn.execute(query).fetchall()
+    conn.close()
+    conn = sqlite3.connect(replica)
+    assert conn.execute(query).fetchall() == expected
+    conn.close()
+
+
+def test_sync_skips_fresh_replica(database, tmp_path):
+    replica = tmp_path / "replica.db"
+    synced_at = sync_replica(database, replica)
+    assert sync_replica(database, replica, min_interval=60) is None
+    assert read_synced_at(replica) == synced_at
+    assert read_synced_at(tmp_path / "missing.db") is None
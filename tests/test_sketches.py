@@ -0,0 +1,129 @@
+"""Tests for the streaming vote sketches."""
+
+import random
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from anika_blue.sketches import (
+    SKETCH_TABLE,
+    HyperLogLog,
+    SpaceSaving,
+    flush_sketch,
+    load_sketch,
+    sketch_version,
+)
+
+CAPACITY = 50
+
+
+def zipf_stream(seed, size=20_000, distinct=5_000):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return [f"#{item:06x}" for item in rng.choices(range(distinct), weights, k=size)]
+
+
+def assert_bounds(sketch, exact, total):
+    bound = total / sketch.capacity
+    for item, count, error in sketch.top(len(sketch)):
+        assert count - error <= exact[item] <= count
+        assert error <= bound
+    for item, count in exact.items():
+        if count > bound:
+            assert item in sketch.counters
+
+
+def test_space_saving_bounds():
+    stream = zipf_stream(1)
+    sketch = SpaceSaving(CAPACITY)
+    for item in stream:
+        sketch.add(item)
+
+    exact = Counter(stream)
+    assert len(sketch) == CAPACITY
+    assert_bounds(sketch, exact, len(stream))
+    top = [item for item, _, _ in sketch.top(5)]
+    assert top == [item for item, _ in exact.most_common(5)]
+
+
+def test_merged_sketches_keep_bounds():
+    stream = zipf_stream(2)
+    parts = [stream[i::4] for i in range(4)]
+    merged = SpaceSaving(CAPACITY)
+    for part in parts:
+        sketch = SpaceSaving(CAPACITY)
+        for item in part:
+            sketch.add(item)
+        merged.merge(sketch)
+
+    assert_bounds(merged, Counter(stream), len(stream))
+
+
+def test_serialization_roundtrip():
+    sketch = SpaceSaving(3)
+    for item in "aaabbcd":
+        sketch.add(item)
+    restored = SpaceSaving.from_bytes(sketch.to_bytes())
+    assert restored.top(3) == sketch.top(3)
+    restored.add("e")
+    assert len(restored) == 3
+
+
+def test_flush_sketch_merges_into_stored_state():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(SKETCH_TABLE)
+    for items in ("aab", "abc"):
+        delta = SpaceSaving(CAPACITY)
+        for item in items:
+            delta.add(item)
+        flush_sketch(conn, "top", delta)
+
+    stored, version = load_sketch(conn.cursor(), "top", SpaceSaving)
+    assert version == sketch_version(conn.cursor(), "top") == 2
+    assert stored.top(3) == [("a", 3, 0), ("b", 2, 0), ("c", 1, 0)]
+    assert load_sketch(conn.cursor(), "missing", SpaceSaving) == (None, 0)
+
+
+@pytest.mark.parametrize("capacity", [1, 10])
+def test_small_capacities(capacity):
+    sketch = SpaceSaving(capacity)
+    for item in zipf_stream(3, size=1000, distinct=100):
+        sketch.add(item)
+    assert len(sketch) == capacity
+
+
+def test_hyperloglog_error_bound():
+    sketch = HyperLogLog(12)
+    for i in range(100_000):
+        sketch.add(f"user{i}")
+    # Three standard errors of 1.04 / sqrt(4096)
+    assert sketch.estimate() == pytest.approx(100_000, rel=3 * 0.01625)
+
+
+def test_hyperloglog_small_counts_and_duplicates():
+    sketch = HyperLogLog(12)
+    assert not sketch
+    assert sketch.estimate() == 0
+    for _ in range(3):
+        for i in range(50):
+            sketch.add(f"#0000{i:02x}")
+    assert sketch
+    assert round(sketch.estimate()) == 50
+
+
+def test_hyperloglog_merge_is_union():
+    shards = [HyperLogLog(12) for _ in range(3)]
+    union = HyperLogLog(12)
+    for i in range(30_000):
+        item = f"user{i % 20_000}"
+        shards[i % 3].add(item)
+        union.add(item)
+
+    merged = HyperLogLog.from_bytes(shards[0].to_bytes())
+    for shard in shards[1:]:
+        merged.merge(shard)
+    assert merged.registers == union.registers
+
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(10))
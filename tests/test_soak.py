@@ -0,0 +1,54 @@
+"""Tests for the soak test driver."""
+
+from importlib import import_module
+
+import pytest
+
+from anika_blue.soak import SLOPE_SERIES, check_slopes, run_soak, slope
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    app_module = import_module("anika_blue.app")
+    monkeypatch.setattr(app_module, "DATABASE", str(tmp_path / "soak.db"))
+    monkeypatch.setitem(app_module.app.config, "TESTING", True)
+    monkeypatch.setitem(app_module.app.config, "RATE_LIMIT_ENABLED", False)
+    app_module.init_db()
+    return app_module
+
+
+def test_slope():
+    assert slope([(0, 1), (1, 3), (2, 5)]) == pytest.approx(2)
+    assert slope([(0, 7), (1, 7), (2, None)]) == 0
+    assert slope([(0, 1)]) is None
+
+
+def test_check_slopes():
+    result = {"slopes": {"rss_bytes": 5000, "p99_ms": None}, "errors": 0}
+    failures = check_slopes(result, {"rss_bytes": 4096, "p99_ms": 0.01})
+    assert len(failures) == 1
+    assert failures[0].startswith("rss_bytes grows")
+    assert check_slopes(result, {"rss_bytes": None}) == []
+    assert check_slopes(dict(result, errors=2), {}) == [
+        "2 requests failed with a server error"
+    ]
+
+
+def test_run_soak(app_module):
+    result = run_soak(
+        app_module.app,
+        app_module.DATABASE,
+        app_module.generate_blue_shade,
+        requests=300,
+        sample_every=100,
+        warmup=100,
+        clients=3,
+        top_allocators=3,
+    )
+
+    assert result["errors"] == 0
+    assert [sample["requests"] for sample in result["samples"]] == [100, 200, 300]
+    assert set(result["slopes"]) == set(SLOPE_SERIES)
+    for sample in result["samples"]:
+        assert len(sample["top_allocators"]) <= 3
+        assert sample["p99_ms"] >= sample["p50_ms"]
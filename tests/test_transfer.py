@@ -0,0 +1,125 @@
+"""Tests for streaming export and bulk import."""
+
+import io
+import json
+import sqlite3
+
+import pytest
+
+from anika_blue import transfer
+from anika_blue.transfer import export_table, import_records, read_records
+
+SCHEMA = """
+CREATE TABLE votes
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     user_id TEXT NOT NULL,
+     hex_color TEXT NOT NULL,
+     is_anika_blue INTEGER NOT NULL,
+     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+"""
+
+
+@pytest.fixture
+def conn():
+    connection = sqlite3.connect(":memory:")
+    connection.executescript(SCHEMA)
+    connection.executemany(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+        [(f"user{i % 7}", f"#0000{i % 256:02x}", i % 2) for i in range(25)],
+    )
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(transfer, "FETCH_SIZE", 4)
+    monkeypatch.setattr(transfer, "IMPORT_BATCH_SIZE", 3)
+    monkeypatch.setattr(transfer, "IMPORT_TRANSACTION_SIZE", 6)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_round_trip(conn, small_chunks, fmt):
+    chunks = list(export_table(conn, "votes", fmt))
+    assert len(chunks) > 1
+
+    target = sqlite3.connect(":memory:")
+    target.executescript(SCHEMA)
+    records = read_records(io.StringIO("".join(chunks)), fmt)
+    assert import_records(target, "votes", records) == 25
+
+    query = "SELECT * FROM votes ORDER BY id"
+    assert target.execute(query).fetchall() == conn.execute(query).fetchall()
+    target.close()
+
+
+def test_export_ndjson_lines(conn):
+    lines = "".join(export_table(conn, "votes", "ndjson")).splitlines()
+    assert len(lines) == 25
+    first = json.loads(lines[0])
+    assert first["id"] == 1
+    assert first["user_id"] == "user0"
+    assert first["is_anika_blue"] == 0
+
+
+def test_export_csv_header(conn):
+    output = "".join(export_table(conn, "votes", "csv"))
+    assert output.splitlines()[0] == "id,user_id,hex_color,is_anika_blue,timestamp"
+
+
+def test_import_ignores_unknown_columns(conn):
+    records = [{"user_id": "new", "hex_color": "#123456", "is_anika_blue": 1, "x": 1}]
+    assert import_records(conn, "votes", records) == 1
+    row = conn.execute("SELECT user_id FROM votes WHERE id = 26").fetchone()
+    assert row == ("new",)
+
+
+def test_import_into_non_empty_table_keeps_existing_rows(conn):
+    records = [
+        {"id": 1, "user_id": "other", "hex_color": "#123456", "is_anika_blue": 1},
+        {"id": 2, "user_id": "other", "hex_color": "#654321", "is_anika_blue": 0},
+    ]
+    assert import_records(conn, "votes", records) == 2
+    assert conn.execute("SELECT user_id FROM votes WHERE id = 1").fetchone() == (
+        "user0",
+    )
+    rows = conn.execute("SELECT id FROM votes WHERE user_id = 'other'").fetchall()
+    assert rows == [(26,), (27,)]
+
+    assert import_records(conn, "votes", records, replace=True) == 2
+    assert conn.execute("SELECT user_id FROM votes WHERE id = 1").fetchone() == (
+        "other",
+    )
+
+
+def test_export_does_not_block_writers(tmp_path, small_chunks):
+    path = tmp_path / "export.db"
+    reader = sqlite3.connect(path)
+    reader.executescript(SCHEMA)
+    reader.executemany(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES (?, ?, ?)",
+        [("user", "#0000ff", 1)] * 20,
+    )
+    reader.commit()
+
+    chunks = export_table(reader, "votes", "ndjson")
+    next(chunks)
+    # A client stalled mid-download must not hold the database
+    writer = sqlite3.connect(path, timeout=0)
+    writer.execute(
+        "INSERT INTO votes (user_id, hex_color, is_anika_blue) VALUES ('w', '#fff', 0)"
+    )
+    writer.commit()
+    writer.close()
+
+    assert len("".join(chunks).splitlines()) == 21 - 4
+    reader.close()
+
+
+def test_import_empty_and_invalid(conn):
+    assert import_records(conn, "votes", []) == 0
+    with pytest.raises(ValueError):
+        import_records(conn, "users", [{"user_id": "x"}])
+    with pytest.raises(ValueError):
+        list(export_table(conn, "votes", "xml"))